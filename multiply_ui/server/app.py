@@ -1,7 +1,8 @@
 import tornado.web
 
 from .handlers import ClearHandler, GetParametersHandler, GetInputsHandler, GetJobHandler, ExecuteJobsHandler, \
-    CancelHandler, PostEarthDataAuthHandler, PostMundiAuthHandler, VisualizeHandler
+    CancelHandler, GetJobsHandler, GetTaskLogsHandler, JobEventsHandler, ListJobsHandler, PostEarthDataAuthHandler, \
+    PostMundiAuthHandler, VisualizeHandler
 
 
 def new_application():
@@ -9,8 +10,12 @@ def new_application():
         (r"/multiply/api/auth/earthdata", PostEarthDataAuthHandler),
         (r"/multiply/api/auth/mundi", PostMundiAuthHandler),
         (url_pattern(r"/multiply/api/clear/{{clear_type}}"), ClearHandler),
+        (r"/multiply/api/jobs", GetJobsHandler),
         (r"/multiply/api/jobs/execute", ExecuteJobsHandler),
         (url_pattern(r"/multiply/api/jobs/get/{{job_id}}"), GetJobHandler),
+        (r"/multiply/api/jobs/list", ListJobsHandler),
+        (r"/multiply/api/jobs/events", JobEventsHandler),
+        (url_pattern(r"/multiply/api/jobs/{{job_id}}/tasks/{{task_id}}/logs"), GetTaskLogsHandler),
         (url_pattern(r"/multiply/api/jobs/cancel/{{job_id}}"), CancelHandler),
         (url_pattern(r"/multiply/api/jobs/visualize/{{job_id}}"), VisualizeHandler),
         (r"/multiply/api/processing/inputs", GetInputsHandler),
@@ -0,0 +1,69 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+
+class QueryCache:
+    """
+    A thread-safe cache for the results of expensive queries. Entries expire *ttl* seconds after they have been
+    computed, and the least recently used entries are evicted once there are more than *max_size* of them.
+    Concurrent requests for the same missing entry are collapsed into a single computation whose result is
+    shared by all requesting threads. Failed computations are not cached.
+
+    :param max_size: The maximum number of entries.
+    :param ttl: The time to live of an entry in seconds.
+    :param clock: A function returning the current time in seconds.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 600, clock: Callable[[], float] = time.monotonic):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for *key*. If there is none or it has expired, it is computed by calling *compute*,
+        unless another thread is already computing it, in which case that result is waited for.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expiry = entry
+                if self._clock() < expiry:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+            future = self._in_flight.get(key)
+            computing = future is None
+            if computing:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        if not computing:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._entries[key] = (value, self._clock() + self._ttl)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
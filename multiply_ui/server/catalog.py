@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shapely.geometry import box
+from shapely.ops import unary_union
+from shapely.wkt import loads
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    input_type TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    footprint TEXT,
+    start REAL NOT NULL,
+    stop REAL NOT NULL,
+    UNIQUE (input_type, identifier)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS product_index USING rtree (id, min_x, max_x, min_y, max_y, min_t, max_t);
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    input_type TEXT NOT NULL,
+    roi TEXT NOT NULL,
+    start REAL NOT NULL,
+    stop REAL NOT NULL,
+    searched REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_input_type ON searches (input_type, searched);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING rtree (id, min_x, max_x, min_y, max_y, min_t, max_t);
+"""
+
+# footprint assumed for products that come without one
+_GLOBAL_FOOTPRINT = box(-180, -90, 180, 90)
+
+# identifier, footprint as WKT or None, start and stop time in seconds since the epoch
+Product = Tuple[str, Optional[str], float, float]
+
+
+class InputCatalog:
+    """
+    A local catalog of the footprints and acquisition times of the products found by input queries.
+    Footprints and time ranges of both products and the searches that found them are indexed with SQLite R-trees.
+    A query that is covered by earlier searches for the same input type which are not older than the freshness
+    window of that type is answered from the catalog.
+
+    The R-trees only serve as coarse filters, exact intersections are computed from the stored geometries.
+
+    :param path: Path to the database file. Defaults to an in-memory database.
+    :param freshness: Maps input types to the number of seconds for which searches for them are considered complete.
+    :param default_freshness: Freshness window of the input types not contained in *freshness*.
+    :param clock: A function returning the current time in seconds since the epoch.
+    """
+
+    def __init__(self, path: str = ':memory:', freshness: Optional[Dict[str, float]] = None,
+                 default_freshness: float = 86400, clock: Callable[[], float] = time.time):
+        self._freshness = dict(freshness) if freshness is not None else {}
+        self._default_freshness = default_freshness
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            if path != ':memory:':
+                self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def add_search(self, input_type: str, roi_wkt: str, start: float, stop: float, products: List[Product]):
+        """
+        Records that a search for products of *input_type* within *roi_wkt* and the time range from *start* to *stop*
+        has found *products*.
+        """
+        roi_bounds = loads(roi_wkt).bounds
+        with self._lock, self._connection:
+            cursor = self._connection.execute('INSERT INTO searches (input_type, roi, start, stop, searched) '
+                                              'VALUES (?, ?, ?, ?, ?)',
+                                              (input_type, roi_wkt, start, stop, self._clock()))
+            self._connection.execute('INSERT INTO search_index VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     (cursor.lastrowid, roi_bounds[0], roi_bounds[2], roi_bounds[1], roi_bounds[3],
+                                      start, stop))
+            for identifier, footprint, product_start, product_stop in products:
+                row = self._connection.execute('SELECT id FROM products WHERE input_type = ? AND identifier = ?',
+                                               (input_type, identifier)).fetchone()
+                if row is not None:
+                    continue
+                footprint_bounds = (loads(footprint) if footprint else _GLOBAL_FOOTPRINT).bounds
+                cursor = self._connection.execute('INSERT INTO products (input_type, identifier, footprint, start, '
+                                                  'stop) VALUES (?, ?, ?, ?, ?)',
+                                                  (input_type, identifier, footprint, product_start, product_stop))
+                self._connection.execute('INSERT INTO product_index VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                         (cursor.lastrowid, footprint_bounds[0], footprint_bounds[2],
+                                          footprint_bounds[1], footprint_bounds[3], product_start, product_stop))
+
+    def query(self, input_type: str, roi_wkt: str, start: float, stop: float) -> Optional[List[str]]:
+        """
+        Returns the identifiers of the products of *input_type* that intersect *roi_wkt* and the time range from
+        *start* to *stop*, or None if the catalog does not cover this query.
+        """
+        roi = loads(roi_wkt)
+        min_x, min_y, max_x, max_y = roi.bounds
+        searched_after = self._clock() - self._freshness.get(input_type, self._default_freshness)
+        with self._lock:
+            search_rows = self._connection.execute(
+                'SELECT searches.roi FROM search_index JOIN searches ON searches.id = search_index.id '
+                'WHERE search_index.max_x >= ? AND search_index.min_x <= ? '
+                'AND search_index.max_y >= ? AND search_index.min_y <= ? '
+                'AND search_index.min_t <= ? AND search_index.max_t >= ? '
+                'AND searches.input_type = ? AND searches.start <= ? AND searches.stop >= ? AND searches.searched >= ?',
+                (min_x, max_x, min_y, max_y, start, stop, input_type, start, stop, searched_after)).fetchall()
+            if len(search_rows) == 0 or not unary_union([loads(row[0]) for row in search_rows]).covers(roi):
+                return None
+            product_rows = self._connection.execute(
+                'SELECT products.identifier, products.footprint FROM product_index '
+                'JOIN products ON products.id = product_index.id '
+                'WHERE product_index.max_x >= ? AND product_index.min_x <= ? '
+                'AND product_index.max_y >= ? AND product_index.min_y <= ? '
+                'AND product_index.max_t >= ? AND product_index.min_t <= ? '
+                'AND products.input_type = ? AND products.stop >= ? AND products.start <= ? '
+                'ORDER BY products.start, products.identifier',
+                (min_x, max_x, min_y, max_y, start, stop, input_type, start, stop)).fetchall()
+        return [identifier for identifier, footprint in product_rows
+                if footprint is None or loads(footprint).intersects(roi)]
+
+    def clear(self):
+        with self._lock, self._connection:
+            for table in ['products', 'product_index', 'searches', 'search_index']:
+                self._connection.execute(f'DELETE FROM {table}')
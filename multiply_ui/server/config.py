@@ -4,5 +4,41 @@ ADDRESS = '0.0.0.0'
 PORT = 9090
 # noinspection SpellCheckingInspection
 SUPPORTED_VARIABLES = ['lai', 'cab', 'cb', 'car', 'cw', 'cdm', 'n', 'ala', 'h', 'bsoil', 'psoil']
+# Number of worker threads per executor that runs blocking controller calls off the IOLoop.
+# Status requests get their own pool so that they are answered while heavy requests are running.
+EXECUTOR_POOL_SIZES = {
+    'auth': 1,
+    'clear': 1,
+    'execute': 2,
+    'inputs': 4,
+    'logs': 2,
+    'parameters': 1,
+    'queries': 4,
+    'status': 4,
+    'visualize': 1,
+}
 
 LOGGER = logging.getLogger('multiply_ui')
+# Number of most recent log lines per task that are included in job status responses
+STATUS_LOG_LINES = 10
+# Default and maximum number of log lines returned by a single request for the log of a task
+LOG_PAGE_SIZE = 1000
+MAX_LOG_PAGE_SIZE = 10000
+# Maximum number of input queries whose results are cached and seconds after which a cached result expires
+INPUT_QUERY_CACHE_SIZE = 256
+INPUT_QUERY_CACHE_TTL = 600
+# Seconds for which a search recorded in the local input catalog is considered to cover all products of its type
+INPUT_CATALOG_FRESHNESS = 86400
+# Maximum number of workflow steps running at the same time, summed over all jobs. None means the number of cores.
+MAX_CONCURRENT_STEPS = None
+# Number of log lines of each task kept in memory, all lines remain available in the task's trace file
+TASK_LOG_LINES = 1000
+# Step types whose scripts are forked from a Python process that has imported the modules below already, instead of
+# being started in a new interpreter each. Empty means that all steps start a new interpreter.
+WARM_WORKER_STEP_TYPES = []
+WARM_WORKER_PRELOAD = ['yaml', 'numpy', 'osgeo.gdal', 'multiply_core', 'multiply_data_access', 'multiply_prior_engine',
+                       'multiply_inference_engine']
+# Whether linear chains of workflow steps are run as single steps, which saves starting a process for each step
+FUSE_STEPS = False
+# Maximum size in GB of the store of step results that are reused across jobs. 0 disables reusing step results.
+STEP_CACHE_SIZE = 0
@@ -1,12 +1,14 @@
+import concurrent.futures
 import glob
 import inspect
 import logging
 import os
 import shutil
 import sys
+import threading
 import yaml
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import multiply_data_access.data_access_component
 from multiply_core.models import get_forward_models
@@ -16,7 +18,14 @@ from multiply_post_processing import get_available_indicators, get_post_processo
 from multiply_prior_engine.vegetation_prior_creator import SUPPORTED_VARIABLES as POSSIBLE_USER_PRIORS
 from vm_support import set_earth_data_authentication, set_mundi_authentication
 
+from .cache import QueryCache
+from .catalog import InputCatalog
+from .config import EXECUTOR_POOL_SIZES, INPUT_CATALOG_FRESHNESS, INPUT_QUERY_CACHE_SIZE, INPUT_QUERY_CACHE_TTL, \
+    FUSE_STEPS, MAX_CONCURRENT_STEPS, STEP_CACHE_SIZE, TASK_LOG_LINES, WARM_WORKER_PRELOAD, WARM_WORKER_STEP_TYPES
+from .events import JobEventHub
+from .jobstore import FINAL_STATUSES, JobStore
 from .model import Job
+from .versions import JobVersions
 
 
 logging.getLogger().setLevel(logging.INFO)
@@ -29,10 +38,30 @@ import share.bin.pmserver as pmserver
 
 MULTIPLY_DIR_NAME = '.multiply'
 MULTIPLY_CONFIG_FILE_NAME = 'multiply_config.yaml'
+JOB_STORE_FILE_NAME = 'jobs.sqlite'
+INPUT_CATALOG_FILE_NAME = 'input_catalog.sqlite'
+STEP_MEMORY_HISTORY_FILE_NAME = 'step_memory.json'
+STEP_CACHE_DIR_NAME = 'step_cache'
 MULTIPLY_PLATFORM_PYTHON_CONFIG_KEY = 'platform-env'
 WORKING_DIR_CONFIG_KEY = 'working_dir'
 WORKFLOWS_DIRS_CONFIG_KEY = 'workflows_dirs'
 SCRIPTS_DIRS_CONFIG_KEY = 'scripts_dirs'
+EXECUTOR_POOL_SIZES_CONFIG_KEY = 'executor_pool_sizes'
+JOB_STORE_CONFIG_KEY = 'job_store'
+INPUT_QUERY_CACHE_SIZE_CONFIG_KEY = 'input_query_cache_size'
+INPUT_QUERY_CACHE_TTL_CONFIG_KEY = 'input_query_cache_ttl'
+INPUT_CATALOG_CONFIG_KEY = 'input_catalog'
+INPUT_CATALOG_FRESHNESS_CONFIG_KEY = 'input_catalog_freshness'
+MAX_CONCURRENT_STEPS_CONFIG_KEY = 'max_concurrent_steps'
+STEP_TYPE_LIMITS_CONFIG_KEY = 'step_type_limits'
+MEMORY_BUDGET_CONFIG_KEY = 'memory_budget'
+STEP_MEMORY_HISTORY_CONFIG_KEY = 'step_memory_history'
+TASK_LOG_LINES_CONFIG_KEY = 'task_log_lines'
+WARM_WORKER_STEP_TYPES_CONFIG_KEY = 'warm_worker_step_types'
+WARM_WORKER_PRELOAD_CONFIG_KEY = 'warm_worker_preload'
+FUSE_STEPS_CONFIG_KEY = 'fuse_steps'
+STEP_CACHE_CONFIG_KEY = 'step_cache'
+STEP_CACHE_SIZE_CONFIG_KEY = 'step_cache_size'
 
 
 def _get_config() -> dict:
@@ -53,15 +82,68 @@ def _get_config() -> dict:
 
 
 class ServiceContext:
+    """
+    :param job_store: The path of the job store database, overriding the configured one. Pass ':memory:' for a store
+        that is not kept beyond the lifetime of the context, as in tests.
+    :param input_catalog: The path of the input catalog database, overriding the configured one. Pass ':memory:'
+        for a catalog that is not kept beyond the lifetime of the context, as in tests.
+    """
 
-    def __init__(self):
+    def __init__(self, job_store: Optional[str] = None, input_catalog: Optional[str] = None):
         self._jobs = {}
+        self._job_name_counters = {}
+        self._jobs_lock = threading.Lock()
+        self.job_versions = JobVersions()
+        self.job_events = JobEventHub()
+        self.parameters_response = None
         self.data_access_component = multiply_data_access.data_access_component.DataAccessComponent()
         self.pm_server = pmserver.PMServer()
         self._python_dist = sys.executable
+        self._executor_pool_sizes = dict(EXECUTOR_POOL_SIZES)
+        self._executors = {}
+        self._executors_lock = threading.Lock()
         config = _get_config()
+        if EXECUTOR_POOL_SIZES_CONFIG_KEY in config.keys():
+            self._executor_pool_sizes.update(config[EXECUTOR_POOL_SIZES_CONFIG_KEY])
+        self.input_query_cache = QueryCache(max_size=config.get(INPUT_QUERY_CACHE_SIZE_CONFIG_KEY,
+                                                                INPUT_QUERY_CACHE_SIZE),
+                                            ttl=config.get(INPUT_QUERY_CACHE_TTL_CONFIG_KEY, INPUT_QUERY_CACHE_TTL))
+        input_catalog_path = f'{Path.home()}/{MULTIPLY_DIR_NAME}/{INPUT_CATALOG_FILE_NAME}'
+        if input_catalog is not None:
+            input_catalog_path = input_catalog
+        elif INPUT_CATALOG_CONFIG_KEY in config.keys():
+            input_catalog_path = config[INPUT_CATALOG_CONFIG_KEY]
+        self.input_catalog = InputCatalog(input_catalog_path, freshness=config.get(INPUT_CATALOG_FRESHNESS_CONFIG_KEY),
+                                          default_freshness=INPUT_CATALOG_FRESHNESS)
+        self.step_resources = {
+            'max_concurrent_steps': config.get(MAX_CONCURRENT_STEPS_CONFIG_KEY, MAX_CONCURRENT_STEPS),
+            'step_type_limits': config.get(STEP_TYPE_LIMITS_CONFIG_KEY, {}),
+            'memory_budget': config.get(MEMORY_BUDGET_CONFIG_KEY),
+            'memory_history': config.get(STEP_MEMORY_HISTORY_CONFIG_KEY,
+                                         f'{Path.home()}/{MULTIPLY_DIR_NAME}/{STEP_MEMORY_HISTORY_FILE_NAME}')
+        }
+        self.task_log_lines = config.get(TASK_LOG_LINES_CONFIG_KEY, TASK_LOG_LINES)
+        self.fuse_steps = config.get(FUSE_STEPS_CONFIG_KEY, FUSE_STEPS)
+        self.step_cache = {
+            'dir': config.get(STEP_CACHE_CONFIG_KEY, f'{Path.home()}/{MULTIPLY_DIR_NAME}/{STEP_CACHE_DIR_NAME}'),
+            'max_size': int(config.get(STEP_CACHE_SIZE_CONFIG_KEY, STEP_CACHE_SIZE) * 1024 ** 3)
+        }
+        job_store_path = f'{Path.home()}/{MULTIPLY_DIR_NAME}/{JOB_STORE_FILE_NAME}'
+        if job_store is not None:
+            job_store_path = job_store
+        elif JOB_STORE_CONFIG_KEY in config.keys():
+            job_store_path = config[JOB_STORE_CONFIG_KEY]
+        self.job_store = JobStore(job_store_path)
+        interrupted_job_ids = self.job_store.mark_interrupted()
+        if len(interrupted_job_ids) > 0:
+            logging.info(f'jobs interrupted by previous shutdown: {", ".join(interrupted_job_ids)}')
         if MULTIPLY_PLATFORM_PYTHON_CONFIG_KEY in config.keys():
             self._python_dist = config[MULTIPLY_PLATFORM_PYTHON_CONFIG_KEY]
+        self.warm_workers = {
+            'python': self._python_dist,
+            'step_types': config.get(WARM_WORKER_STEP_TYPES_CONFIG_KEY, WARM_WORKER_STEP_TYPES),
+            'preload': config.get(WARM_WORKER_PRELOAD_CONFIG_KEY, WARM_WORKER_PRELOAD)
+        }
         if WORKING_DIR_CONFIG_KEY in config.keys():
             self.set_working_dir(config[WORKING_DIR_CONFIG_KEY])
         if WORKFLOWS_DIRS_CONFIG_KEY in config.keys():
@@ -79,6 +161,30 @@ class ServiceContext:
         path = os.environ['PATH']
         os.environ['PATH'] = f'{path_to_bin_dir}:{path}'
 
+    def get_executor(self, name: str) -> concurrent.futures.Executor:
+        """
+        Returns the executor that runs blocking controller calls of the endpoint group *name*.
+        Executors are created on first use, unknown groups get a single worker.
+        """
+        with self._executors_lock:
+            if name not in self._executors:
+                max_workers = self._executor_pool_sizes.get(name, 1)
+                self._executors[name] = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                                              thread_name_prefix=f'mui-{name}')
+            return self._executors[name]
+
+    def shut_down(self):
+        with self._executors_lock:
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            self._executors.clear()
+        self.job_store.close()
+        self.input_catalog.close()
+
+    def invalidate_parameters(self):
+        """Discards the cached processing parameters, e.g., after plugins have changed."""
+        self.parameters_response = None
+
     @staticmethod
     def get_available_forward_models() -> List[dict]:
         dict_list = []
@@ -194,14 +300,73 @@ class ServiceContext:
             write_file.close()
         os.environ['PATH'] += f':{scripts_path}'
 
+    def new_job_id(self, name: str) -> str:
+        """
+        Reserves and returns a job id for a request with the given *name*. This is *name* itself if it is not taken,
+        otherwise the first free id of the form ``name_N``. Ids of jobs from previous runs of the server are taken.
+        """
+        with self._jobs_lock:
+            id = name
+            if self._is_job_id_taken(id):
+                index = self._job_name_counters.get(name, 0)
+                id = f'{name}_{index}'
+                while self._is_job_id_taken(id):
+                    index += 1
+                    id = f'{name}_{index}'
+                self._job_name_counters[name] = index + 1
+            # reserve id until the job is registered
+            self._jobs[id] = None
+            return id
+
+    def reserve_job_id_to_resume(self, id: str, name: str):
+        """
+        Reserves the id of a finished job so that the job can be run again. Raises a ValueError if there is no such
+        job, if it has not finished or if it has been submitted under another *name*.
+
+        :return: The finished job, or None if it is from a previous run of the server. Pass it to
+            :meth:`release_job_id` if the job cannot be run again.
+        """
+        with self._jobs_lock:
+            stored_job = self.job_store.get_job(id)
+            if stored_job is None:
+                raise ValueError(f'Cannot resume unknown job "{id}"')
+            if self._jobs.get(id, False) is None or stored_job['status'] not in FINAL_STATUSES:
+                raise ValueError(f'Cannot resume job "{id}" before it has finished')
+            if stored_job['name'] != name:
+                raise ValueError(f'Cannot resume job "{id}" with a request named other than "{stored_job["name"]}"')
+            previous_job = self._jobs.get(id)
+            self._jobs[id] = None
+            return previous_job
+
+    def _is_job_id_taken(self, id: str) -> bool:
+        return id in self._jobs or self.job_store.has_job(id)
+
+    def register_job(self, id: str, job):
+        with self._jobs_lock:
+            self._jobs[id] = job
+
+    def release_job_id(self, id: str, previous_job=None):
+        """
+        Releases an id reserved for a job that could not be submitted, giving it back to *previous_job* if the id
+        has been reserved to resume that job.
+        """
+        with self._jobs_lock:
+            if previous_job is None:
+                self._jobs.pop(id, None)
+            else:
+                self._jobs[id] = previous_job
+
     def get_job(self, id: str):
-        for job in self.pm_server.queue:
-            if job.request['requestId'] == id:
-                return job
+        return self._jobs.get(id)
 
     def clear(self, type: str):
         if type == 'cache':
             self.data_access_component.clear_caches()
+            self.input_query_cache.clear()
+            self.input_catalog.clear()
+            self.invalidate_parameters()
+        elif type == 'parameters':
+            self.invalidate_parameters()
         elif type == 'working':
             working_dirs = glob.glob('/data/working_dirs/*')
             for working_dir in working_dirs:
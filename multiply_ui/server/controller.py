@@ -1,4 +1,7 @@
+import calendar
 import datetime
+import gzip
+import hashlib
 import json
 import logging
 import pkg_resources
@@ -7,13 +10,14 @@ import shutil
 import subprocess
 import urllib.request
 import webbrowser
+from .config import STATUS_LOG_LINES
 from .context import ServiceContext #import to ensure calvalus-instances is added to system path
 from multiply_core.util import get_num_tiles, get_time_from_string
 # check out with git clone -b share https://github.com/bcdev/calvalus-instances
 # and add the calvalus-instances as content root to project structure
 from share.lib.pmonitor import PMonitor
 from shapely.wkt import loads
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -34,45 +38,153 @@ def get_parameters(ctx):
     return parameters
 
 
+def get_parameters_response(ctx) -> Dict:
+    """
+    Returns the processing parameters as encoded JSON ``body``, as gzip-compressed ``gzip_body`` and the strong
+    entity tags of both. As the parameters only change with the installed plugins, they are computed once
+    and kept until ``ctx.invalidate_parameters()`` is called.
+    """
+    response = ctx.parameters_response
+    if response is None:
+        body = json.dumps(get_parameters(ctx)).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()
+        response = {
+            'body': body,
+            'etag': f'"{digest}"',
+            'gzip_body': gzip.compress(body),
+            'gzip_etag': f'"{digest}-gzip"'
+        }
+        ctx.parameters_response = response
+    return response
+
+
 def get_inputs(ctx, parameters):
     time_range = parameters["timeRange"]
     region_wkt = parameters["roi"]
     input_types = parameters["inputTypes"]
+    # the queries for the input types are independent of each other, so they are run concurrently
+    executor = ctx.get_executor('queries')
+    futures = {input_type: executor.submit(_query_input_identifiers, ctx, region_wkt, time_range[0], time_range[1],
+                                           input_type)
+               for input_type in input_types}
     parameters["inputIdentifiers"] = {}
     for input_type in input_types:
-        data_set_meta_infos = ctx.data_access_component.query(region_wkt, time_range[0], time_range[1], input_type)
-        parameters["inputIdentifiers"][input_type] = [entry._identifier for entry in data_set_meta_infos]
+        parameters["inputIdentifiers"][input_type] = futures[input_type].result()
     return parameters
 
 
+def _query_input_identifiers(ctx, region_wkt: str, start: str, stop: str, input_type: str) -> List[str]:
+    def _query() -> List[str]:
+        start_seconds = _to_seconds(start)
+        stop_seconds = _to_seconds(stop)
+        identifiers = ctx.input_catalog.query(input_type, region_wkt, start_seconds, stop_seconds)
+        if identifiers is not None:
+            return identifiers
+        data_set_meta_infos = ctx.data_access_component.query(region_wkt, start, stop, input_type)
+        # products without a known footprint or acquisition time are assumed to cover the whole search
+        products = [(entry._identifier, entry.coordinates,
+                     _to_seconds(entry.start_time) if entry.start_time else start_seconds,
+                     _to_seconds(entry.end_time) if entry.end_time else stop_seconds)
+                    for entry in data_set_meta_infos]
+        ctx.input_catalog.add_search(input_type, region_wkt, start_seconds, stop_seconds, products)
+        return [entry._identifier for entry in data_set_meta_infos]
+    # normalise the key so that differently formatted but equal requests share a cache entry
+    key = (loads(region_wkt).wkt, get_time_from_string(start).isoformat(), get_time_from_string(stop).isoformat(),
+           input_type)
+    return ctx.input_query_cache.get(key, _query)
+
+
+def _to_seconds(time_string: str) -> float:
+    return calendar.timegm(get_time_from_string(time_string).timetuple())
+
+
 def submit_request(ctx, request) -> Dict:
+    """
+    Submits a processing request as a new job. If the request names a finished job in its ``resume`` field,
+    that job is run again in its working directory instead, skipping the steps whose outputs are still there.
+    """
     mangled_name = request['name'].replace(' ', '_')
-    id = mangled_name
-    job = ctx.get_job(mangled_name)
-    index = 0
-    while job is not None:
-        id = f'{mangled_name}_{index}'
-        job = ctx.get_job(id)
-        index += 1
+    resume = request.get('resume')
+    if resume:
+        id = resume
+        previous_job = ctx.reserve_job_id_to_resume(id, request['name'])
+    else:
+        id = ctx.new_job_id(mangled_name)
+        previous_job = None
+    try:
+        job = _submit_request(ctx, request, id, mangled_name, resume=bool(resume))
+    except Exception:
+        # a finished job stays listed if it cannot be resumed
+        ctx.release_job_id(id, previous_job)
+        raise
+    ctx.register_job(id, job)
+    job_dict = _get_job_dict(job, id, request['name'])
+    ctx.job_versions.update(job_dict)
+    ctx.job_store.add_job(job_dict, workdir=job.pm._data_root, request=request)
+    # events of steps started before are passed on when the listener is added
+    job.pm.add_listener(_get_job_listener(ctx, id))
+    return job_dict
+
+
+def _get_job_listener(ctx, id: str):
+    """
+    Returns a listener that writes the state changes of a job through to the job store and publishes them to
+    the clients subscribed to the job's events.
+    """
+    def _listener(event: Dict):
+        if event['type'] == 'task':
+            task_id = _task_id_of(event['command'])
+            task_name = _translate_step(event['command'])
+            ctx.job_store.update_task(id, task_id, task_name, event['status'], event['progress'])
+            ctx.job_events.publish(id, {'type': 'task', 'taskId': task_id, 'task': task_name,
+                                        'status': event['status'], 'progress': event['progress']})
+        elif event['type'] == 'job':
+            ctx.job_store.update_job_status(id, event['status'])
+            ctx.job_events.publish(id, {'type': 'job', 'status': event['status']})
+    return _listener
+
+
+def _submit_request(ctx, request, id: str, mangled_name: str, resume: bool = False):
     workdir_root = ctx.working_dir
     logging.info(f'working dir root from context {workdir_root}')
     workdir = workdir_root + '/' + id
     pm_request_file = f'{workdir}/{mangled_name}.json'
 
     pm_request = _pm_request_of(request, workdir, id)
-    if os.path.exists(workdir):
+    # limits of the resource pool that the workflow steps of all jobs share
+    pm_request['resources'] = ctx.step_resources
+    pm_request['task_log_lines'] = ctx.task_log_lines
+    pm_request['warm_workers'] = ctx.warm_workers
+    pm_request['fuse_steps'] = ctx.fuse_steps
+    pm_request['step_cache'] = ctx.step_cache
+    pm_request['resume'] = resume
+    if os.path.exists(workdir) and not resume:
         shutil.rmtree(workdir)
-    os.makedirs(workdir)
+    os.makedirs(workdir, exist_ok=True)
     with open(pm_request_file, "w") as f:
         json.dump(pm_request, f)
     pm_request["requestFile"] = pm_request_file
 
-    job = ctx.pm_server.submit_request(pm_request)
-    return _get_job_dict(job, id, request['name'])
+    return ctx.pm_server.submit_request(pm_request)
+
+
+def _task_id_of(step: str) -> str:
+    """
+    Returns the id of the task running a workflow step. Unlike the name of the task, it is unique within a job,
+    it stays the same while the job runs and after a restart of the server, and it may be used in URLs.
+    """
+    step_parts = step.split()
+    # steps in the backlog are listed with their calls, started steps with the paths of their calls
+    step_parts[0] = os.path.basename(step_parts[0])
+    return hashlib.sha1(' '.join(step_parts).encode()).hexdigest()[:16]
 
 
 def _translate_step(step: str) -> str:
     step_parts = step.split(" ")
+    if step_parts[0] == "run_fused.py" and len(step_parts) > 2 and step_parts[2].startswith('fused:'):
+        member_parameters = ' '.join(step_parts[3:])
+        return ', then '.join(_translate_step(f'{step_type} {member_parameters}')
+                              for step_type in step_parts[2][6:].split('+'))
     if step_parts[0] == "combine_biophys_outputs.py":
         return 'Assembling results from inference'
     if step_parts[0] == "combine_hres_biophys_outputs.py":
@@ -94,8 +206,13 @@ def _translate_step(step: str) -> str:
     if step_parts[0] == "infer_s2_kafka.py":
         return f'Inferring variables from S2 inference for time step from {step_parts[2]} to {step_parts[3]}'
     if step_parts[0] == "infer_s1_kaska.py":
+        if step_parts[4].startswith('array:'):
+            return f'Inferring variables from S1 inference for {step_parts[4][6:]} tiles and time step from ' \
+                   f'{step_parts[2]} to {step_parts[3]}'
         return f'Inferring variables from S1 inference for tile {step_parts[4]}, {step_parts[5]} and time step from {step_parts[2]} to {step_parts[3]}'
     if step_parts[0] == "infer_s2_kaska.py":
+        if step_parts[4].startswith('array:'):
+            return f'Inferring variables from S2 inference for {step_parts[4][6:]} tiles'
         return f'Inferring variables from S2 inference for tile {step_parts[4]}, {step_parts[5]}'
     if step_parts[0] == "preprocess_s1.py":
         return 'Preprocessing S1 data for all time steps'
@@ -132,6 +249,7 @@ def _pm_request_of(request, workdir: str, id: str) -> Dict:
     pm_request['data_root'] = workdir
     pm_request['simulation'] = pm_request['simulation'] == 'True'
     pm_request['log_dir'] = f'{workdir}/log'
+    pm_request['trace_index'] = _trace_index_of(workdir)
     pm_request['General']['roi'] = request['roi']
     pm_request['General']['start_time'] = \
         datetime.datetime.strftime(get_time_from_string(request['timeRange'][0]), '%Y-%m-%d')
@@ -199,26 +317,31 @@ def _determine_workflow(request) -> str:
 
 
 def _pm_workflow_of(pm) -> List:
+    """
+    Returns the tasks of the monitor of a job. The monitors of all workflows are MultiplyMonitors.
+    """
     accu = []
-    backlog = pm._backlog.copy()
+    backlog = pm.get_backlog()
     running = pm._running.copy()
     commands = pm._commands.copy()
     cancelled = pm._cancelled.copy()
     failed = pm._failed.copy()
-    for r in backlog:
-        l = '{0} {1} {2} {3}\n'.format(PMonitor.Args.get_call(r.args),
-                                       ' '.join(PMonitor.Args.get_parameters(r.args)),
-                                       ' '.join(PMonitor.Args.get_inputs(r.args)),
-                                       ' '.join(PMonitor.Args.get_outputs(r.args)))
-        accu.append({"step": l, "status": "initial", "progress": 0, "logs": []})
+    for call, parameters, inputs, outputs in backlog:
+        l = '{0} {1} {2} {3}\n'.format(call, ' '.join(parameters), ' '.join(inputs), ' '.join(outputs))
+        accu.append({"step": l, "status": "initial", "progress": 0, "logs": [], "logCount": 0})
     for l in running:
-        accu.append({"step": l, "status": "running", "progress": pm.get_progress(l), "logs": pm.get_logs(l)})
+        accu.append({"step": l, "status": "running", "progress": pm.get_progress(l), "logs": pm.get_logs(l),
+                     "logCount": pm.get_log_count(l), "details": pm.get_progress_details(l),
+                     "usage": pm.get_step_usage(l)})
     for l in commands:
-        accu.append({"step": l, "status": "succeeded", "progress": 100, "logs": pm.get_logs(l)})
+        accu.append({"step": l, "status": "succeeded", "progress": 100, "logs": pm.get_logs(l),
+                     "logCount": pm.get_log_count(l), "usage": pm.get_step_usage(l)})
     for l in cancelled:
-        accu.append({"step": l, "status": "cancelled", "progress": pm.get_progress(l), "logs": pm.get_logs(l)})
+        accu.append({"step": l, "status": "cancelled", "progress": pm.get_progress(l), "logs": pm.get_logs(l),
+                     "logCount": pm.get_log_count(l), "usage": pm.get_step_usage(l)})
     for l in failed:
-        accu.append({"step": l, "status": "failed", "progress": pm.get_progress(l), "logs": pm.get_logs(l)})
+        accu.append({"step": l, "status": "failed", "progress": pm.get_progress(l), "logs": pm.get_logs(l),
+                     "logCount": pm.get_log_count(l), "usage": pm.get_step_usage(l)})
     return accu
 
 
@@ -230,10 +353,50 @@ def set_mundi_authentication(ctx, parameters):
     ctx.set_mundi_authentication(parameters['access_key_id'], parameters['secret_access_key'])
 
 
-def get_job(ctx, id: str) -> Dict:
+def get_job(ctx, id: str, since: Optional[int] = None) -> Optional[Dict]:
+    """
+    Returns the state of the job with the given id. If *since* is given, only the tasks that have changed after
+    this version of the job are returned and the job is marked as ``delta``. Returns None if the job has not
+    changed since that version.
+
+    :raise KeyError: if there is no job with the given id
+    """
     job = ctx.get_job(id)
+    if job is None:
+        # job from a previous run of the server
+        job_dict = ctx.job_store.get_job(id)
+        if job_dict is None:
+            raise KeyError(f'Unknown job "{id}"')
+        return job_dict
     request_name = job.request['requestName'].split('/')[-1]
-    return _get_job_dict(job, id, request_name)
+    job_dict = _get_job_dict(job, id, request_name)
+    ctx.job_versions.update(job_dict)
+    if since is not None:
+        return ctx.job_versions.delta(job_dict, since)
+    return job_dict
+
+
+def get_jobs(ctx, ids: List[str], with_tasks: bool = False) -> Dict:
+    """
+    Returns the states of several jobs at once. Unless *with_tasks* is set, only the compact state of each job
+    (id, name, status and progress) is returned. Ids of unknown jobs are listed as ``unknown``.
+    """
+    jobs = []
+    unknown = []
+    for id in ids:
+        try:
+            job_dict = get_job(ctx, id)
+        except KeyError:
+            unknown.append(id)
+            continue
+        if not with_tasks:
+            job_dict = {key: job_dict[key] for key in ['id', 'name', 'status', 'progress']}
+        jobs.append(job_dict)
+    return {'jobs': jobs, 'unknown': unknown}
+
+
+def list_jobs(ctx, status: Optional[str] = None, name: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+    return {'jobs': ctx.job_store.list_jobs(status=status, name=name, limit=limit)}
 
 
 def _get_job_dict(job, request_id: str, request_name: str):
@@ -246,16 +409,84 @@ def _get_job_dict(job, request_id: str, request_name: str):
         progress = task['progress']
         job_progress += progress
         task_dict = {
+            'id': _task_id_of(task['step']),
             'name': _translate_step(task['step']),
             'status': status,
             'progress': progress,
-            'logs': task['logs']
+            'logs': task['logs'][-STATUS_LOG_LINES:],
+            'logCount': task['logCount']
         }
+        # phase, items, throughput and eta of steps reporting through their progress channel
+        task_dict.update(task.get('details', {}))
+        if len(task.get('usage', {})) > 0:
+            task_dict['usage'] = task['usage']
         job_dict['tasks'].append(task_dict)
     job_dict['progress'] = int(job_progress / len(tasks)) if len(tasks) > 0 else 100
     return job_dict
 
 
+def get_task_logs(ctx, job_id: str, task_id: str, offset: int, limit: int) -> Dict:
+    """
+    Reads up to *limit* lines from the trace file of a task, starting at byte *offset*. Lines that are still being
+    written are left out until they are complete. The trace files of jobs from previous runs of the server are
+    found through the index in their working directories.
+
+    :return: A dictionary with the lines read and the offset at which to continue reading.
+    :raise KeyError: if there is no job with the given id
+    """
+    job = ctx.get_job(job_id)
+    if job is not None:
+        trace_files = job.pm.get_trace_files()
+        running = job.pm._running.copy()
+    else:
+        workdir = ctx.job_store.get_workdir(job_id)
+        if workdir is None:
+            raise KeyError(f'Unknown job "{job_id}"')
+        trace_files = _read_trace_index(_trace_index_of(workdir))
+        running = {}
+    lines = []
+    next_offset = offset
+    for command, trace_file in trace_files.items():
+        if _task_id_of(command) == task_id:
+            lines, next_offset = _read_lines(trace_file, offset, limit, command in running)
+            break
+    return {'offset': offset, 'nextOffset': next_offset, 'lines': lines}
+
+
+def _trace_index_of(workdir: str) -> str:
+    return os.path.join(workdir, 'log', 'trace_files.jsonl')
+
+
+def _read_trace_index(path: str) -> Dict:
+    trace_files = {}
+    if not os.path.exists(path):
+        return trace_files
+    with open(path) as index:
+        for line in index:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # last line of a crashed server
+                continue
+            trace_files[entry['command']] = entry['file']
+    return trace_files
+
+
+def _read_lines(path: str, offset: int, limit: int, running: bool) -> Tuple[List[str], int]:
+    lines = []
+    if not os.path.exists(path):
+        return lines, offset
+    with open(path, 'rb') as trace:
+        trace.seek(offset)
+        while len(lines) < limit:
+            line = trace.readline()
+            if len(line) == 0 or (running and not line.endswith(b'\n')):
+                break
+            offset += len(line)
+            lines.append(line.decode(errors='replace').rstrip('\n'))
+    return lines, offset
+
+
 def cancel(ctx, id: str):
     job = ctx.get_job(id)
     job.pm.cancel()
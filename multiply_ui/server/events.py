@@ -0,0 +1,47 @@
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class JobEventHub:
+    """
+    Distributes the events that the processing monitors emit for jobs and their tasks to subscribers,
+    usually WebSocket connections. Events may be published from any thread, subscribers are always called
+    on the IOLoop. As long as no IOLoop has been set, events are dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._io_loop = None
+        self._subscribers = {}
+
+    def set_io_loop(self, io_loop):
+        self._io_loop = io_loop
+
+    def subscribe(self, subscriber: Callable[[Dict], None], job_ids: Optional[Iterable[str]] = None):
+        """
+        Subscribes to the events of the jobs with the given ids, or of all jobs if *job_ids* is None.
+        Subscribing again replaces the ids of a previous subscription.
+        """
+        with self._lock:
+            self._subscribers[subscriber] = set(job_ids) if job_ids is not None else None
+
+    def unsubscribe(self, subscriber: Callable[[Dict], None]):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def publish(self, job_id: str, event: Dict):
+        if self._io_loop is None:
+            return
+        event = dict(event, jobId=job_id)
+        self._io_loop.add_callback(self._dispatch, job_id, event)
+
+    def _dispatch(self, job_id: str, event: Dict):
+        with self._lock:
+            subscribers = [subscriber for subscriber, job_ids in self._subscribers.items()
+                           if job_ids is None or job_id in job_ids]
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                logging.warning(f'Could not deliver event of job {job_id}: {e}')
@@ -1,27 +1,36 @@
-import concurrent.futures
 import json
 import logging
 import traceback
 
 import tornado.escape
+import tornado.ioloop
 import tornado.web
+import tornado.websocket
 
+from .config import LOG_PAGE_SIZE, MAX_LOG_PAGE_SIZE
 from .context import ServiceContext
 from multiply_ui.server import controller
 from typing import Optional
 
 logging.getLogger().setLevel(logging.INFO)
-_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=8)
 
 
 # noinspection PyAbstractClass
 class ServiceRequestHandler(tornado.web.RequestHandler):
 
+    # name of the executor (see config.EXECUTOR_POOL_SIZES) that runs the blocking calls of this handler
+    executor_name = 'default'
+
     @property
     def ctx(self) -> ServiceContext:
         # noinspection PyProtectedMember
         return self.application._ctx
 
+    def run_in_executor(self, func, *args):
+        """Runs the blocking *func* with *args* in this handler's executor and returns an awaitable result."""
+        executor = self.ctx.get_executor(self.executor_name)
+        return tornado.ioloop.IOLoop.current().run_in_executor(executor, func, *args)
+
     @property
     def base_url(self):
         return self.request.protocol + '://' + self.request.host
@@ -71,6 +80,17 @@ class ServiceRequestHandler(tornado.web.RequestHandler):
                 }
             }, indent=2))
 
+    def get_int_query_argument(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        """Utility to get a query argument as integer."""
+        value = self.get_query_argument(name, default=None)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError as e:
+            raise tornado.web.HTTPError(status_code=400,
+                                        log_message=f'Invalid value "{value}" of query argument "{name}"') from e
+
     def get_body_as_json_object(self, name="JSON object"):
         """Utility to get the body argument as JSON object. """
         try:
@@ -82,74 +102,229 @@ class ServiceRequestHandler(tornado.web.RequestHandler):
 
 # noinspection PyAbstractClass
 class ClearHandler(ServiceRequestHandler):
-    def get(self, clear_type: str):
-        self.ctx.clear(clear_type)
+    executor_name = 'clear'
+
+    async def get(self, clear_type: str):
+        await self.run_in_executor(self.ctx.clear, clear_type)
 
 
 # noinspection PyAbstractClass
 class GetParametersHandler(ServiceRequestHandler):
-    def get(self):
+    executor_name = 'parameters'
+
+    async def get(self):
+        response = self.ctx.parameters_response
+        if response is None:
+            response = await self.run_in_executor(controller.get_parameters_response, self.ctx)
+        use_gzip = 'gzip' in self.request.headers.get('Accept-Encoding', '')
         self.set_header('Content-Type', 'application/json')
-        parameters = controller.get_parameters(self.ctx)
-        json.dump(parameters, self)
+        self.set_header('Cache-Control', 'no-cache')
+        self.set_header('Vary', 'Accept-Encoding')
+        self.set_header('Etag', response['gzip_etag'] if use_gzip else response['etag'])
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+        if use_gzip:
+            self.set_header('Content-Encoding', 'gzip')
+            self.finish(response['gzip_body'])
+        else:
+            self.finish(response['body'])
 
 
 # noinspection PyAbstractClass
 class GetInputsHandler(ServiceRequestHandler):
-    def post(self):
+    executor_name = 'inputs'
+
+    async def post(self):
         self.set_header('Content-Type', 'application/json')
         parameters = self.get_body_as_json_object()
-        request = controller.get_inputs(self.ctx, parameters)
+        request = await self.run_in_executor(controller.get_inputs, self.ctx, parameters)
         json.dump(request, self)
         self.finish()
 
 
 # noinspection PyAbstractClass
 class ExecuteJobsHandler(ServiceRequestHandler):
-    def post(self):
+    executor_name = 'execute'
+
+    async def post(self):
         self.set_header('Content-Type', 'application/json')
         request = self.get_body_as_json_object()
-        job = controller.submit_request(self.ctx, request)
+        try:
+            job = await self.run_in_executor(controller.submit_request, self.ctx, request)
+        except ValueError as e:
+            raise tornado.web.HTTPError(status_code=400, log_message=str(e)) from e
         json.dump(job, self)
         self.finish()
 
 
 # noinspection PyAbstractClass
 class GetJobHandler(ServiceRequestHandler):
-    def get(self, job_id: str):
+    executor_name = 'status'
+
+    async def get(self, job_id: str):
+        since = self.get_int_query_argument('since')
+        try:
+            job = await self.run_in_executor(controller.get_job, self.ctx, job_id, since)
+        except KeyError as e:
+            raise tornado.web.HTTPError(status_code=404, log_message=f'Unknown job "{job_id}"') from e
+        if job is None:
+            self.set_status(304)
+            self.finish()
+            return
         self.set_header('Content-Type', 'application/json')
-        job = controller.get_job(self.ctx, job_id)
         json.dump(job, self)
         self.finish()
 
 
+# noinspection PyAbstractClass
+class GetTaskLogsHandler(ServiceRequestHandler):
+    executor_name = 'logs'
+
+    async def get(self, job_id: str, task_id: str):
+        offset = self.get_int_query_argument('offset', default=0)
+        limit = min(self.get_int_query_argument('limit', default=LOG_PAGE_SIZE), MAX_LOG_PAGE_SIZE)
+        if self.get_query_argument('stream', default='false') == 'true':
+            await self._stream(job_id, task_id, offset, limit)
+            return
+        self.set_header('Content-Type', 'application/json')
+        logs = await self._get_task_logs(job_id, task_id, offset, limit)
+        json.dump(logs, self)
+        self.finish()
+
+    async def _stream(self, job_id: str, task_id: str, offset: int, limit: int):
+        """Writes the log lines as plain text in chunks of at most LOG_PAGE_SIZE lines."""
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.set_header('X-Log-Offset', str(offset))
+        while limit > 0:
+            logs = await self._get_task_logs(job_id, task_id, offset, min(limit, LOG_PAGE_SIZE))
+            if len(logs['lines']) == 0:
+                break
+            self.write(''.join(f'{line}\n' for line in logs['lines']))
+            await self.flush()
+            offset = logs['nextOffset']
+            limit -= len(logs['lines'])
+        self.finish()
+
+    async def _get_task_logs(self, job_id: str, task_id: str, offset: int, limit: int):
+        try:
+            return await self.run_in_executor(controller.get_task_logs, self.ctx, job_id, task_id, offset, limit)
+        except KeyError as e:
+            raise tornado.web.HTTPError(status_code=404, log_message=f'Unknown job "{job_id}"') from e
+
+
+# noinspection PyAbstractClass
+class GetJobsHandler(ServiceRequestHandler):
+    executor_name = 'status'
+
+    async def get(self):
+        ids = self.get_query_argument('ids', default='')
+        with_tasks = self.get_query_argument('tasks', default='false') == 'true'
+        await self._write_jobs([id for id in ids.split(',') if len(id) > 0], with_tasks)
+
+    async def post(self):
+        body = self.get_body_as_json_object()
+        ids = body.get('ids') if isinstance(body, dict) else None
+        if not isinstance(ids, list):
+            raise tornado.web.HTTPError(status_code=400, log_message='Missing list of job "ids" in request body')
+        await self._write_jobs(ids, bool(body.get('tasks', False)))
+
+    async def _write_jobs(self, ids, with_tasks: bool):
+        self.set_header('Content-Type', 'application/json')
+        jobs = await self.run_in_executor(controller.get_jobs, self.ctx, ids, with_tasks)
+        json.dump(jobs, self)
+        self.finish()
+
+
+# noinspection PyAbstractClass
+class ListJobsHandler(ServiceRequestHandler):
+    executor_name = 'status'
+
+    async def get(self):
+        self.set_header('Content-Type', 'application/json')
+        status = self.get_query_argument('status', default=None)
+        name = self.get_query_argument('name', default=None)
+        limit = self.get_int_query_argument('limit')
+        jobs = await self.run_in_executor(controller.list_jobs, self.ctx, status, name, limit)
+        json.dump(jobs, self)
+        self.finish()
+
+
 # noinspection PyAbstractClass
 class CancelHandler(ServiceRequestHandler):
-    def get(self, job_id: str):
+    executor_name = 'status'
+
+    async def get(self, job_id: str):
         self.set_header('Content-Type', 'application/json')
-        controller.cancel(self.ctx, job_id)
+        await self.run_in_executor(controller.cancel, self.ctx, job_id)
 
 
 # noinspection PyAbstractClass
 class PostEarthDataAuthHandler(ServiceRequestHandler):
-    def post(self):
+    executor_name = 'auth'
+
+    async def post(self):
         self.set_header('Content-Type', 'application/json')
         parameters = self.get_body_as_json_object()
-        controller.set_earth_data_authentication(self.ctx, parameters)
+        await self.run_in_executor(controller.set_earth_data_authentication, self.ctx, parameters)
 
 
 # noinspection PyAbstractClass
 class PostMundiAuthHandler(ServiceRequestHandler):
-    def post(self):
+    executor_name = 'auth'
+
+    async def post(self):
         self.set_header('Content-Type', 'application/json')
         parameters = self.get_body_as_json_object()
-        controller.set_mundi_authentication(self.ctx, parameters)
+        await self.run_in_executor(controller.set_mundi_authentication, self.ctx, parameters)
 
 
 # noinspection PyAbstractClass
 class VisualizeHandler(ServiceRequestHandler):
-    def get(self, job_id: str):
+    executor_name = 'visualize'
+
+    async def get(self, job_id: str):
         self.set_header('Content-Type', 'application/json')
-        ip_dict = controller.visualize(self.ctx, job_id)
+        ip_dict = await self.run_in_executor(controller.visualize, self.ctx, job_id)
         json.dump(ip_dict, self)
         self.finish()
+
+
+# noinspection PyAbstractClass
+class JobEventsHandler(tornado.websocket.WebSocketHandler):
+    """
+    Pushes the state changes of jobs and their tasks to the client. Clients may pass the ids of the jobs they are
+    interested in as comma-separated query argument ``ids`` or change them later by sending
+    ``{"ids": [...]}``. Without ids, the events of all jobs are pushed.
+    """
+
+    @property
+    def ctx(self) -> ServiceContext:
+        # noinspection PyProtectedMember
+        return self.application._ctx
+
+    def check_origin(self, origin):
+        # same policy as the CORS headers of the RESTful API
+        return True
+
+    def open(self):
+        ids = self.get_query_argument('ids', default=None)
+        self.ctx.job_events.subscribe(self._send_event, ids.split(',') if ids else None)
+
+    def on_message(self, message):
+        try:
+            ids = tornado.escape.json_decode(message)['ids']
+        except (json.JSONDecodeError, TypeError, ValueError, KeyError):
+            logging.warning(f'Invalid job events subscription: {message}')
+            return
+        self.ctx.job_events.subscribe(self._send_event, ids)
+
+    def on_close(self):
+        self.ctx.job_events.unsubscribe(self._send_event)
+
+    def _send_event(self, event):
+        try:
+            self.write_message(json.dumps(event))
+        except tornado.websocket.WebSocketClosedError:
+            self.ctx.job_events.unsubscribe(self._send_event)
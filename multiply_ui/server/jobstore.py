@@ -0,0 +1,218 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    workdir TEXT,
+    request TEXT,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    PRIMARY KEY (job_id, id)
+);
+"""
+
+# tasks of stores written before tasks had ids are identified by their names
+_MIGRATE_TASKS = """
+INSERT INTO tasks (job_id, id, name, position, status, progress, started, finished)
+SELECT job_id, name, name, position, status, progress, started, finished FROM tasks_by_name;
+DROP TABLE tasks_by_name;
+"""
+
+_JOB_COLUMNS = 'id, name, status, progress, workdir, submitted, started, finished'
+
+
+class JobStore:
+    """
+    An embedded SQLite store for the metadata and state of the jobs run by the MULTIPLY server.
+    It is written through whenever a job or one of its tasks changes its state, so that jobs survive
+    a restart of the server and can be listed and filtered without asking the processing monitors.
+
+    :param path: Path to the database file. Defaults to an in-memory database.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            if path != ':memory:':
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('PRAGMA foreign_keys=ON')
+            task_columns = [row[1] for row in self._connection.execute('PRAGMA table_info(tasks)')]
+            migrate = len(task_columns) > 0 and 'id' not in task_columns
+            if migrate:
+                self._connection.execute('ALTER TABLE tasks RENAME TO tasks_by_name')
+            self._connection.executescript(_SCHEMA)
+            if migrate:
+                self._connection.executescript(_MIGRATE_TASKS)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def add_job(self, job_dict: Dict, workdir: Optional[str] = None, request: Optional[Dict] = None):
+        """
+        Adds a job as returned by the controller, including its tasks. An existing job with the same id is replaced.
+        Tasks without an id are identified by their names.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM jobs WHERE id = ?', (job_dict['id'],))
+            self._connection.execute('INSERT INTO jobs (id, name, status, progress, workdir, request, submitted) '
+                                     'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     (job_dict['id'], job_dict['name'], job_dict['status'] or 'new',
+                                      job_dict.get('progress', 0), workdir,
+                                      json.dumps(request) if request is not None else None, now))
+            for position, task in enumerate(job_dict.get('tasks', [])):
+                self._upsert_task(job_dict['id'], task.get('id', task['name']), task['name'], task['status'],
+                                  task['progress'], now, position)
+
+    def update_job_status(self, job_id: str, status: str):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE jobs SET status = ?, '
+                                     'started = CASE WHEN ? = \'running\' THEN COALESCE(started, ?) ELSE started END, '
+                                     'finished = CASE WHEN ? IN (?, ?, ?) THEN ? ELSE finished END '
+                                     'WHERE id = ?',
+                                     (status, status, now, status) + FINAL_STATUSES + (now, job_id))
+
+    def update_task(self, job_id: str, task_id: str, name: str, status: str, progress: int):
+        """
+        Updates the state of a task and the progress of its job, which is the mean progress of the job's tasks.
+        Tasks are identified by *task_id*, as their display *name* may be shared by several tasks of a job.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._upsert_task(job_id, task_id, name, status, progress, now)
+            self._connection.execute('UPDATE jobs SET progress = '
+                                     '(SELECT CAST(AVG(progress) AS INTEGER) FROM tasks WHERE job_id = ?) '
+                                     'WHERE id = ?', (job_id, job_id))
+
+    def _upsert_task(self, job_id: str, task_id: str, name: str, status: str, progress: int, now: float,
+                     position: Optional[int] = None):
+        cursor = self._connection.execute('UPDATE tasks SET status = ?, progress = ?, '
+                                          'started = CASE WHEN ? = \'running\' THEN COALESCE(started, ?) '
+                                          'ELSE started END, '
+                                          'finished = CASE WHEN ? IN (?, ?, ?) THEN ? ELSE finished END '
+                                          'WHERE job_id = ? AND id = ?',
+                                          (status, progress, status, now, status) + FINAL_STATUSES +
+                                          (now, job_id, task_id))
+        if cursor.rowcount == 0:
+            if position is None:
+                position = self._connection.execute('SELECT COUNT(*) FROM tasks WHERE job_id = ?',
+                                                    (job_id,)).fetchone()[0]
+            self._connection.execute('INSERT INTO tasks (job_id, id, name, position, status, progress, started, '
+                                     'finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (job_id, task_id, name, position, status, progress,
+                                      now if status == 'running' else None,
+                                      now if status in FINAL_STATUSES else None))
+
+    def has_job(self, job_id: str) -> bool:
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone() is not None
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Returns the stored job with the given id in the form returned by the controller, or None.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT id, name, status, progress FROM jobs WHERE id = ?',
+                                           (job_id,)).fetchone()
+            if row is None:
+                return None
+            task_rows = self._connection.execute('SELECT id, name, status, progress FROM tasks '
+                                                 'WHERE job_id = ? ORDER BY position', (job_id,)).fetchall()
+        job_dict = dict(row)
+        job_dict['tasks'] = []
+        for task_row in task_rows:
+            task_dict = dict(task_row)
+            task_dict['logs'] = []
+            job_dict['tasks'].append(task_dict)
+        return job_dict
+
+    def get_workdir(self, job_id: str) -> Optional[str]:
+        """
+        Returns the working directory of the stored job with the given id, or None.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT workdir FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_task_timings(self, job_id: str) -> List[Dict]:
+        """
+        Returns id, name, status, start and end time (seconds since the epoch) of the tasks of the given job.
+        """
+        with self._lock:
+            return [dict(row) for row in
+                    self._connection.execute('SELECT id, name, status, started, finished FROM tasks '
+                                             'WHERE job_id = ? ORDER BY position', (job_id,)).fetchall()]
+
+    def list_jobs(self, status: Optional[str] = None, name: Optional[str] = None,
+                  submitted_after: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Lists the stored jobs without their tasks, most recently submitted first.
+
+        :param status: If given, only jobs with this status are listed.
+        :param name: If given, only jobs with this name are listed.
+        :param submitted_after: If given, only jobs submitted after this time (seconds since the epoch) are listed.
+        :param limit: The maximum number of jobs to list.
+        """
+        clauses = []
+        arguments = []
+        if status is not None:
+            clauses.append('status = ?')
+            arguments.append(status)
+        if name is not None:
+            clauses.append('name = ?')
+            arguments.append(name)
+        if submitted_after is not None:
+            clauses.append('submitted > ?')
+            arguments.append(submitted_after)
+        query = f'SELECT {_JOB_COLUMNS} FROM jobs'
+        if len(clauses) > 0:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY submitted DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            arguments.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(query, arguments).fetchall()]
+
+    def mark_interrupted(self, status: str = 'failed') -> List[str]:
+        """
+        Sets all jobs that had not finished and their running tasks to *status*. To be called when the server
+        starts, as such jobs have been interrupted by a previous shutdown. Returns the ids of the interrupted jobs.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            job_ids = [row[0] for row in
+                       self._connection.execute('SELECT id FROM jobs WHERE status NOT IN (?, ?, ?)', FINAL_STATUSES)]
+            self._connection.execute('UPDATE tasks SET status = ?, finished = ? WHERE status = \'running\'',
+                                     (status, now))
+            self._connection.execute('UPDATE jobs SET status = ?, finished = ? WHERE status NOT IN (?, ?, ?)',
+                                     (status, now) + FINAL_STATUSES)
+        return job_ids
@@ -4,6 +4,7 @@
 
 from multiply_core.observations import get_valid_files
 from multiply_prior_engine import PriorEngine
+from script_progress import ProgressChannel
 import datetime
 import logging
 import os
@@ -17,6 +18,7 @@ script_progress_logging_handler = logging.StreamHandler()
 script_progress_logging_handler.setLevel(logging.INFO)
 script_progress_logging_handler.setFormatter(script_progress_formatter)
 script_progress_logger.addHandler(script_progress_logging_handler)
+progress_channel = ProgressChannel()
 
 # setup parameters
 configuration_file = sys.argv[1]
@@ -39,6 +41,7 @@ for model in parameters['Inference']['forward_models']:
         required_priors = model['required_priors']
 
 script_progress_logger.info('0-50')
+progress_channel.report(progress=0, phase='collecting priors')
 
 priors_to_be_retrieved = []
 start_time = datetime.datetime.strptime(start, '%Y-%m-%d')
@@ -56,6 +59,7 @@ for prior in required_priors:
 
 if len(priors_to_be_retrieved) == 0:
     script_progress_logger.info('50-100')
+    progress_channel.report(progress=50)
 else:
     # execute the Prior engine for the requested times
     time = start_time
@@ -66,6 +70,8 @@ else:
         PE = PriorEngine(config=configuration_file, datestr=time.strftime('%Y-%m-%d'),
                          variables=priors_to_be_retrieved)
         script_progress_logger.info(f'{int(50+((i/num_days) * 50))}-{int(50+(((i+1)/num_days) * 50))}')
+        progress_channel.report(progress=int(50 + ((i / num_days) * 50)), phase='running prior engine', items_done=i,
+                                items_total=num_days)
         priors = PE.get_priors()
         time = time + datetime.timedelta(days=1)
         i += 1
@@ -74,3 +80,4 @@ else:
         directory = parameters['Prior']['output_directory']
         os.system("cp " + directory + "/*.vrt " + s1_priors_dir + "/")
 script_progress_logger.info('100-100')
+progress_channel.report(progress=100, phase='done')
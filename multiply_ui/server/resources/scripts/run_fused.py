@@ -0,0 +1,57 @@
+#!{PYTHON}
+# example syntax: run_fused.py /data/m5/log/fused/0.json
+# runs the steps of a fused chain one after the other in this interpreter, so that modules are imported only once.
+# the start of each step is marked by a line INFO:FusedStep:<index>, the first failing step ends the chain.
+
+import json
+import logging
+import os
+import runpy
+import shutil
+import sys
+import traceback
+
+
+def _reset_logging():
+    # steps add their handlers to module level loggers, which would print lines of later steps twice
+    for logger in [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger):
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+
+
+def _run(argv):
+    script = argv[0] if os.path.sep in argv[0] else shutil.which(argv[0])
+    if script is None:
+        print(f'{argv[0]} not found', file=sys.stderr)
+        return 127
+    sys.argv = [script] + argv[1:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+with open(sys.argv[1]) as f:
+    chain = json.load(f)
+
+cwd = os.getcwd()
+for index, step in enumerate(chain['steps']):
+    _reset_logging()
+    os.chdir(cwd)
+    print(f'INFO:FusedStep:{index}', flush=True)
+    code = _run(step['argv'])
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if code != 0:
+        sys.exit(code)
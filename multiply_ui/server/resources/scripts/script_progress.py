@@ -0,0 +1,41 @@
+import json
+import os
+
+PROGRESS_FD_ENV_VAR = 'MULTIPLY_PROGRESS_FD'
+
+
+class ProgressChannel:
+    """
+    Reports the progress of a script to the workflow monitor as JSON lines, written to the file descriptor given in
+    the environment variable ``MULTIPLY_PROGRESS_FD``. If the script is not run by the monitor, reports are ignored.
+    """
+
+    def __init__(self):
+        fd = os.environ.get(PROGRESS_FD_ENV_VAR)
+        self._stream = None
+        if fd is not None:
+            try:
+                self._stream = os.fdopen(int(fd), 'w', buffering=1, closefd=False)
+            except (OSError, ValueError):
+                self._stream = None
+
+    def report(self, progress: int = None, phase: str = None, items_done: int = None, items_total: int = None,
+               bytes_done: int = None):
+        """
+        Reports progress. Arguments left out keep their previously reported values.
+
+        :param progress: The progress of the script, from 0 to 100.
+        :param phase: The name of the current phase of the script.
+        :param items_done: The number of items processed so far, e.g., days or tiles.
+        :param items_total: The number of items to process.
+        :param bytes_done: The number of bytes processed so far.
+        """
+        if self._stream is None:
+            return
+        message = {'progress': progress, 'phase': phase, 'items_done': items_done, 'items_total': items_total,
+                   'bytes_done': bytes_done}
+        try:
+            self._stream.write(json.dumps({key: value for key, value in message.items() if value is not None}) + '\n')
+        except OSError:
+            # the monitor has gone away, progress is still logged
+            self._stream = None
@@ -1,5 +1,5 @@
 import datetime
-from .multiply_workflow import MultiplyMonitor
+from .multiply_workflow import CACHEABLE_STEPS, MultiplyMonitor
 
 
 class InferS2Kafka(MultiplyMonitor):
@@ -9,7 +9,10 @@ class InferS2Kafka(MultiplyMonitor):
                           parameters,
                           types=[('data_access_get_static.py', 1), ('get_data_for_s2_preprocessing.py', 2),
                                  ('data_access_put_s2_l2.py', 1), ('retrieve_s2_priors.py', 2), ('preprocess_s2.py', 2),
-                                 ('infer_s2_kafka.py', 2)]
+                                 ('infer_s2_kafka.py', 2)],
+                          profiles={'retrieve_s2_priors.py': (1, 2, 120), 'preprocess_s2.py': (2, 6, 900),
+                                    'infer_s2_kafka.py': (2, 8, 1800)},
+                          cacheable=CACHEABLE_STEPS
                           )
         self._data_root = parameters['data_root']
         self._request_file = parameters['requestFile']
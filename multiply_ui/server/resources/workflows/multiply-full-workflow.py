@@ -1,7 +1,7 @@
 import datetime
 from typing import Dict
 from multiply_core.util import get_num_tiles
-from multiply_workflow import MultiplyMonitor
+from multiply_workflow import CACHEABLE_STEPS, MultiplyMonitor
 
 
 class MultiplyFull(MultiplyMonitor):
@@ -18,7 +18,18 @@ class MultiplyFull(MultiplyMonitor):
                                         ('create_s2_kaska_inference_output_files.py', 1),
                                         ('get_data_for_s1_preprocessing.py', 1), ('preprocess_s1.py', 1),
                                         ('stack_s1.py', 2), ('determine_s1_priors.py', 2), ('infer_s1_kaska.py', 6)
-                                        ]
+                                        ],
+                                 # cores, GB of memory and seconds per step,
+                                 # data access steps are limited by their types only
+                                 profiles={'retrieve_s2_priors.py': (1, 2, 120), 'preprocess_s2.py': (2, 6, 900),
+                                           'combine_hres_biophys_outputs.py': (1, 2), 'post_process.py': (1, 4),
+                                           'combine_biophys_outputs.py': (1, 2), 'infer_s2_kafka.py': (2, 8, 1800),
+                                           'infer_s2_kaska.py': (1, 3, 600),
+                                           'create_s1_kaska_inference_output_files.py': (1, 1),
+                                           'create_s2_kaska_inference_output_files.py': (1, 1),
+                                           'preprocess_s1.py': (4, 12, 1200), 'stack_s1.py': (1, 4, 300),
+                                           'determine_s1_priors.py': (1, 2), 'infer_s1_kaska.py': (1, 3, 600)},
+                                 cacheable=CACHEABLE_STEPS
                                  )
         self._data_root = parameters['data_root']
         self._request_file = parameters['requestFile']
@@ -63,6 +74,9 @@ class MultiplyFull(MultiplyMonitor):
         params_dict['biophys_output'] = biophys_output
         self._create_post_processing_workflow(start, stop, params_dict)
 
+    def _tiles(self):
+        return [[f'{tile_x}', f'{tile_y}'] for tile_x in range(self._num_tiles_x) for tile_y in range(self._num_tiles_y)]
+
     def _create_kafka_s2_inference_workflow(self, start: str, stop: str, params_dict: Dict):
         if not self._infer_s2_kafka:
             return params_dict
@@ -143,10 +157,8 @@ class MultiplyFull(MultiplyMonitor):
         self.execute('retrieve_s2_priors.py', [], [priors], parameters=[self._request_file, start, stop])
         self.execute('create_s2_kaska_inference_output_files.py', [], [hres_biophys_output],
                              parameters=[self._request_file, start, stop])
-        for tile_x in range(self._num_tiles_x):
-            for tile_y in range(self._num_tiles_y):
-                self.execute('infer_s2_kaska.py', [sdrs, priors], [hres_biophys_output],
-                             parameters=[self._request_file, start, stop, f'{tile_x}', f'{tile_y}'])
+        self.execute_array('infer_s2_kaska.py', [sdrs, priors], [hres_biophys_output],
+                           parameters=[self._request_file, start, stop], members=self._tiles())
         params_dict['hres_biophys_output'] = hres_biophys_output
         params_dict['sdrs'] = sdrs
         return params_dict
@@ -176,10 +188,8 @@ class MultiplyFull(MultiplyMonitor):
                          parameters=[self._request_file, date, next_date])
             self.execute('create_s1_kaska_inference_output_files.py', [s1_stack_for_date, s1_priors_for_date], 
                          [sar_biophys_output], parameters=[self._request_file, date, next_date])
-            for tile_x in range(self._num_tiles_x):
-                for tile_y in range(self._num_tiles_y):
-                    self.execute('infer_s1_kaska.py', [s1_stack_for_date, s1_priors_for_date], [sar_biophys_output],
-                                 parameters=[self._request_file, date, next_date, f'{tile_x}', f'{tile_y}'])
+            self.execute_array('infer_s1_kaska.py', [s1_stack_for_date, s1_priors_for_date], [sar_biophys_output],
+                               parameters=[self._request_file, date, next_date], members=self._tiles())
         params_dict['sar_biophys_output'] = sar_biophys_output 
         return params_dict
 
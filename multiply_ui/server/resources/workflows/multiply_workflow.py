@@ -1,108 +1,753 @@
+import concurrent.futures
+import csv
+import hashlib
+import json
 import logging
 import os
+import shlex
+import shutil
 import signal
+import subprocess
 import sys
+import threading
+import time
 from pmonitor import PMonitor
+try:
+    from .process_supervisor import get_process_supervisor, ProcessUsage
+    from .step_cache import get_step_cache
+    from .step_outputs import get_resumable_steps, StepOutputManifest
+    from .step_progress import StepProgress
+    from .task_logs import TaskLogBuffer
+    from .warm_workers import get_warm_worker_server
+    from .workflow_graph import StepGraph
+    from .workflow_resources import derive_type_limits, get_machine_resources, get_resource_pool, StepProfile
+except ImportError:
+    # loaded from the workflows directory by the processing monitor server
+    from process_supervisor import get_process_supervisor, ProcessUsage
+    from step_cache import get_step_cache
+    from step_outputs import get_resumable_steps, StepOutputManifest
+    from step_progress import StepProgress
+    from task_logs import TaskLogBuffer
+    from warm_workers import get_warm_worker_server
+    from workflow_graph import StepGraph
+    from workflow_resources import derive_type_limits, get_machine_resources, get_resource_pool, StepProfile
+
+# the script running the members of a fused step
+FUSED_STEP_CALL = 'run_fused.py'
+# steps whose results may be reused by other jobs and the sections of the request their scripts read
+CACHEABLE_STEPS = {'data_access_get_static.py': ['General.roi'],
+                   'get_data_for_s2_preprocessing.py': ['General.roi'],
+                   'retrieve_s2_priors.py': ['General', 'Inference', 'Prior'],
+                   'preprocess_s2.py': ['General.roi', 'S2-PreProcessing.compute_only_roi']}
+
+# lines of step output that report progress and are not logged
+_PROGRESS_LINE_PREFIXES = ('INFO:ScriptProgress', 'INFO:ComponentProgress')
 
 logging.getLogger().setLevel(logging.INFO)
 
 
 class MultiplyMonitor(PMonitor):
 
-    def __init__(self, parameters, types):
+    def __init__(self, parameters, types, profiles=None, cacheable=None):
+        """
+        :param parameters: The processing request.
+        :param types: Pairs of step types and the number of steps of the type that may run at the same time.
+        :param profiles: Maps step types to the cores and memory in GB a step of the type needs, optionally followed
+            by its estimated duration in seconds. If given for a type, its limit is derived from the resources
+            of the machine instead. Durations are used to run steps on the critical path first.
+        :param cacheable: Maps the step types whose results may be reused by other jobs to the sections of the
+            request that their scripts read, given as dotted paths like 'General.roi'.
+        """
+        resources = parameters.get('resources', {})
+        cores, memory = get_machine_resources()
+        max_concurrent_steps = resources.get('max_concurrent_steps') or cores
+        derived_type_limits = derive_type_limits(types, profiles or {}, cores, memory)
+        resource_pool = get_resource_pool()
+        resource_pool.configure(max_concurrent_steps, resources.get('step_type_limits'),
+                                default_type_limits=derived_type_limits.items(),
+                                memory_budget=resources.get('memory_budget'), default_memory_budget=memory,
+                                memory_profiles={step_type: StepProfile(*profile).memory
+                                                 for step_type, profile in (profiles or {}).items()},
+                                memory_history_path=resources.get('memory_history'))
+        # the monitor reports the commands of the steps it has completed next to the request
+        report_path = parameters['requestName'] + '.report'
+        self._output_manifest = StepOutputManifest(os.path.join(parameters['log_dir'], 'step_outputs.jsonl'))
+        resumable = get_resumable_steps(report_path, self._output_manifest) if parameters.get('resume') else []
+        if parameters.get('resume') and os.path.exists(report_path):
+            # the monitor skips the steps listed in the report, those that need to be run again must not be listed
+            with open(report_path, 'w') as report:
+                report.writelines(command + '\n' for command in resumable)
         PMonitor.__init__(self,
                           ['none', parameters['data_root']],
                           request=parameters['requestName'],
-                          hosts=[('localhost', 10)],
-                          types=types,
+                          hosts=[('localhost', resource_pool.get_max_concurrent_steps())],
+                          types=[(step_type, resource_pool.get_type_limit(step_type)) for step_type, _ in types] +
+                                [(FUSED_STEP_CALL, resource_pool.get_max_concurrent_steps())],
                           logdir=parameters['log_dir'],
                           simulation='simulation' in parameters and parameters['simulation'])
+        self._resource_pool = resource_pool
         self._tasks_progress = {}
         self._lower_script_progress = {}
         self._upper_script_progress = {}
+        self._step_progress = {}
+        self._step_usages = {}
+        self._step_wall_times = {}
         self._processor_logs = {}
+        self._task_log_lines = parameters.get('task_log_lines', 1000)
+        warm_workers = parameters.get('warm_workers', {})
+        self._warm_step_types = set(warm_workers.get('step_types', []))
+        self._warm_worker_server = get_warm_worker_server(warm_workers['python'], warm_workers.get('preload', [])) \
+            if len(self._warm_step_types) > 0 else None
+        self._trace_files = {}
+        self._trace_index = parameters.get('trace_index')
+        self._trace_index_lock = threading.Lock()
         self._pids = {}
         self._to_be_cancelled = []
         self._cancelled = []
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+        self._held_events = []
+        self._cancelling = False
+        self._graph = StepGraph()
+        self._graph_lock = threading.Lock()
+        self._parked = {}
+        self._released = []
+        self._durations = {}
+        for step_type, profile in (profiles or {}).items():
+            duration = StepProfile(*profile).duration
+            if duration is not None:
+                self._durations[step_type] = duration
+        self._command_ranks = {}
+        self._arrays = {}
+        self._fuse_steps = parameters.get('fuse_steps', False)
+        self._deferred = []
+        self._fused = {}
+        self._fused_members = {}
+        step_cache = parameters.get('step_cache', {})
+        self._step_cache = get_step_cache(step_cache['dir'], step_cache['max_size']) \
+            if step_cache.get('max_size') else None
+        self._cacheable = dict(cacheable or {})
+        self._request_parameters = parameters
+        self._data_root = parameters['data_root']
+        self._step_args = {}
+        self._step_inputs = {}
+        self._cache_keys = {}
+        self._script_digests = {}
+        self._resumable = set(resumable)
+
+    def add_listener(self, listener):
+        """
+        Adds a function that is called with an event dictionary whenever the state of a task or of the whole job
+        changes. Task events look like ``{'type': 'task', 'command': ..., 'status': ..., 'progress': ...}``,
+        job events like ``{'type': 'job', 'status': ...}``. Listeners are called from the monitor's threads.
+        Events that occurred before the first listener has been added are passed to it right away, as steps may
+        start as soon as the monitor has been created.
+        """
+        with self._listeners_lock:
+            self._listeners.append(listener)
+            held_events, self._held_events = self._held_events, None
+            for event in held_events or []:
+                self._call_listener(listener, event)
+
+    def _notify_listeners(self, event):
+        with self._listeners_lock:
+            if self._held_events is not None:
+                self._held_events.append(event)
+                return
+            for listener in self._listeners:
+                self._call_listener(listener, event)
+
+    @staticmethod
+    def _call_listener(listener, event):
+        try:
+            listener(event)
+        except Exception as e:
+            logging.warning(f'Could not notify listener about {event["type"]} event: {e}')
+
+    def _notify_task_listeners(self, command, status):
+        self._notify_listeners({'type': 'task', 'command': command, 'status': status,
+                                'progress': self.get_progress(command)})
+
+    def execute(self, call, inputs, outputs, parameters=[], **kwargs):
+        """
+        Adds a step to the workflow. Steps that depend on steps that are not done yet are held back and only
+        handed to the monitor's backlog once the last of these is done, so that the backlog scanned for mature
+        steps stays small regardless of the size of the workflow. A step with the call, parameters and outputs of
+        a step added before is left out, as the steps reading its outputs wait for the step added before.
+        """
+        if self._is_duplicate_step(call, inputs, outputs, parameters):
+            return
+        if self._fuse_steps and self._deferred is not None:
+            # chains can only be found once the workflow is complete
+            self._deferred.append((call, inputs, outputs, parameters, kwargs))
+            return
+        self._execute(call, inputs, outputs, parameters, **kwargs)
+
+    def _is_duplicate_step(self, call, inputs, outputs, parameters) -> bool:
+        step_key = (call, tuple(parameters), tuple(outputs))
+        if step_key not in self._step_inputs:
+            self._step_inputs[step_key] = set(inputs)
+            return False
+        if not self._step_inputs[step_key].issuperset(inputs):
+            # the step added before might start before the other inputs exist
+            logging.warning(f'Adding step {call} {" ".join(parameters)} again as it reads other inputs')
+            return False
+        logging.info(f'Leaving out repeated step {call} {" ".join(parameters)}')
+        return True
+
+    def _execute(self, call, inputs, outputs, parameters, **kwargs):
+        command = self._command_of(call, inputs, outputs, parameters)
+        self._step_args[command] = (call, inputs, outputs, parameters)
+        with self._graph_lock:
+            pending = self._graph.add_step(command, os.path.basename(call), inputs, outputs)
+            if pending > 0:
+                self._parked[command] = (call, inputs, outputs, parameters, kwargs)
+                return
+        PMonitor.execute(self, call, inputs, outputs, parameters=parameters, **kwargs)
+        self._submit_released_steps()
+
+    def execute_array(self, call, inputs, outputs, parameters, members):
+        """
+        Adds a step consisting of several members that only differ in their last parameters, e.g., one member per
+        tile. The step is scheduled, tracked and reported as a whole, its members run concurrently as far as the
+        limits of the step type permit. The step succeeds if all of its members succeed.
+
+        :param members: For each member, the parameters appended to *parameters*.
+        """
+        array_parameters = parameters + [f'array:{len(members)}']
+        command = self._command_of(call, inputs, outputs, array_parameters)
+        self._arrays[command] = [self._command_of(call, inputs, outputs, parameters + list(member))
+                                 for member in members]
+        self.execute(call, inputs, outputs, parameters=array_parameters)
+
+    def _execute_deferred_steps(self):
+        """
+        Adds the steps held back until the workflow is complete. Linear chains of steps are fused into single steps
+        that run the steps of the chain one after the other in one process.
+        """
+        deferred, self._deferred = self._deferred or [], None
+        steps = {}
+        graph = StepGraph()
+        for call, inputs, outputs, parameters, kwargs in deferred:
+            command = self._command_of(call, inputs, outputs, parameters)
+            steps[command] = (call, inputs, outputs, parameters, kwargs)
+            graph.add_step(command, os.path.basename(call), inputs, outputs)
+        # cacheable steps are kept apart, as their results are reused across jobs one by one
+        chains = [] if self._script else \
+            graph.get_linear_chains(lambda command: command not in self._arrays and len(steps[command][4]) == 0 and
+                                    (self._step_cache is None or
+                                     os.path.basename(steps[command][0]) not in self._cacheable))
+        chain_heads = {chain[0]: chain for chain in chains}
+        chained = set(command for chain in chains for command in chain)
+        for command, (call, inputs, outputs, parameters, kwargs) in steps.items():
+            if command in chain_heads:
+                self._execute_fused([steps[member] for member in chain_heads[command]])
+            elif command not in chained:
+                self._execute(call, inputs, outputs, parameters, **kwargs)
+
+    def _execute_fused(self, members):
+        chain_file = os.path.join(os.path.abspath(self._logdir), 'fused', f'{len(self._fused)}.json')
+        os.makedirs(os.path.dirname(chain_file), exist_ok=True)
+        with open(chain_file, 'w') as f:
+            json.dump({'steps': [{'argv': shlex.split(self._command_of(call, inputs, outputs, parameters))}
+                                 for call, inputs, outputs, parameters, _ in members]}, f)
+        produced = set(output for _, _, outputs, _, _ in members for output in outputs)
+        inputs = []
+        outputs = []
+        for _, member_inputs, member_outputs, _, _ in members:
+            inputs.extend(input for input in member_inputs if input not in produced and input not in inputs)
+            outputs.extend(output for output in member_outputs if output not in outputs)
+        step_types = [os.path.basename(call) for call, _, _, _, _ in members]
+        # the parameters of the first member follow the step types, so that the fused step can be named after them
+        parameters = [chain_file, f'fused:{"+".join(step_types)}'] + list(members[0][3])
+        self._fused[self._command_of(FUSED_STEP_CALL, inputs, outputs, parameters)] = step_types
+        self._execute(FUSED_STEP_CALL, inputs, outputs, parameters)
+
+    def _mark_step_done(self, command):
+        """
+        Marks a step as done and queues the held back steps that do not wait for other steps anymore.
+        May be called while holding the monitor's mutex.
+        """
+        with self._graph_lock:
+            for consumer in self._graph.mark_done(command):
+                if consumer in self._parked:
+                    self._released.append(self._parked.pop(consumer))
+
+    def _submit_released_steps(self):
+        """
+        Hands the queued steps to the monitor's backlog. Must not be called while holding the monitor's mutex.
+        """
+        while True:
+            with self._graph_lock:
+                if len(self._released) == 0:
+                    return
+                released = self._released
+                self._released = []
+            for call, inputs, outputs, parameters, kwargs in released:
+                PMonitor.execute(self, call, inputs, outputs, parameters=parameters, **kwargs)
+            with self._mutex:
+                self._sort_backlog()
+
+    def get_backlog(self):
+        """
+        Returns call, parameters, inputs and outputs of all steps that have not been started yet,
+        including those held back because they wait for other steps.
+        """
+        with self._mutex:
+            backlog = [(PMonitor.Args.get_call(r.args), PMonitor.Args.get_parameters(r.args),
+                        PMonitor.Args.get_inputs(r.args), PMonitor.Args.get_outputs(r.args)) for r in self._backlog]
+        return backlog + self._get_parked_steps()
+
+    def _get_parked_steps(self):
+        with self._graph_lock:
+            return [(call, parameters, inputs, outputs) for call, inputs, outputs, parameters, _ in
+                    list(self._parked.values()) + self._released]
+
+    def _command_of(self, call, inputs, outputs, parameters):
+        if self._script:
+            return '{0} {1} {2} {3} {4}'.format(self._path_of_call(self._script), call, ' '.join(parameters),
+                                                ' '.join(inputs), ' '.join(outputs))
+        return '{0} {1} {2} {3}'.format(self._path_of_call(call), ' '.join(parameters), ' '.join(inputs),
+                                        ' '.join(outputs))
+
+    def _command_of_request(self, request):
+        return self._command_of(PMonitor.Args.get_call(request.args), PMonitor.Args.get_inputs(request.args),
+                                PMonitor.Args.get_outputs(request.args), PMonitor.Args.get_parameters(request.args))
+
+    def _prioritise_backlog(self):
+        """
+        Ranks the steps by the estimated duration of the longest chain of steps depending on them and orders the
+        backlog accordingly, so that steps on the critical path are started first.
+        """
+        with self._graph_lock:
+            ranks = self._graph.get_critical_path_ranks(self._durations)
+        with self._mutex:
+            self._command_ranks = ranks
+            self._sort_backlog()
+
+    def _sort_backlog(self):
+        if len(self._command_ranks) > 0:
+            self._backlog.sort(key=lambda request: -self._command_ranks.get(self._command_of_request(request), 0))
 
     def _observe_step(self, call, inputs, outputs, parameters, code):
         if code > 0:
             return
-        if self._script:
-            command = '{0} {1} {2} {3} {4}'.format(self._path_of_call(self._script), call, ' '.join(parameters),
-                                                   ' '.join(inputs), ' '.join(outputs))
-        else:
-            command = '{0} {1} {2} {3}'.format(self._path_of_call(call), ' '.join(parameters), ' '.join(inputs),
-                                               ' '.join(outputs))
+        command = self._command_of(call, inputs, outputs, parameters)
         print(f'observing {command}')
         self._commands.add(command)
+        self._mark_step_done(command)
 
     def _run_step(self, task_id, host, command, output_paths, log_prefix, async_):
         """
-        Executes command on host, collects output paths if any, returns exit code
+        Executes command on host, collects output paths if any, returns exit code.
+        steps found in the step cache are not executed, their outputs are linked from the cache instead.
+        steps whose outputs are kept from a previous run of the job are not executed either.
         """
+        if command in self._resumable:
+            self._processor_logs.setdefault(command, TaskLogBuffer(self._task_log_lines)) \
+                .append('outputs kept from previous run of job\n')
+            return 0
+        cache_key = self._cache_key_of(command)
+        outputs = self._step_args[command][2] if cache_key is not None else []
+        if cache_key is not None and self._step_cache.restore(cache_key, outputs):
+            self._processor_logs.setdefault(command, TaskLogBuffer(self._task_log_lines)) \
+                .append(f'outputs linked from step cache entry {cache_key}\n')
+            return 0
+        code = self._run_step_processes(task_id, host, command, output_paths, log_prefix, async_)
+        if code == 0 and cache_key is not None:
+            try:
+                self._step_cache.store(cache_key, outputs)
+            except OSError as e:
+                logging.warning(f'Could not store outputs of {command} in step cache: {e}')
+        return code
+
+    def _cache_key_of(self, command):
+        """
+        Returns the key of a step in the step cache, or None if its results are not reused. The key is derived from
+        the script of the step and its content, the request sections it reads, its parameters and outputs relative
+        to the job's directory, and the keys of the steps producing its inputs. Steps reading outputs of steps that
+        are not cached are not cached either.
+        """
+        if self._step_cache is None or command in self._fused or command not in self._step_args:
+            return None
+        if command in self._cache_keys:
+            return self._cache_keys[command]
+        call, inputs, outputs, parameters = self._step_args[command]
+        step_type = os.path.basename(call)
+        script_digest = self._script_digest(call) if step_type in self._cacheable else None
+        cache_key = None
+        if script_digest is not None:
+            input_keys = []
+            for input in inputs:
+                with self._graph_lock:
+                    producers = self._graph.get_producers(input)
+                producer_keys = [self._cache_key_of(producer) for producer in producers]
+                if None in producer_keys:
+                    input_keys = None
+                    break
+                input_keys.append(producer_keys if len(producer_keys) > 0 else self._relative_to_job(input))
+            if input_keys is not None:
+                sections = {section: self._request_section(section) for section in self._cacheable[step_type]}
+                request_file = self._request_parameters.get('requestFile')
+                description = [step_type, script_digest, sections, input_keys,
+                               ['{request}' if parameter == request_file else self._relative_to_job(parameter)
+                                for parameter in parameters],
+                               [self._relative_to_job(output) for output in outputs]]
+                cache_key = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+        self._cache_keys[command] = cache_key
+        return cache_key
+
+    def _script_digest(self, call):
+        if call not in self._script_digests:
+            script = shutil.which(call)
+            digest = None
+            if script is not None:
+                with open(script, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            self._script_digests[call] = digest
+        return self._script_digests[call]
+
+    def _request_section(self, section):
+        value = self._request_parameters
+        for name in section.split('.'):
+            if not isinstance(value, dict) or name not in value:
+                return None
+            value = value[name]
+        return json.loads(self._relative_to_job(json.dumps(value, sort_keys=True, default=str)))
+
+    def _relative_to_job(self, text):
+        return text.replace(self._data_root, '{data_root}')
+
+    def _run_step_processes(self, task_id, host, command, output_paths, log_prefix, async_):
+        if command in self._arrays:
+            return self._run_array_step(task_id, host, command, output_paths, log_prefix)
         wd = self._prepare_working_dir(task_id)
-        process = PMonitor._start_processor(command, host, wd)
-        self._pids[command] = process.pid
-        self._trace_processor_output(output_paths, process, task_id, command, wd, log_prefix, async_)
-        process.stdout.close()
-        code = process.wait()
+        code = self._run_processor(task_id, host, wd, command, None, output_paths, log_prefix, async_)
+        if code is None:
+            self._to_be_cancelled.append(command)
+            return -1
+        return code
+
+    def _run_array_step(self, task_id, host, command, output_paths, log_prefix):
+        """
+        Executes the members of an array step, returns the exit code of the first failed member or 0
+        """
+        member_commands = self._arrays[command]
+        codes = {}
+        wd = self._prepare_working_dir(task_id)
+        # members append to the trace file
+        open(self._trace_file_of(task_id, wd, log_prefix), 'w').close()
+        self._notify_task_listeners(command, 'running')
+
+        def _run_member(member):
+            if self._cancelling or any(code != 0 for code in list(codes.values())):
+                return
+            code = self._run_processor(task_id, host, wd, command, member, output_paths, log_prefix, False)
+            if code is not None:
+                codes[member] = code
+            if code == 0:
+                self._tasks_progress[f'{command}#{member}'] = 100
+                self._tasks_progress[command] = self._get_array_progress(command)
+                self._notify_task_listeners(command, 'running')
+
+        max_workers = max(min(len(member_commands), self._resource_pool.get_type_limit(self._step_type(command))), 1)
+        start_time = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(_run_member, member) for member in range(len(member_commands))]:
+                future.result()
+        self._step_wall_times[command] = time.monotonic() - start_time
+        failed_codes = [code for member, code in sorted(codes.items()) if code != 0]
+        if len(failed_codes) > 0:
+            return failed_codes[0]
+        if len(codes) < len(member_commands):
+            self._to_be_cancelled.append(command)
+            return -1
+        return 0
+
+    def _run_processor(self, task_id, host, wd, command, member, output_paths, log_prefix, async_):
+        """
+        Executes command, or the member of an array step if member is given, once a slot of the resource pool is
+        available. Returns the exit code, or None if the step has been cancelled before.
+        """
+        process_command = command if member is None else self._arrays[command][member]
+        step_type = self._step_type(command)
+        if not self._resource_pool.acquire(step_type, lambda: self._cancelling,
+                                           priority=self._command_ranks.get(command, 0)):
+            return None
+        try:
+            process, progress_fd = self._start_step_process(process_command, host, wd)
+            self._pids[process_command] = process.pid
+            if member is None:
+                self._notify_task_listeners(command, 'running')
+            code, usage = self._trace_processor_output(output_paths, process, task_id, command, wd, log_prefix, async_,
+                                                       member=member, progress_fd=progress_fd)
+            self._step_usages.setdefault(command, []).append(usage)
+            # the peak of a fused step is that of all of its members, not of the one it is scheduled as
+            if code == 0 and usage.max_rss is not None and command not in self._fused:
+                self._resource_pool.record_peak_memory(step_type, usage.max_rss)
+        finally:
+            self._resource_pool.release(step_type)
         return code
 
-    def _trace_processor_output(self, output_paths, process, task_id, command, wd, log_prefix, async_):
+    def _start_step_process(self, command, host, wd):
+        """
+        Starts a step. Local steps get a pipe to report their progress through, the write end is passed to them
+        in MULTIPLY_PROGRESS_FD. Local Python steps of the warm step types are forked from the warm worker server.
+        Returns the process and the read end of the pipe, if any.
+        """
+        if host != 'localhost':
+            return PMonitor._start_processor(command, host, wd), None
+        progress_read, progress_write = os.pipe()
+        try:
+            process = self._start_warm_step_process(command, wd, progress_write)
+            if process is None:
+                process = subprocess.Popen(command, shell=True, cwd=wd, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT, pass_fds=(progress_write,),
+                                           env=dict(os.environ, MULTIPLY_PROGRESS_FD=str(progress_write)))
+        except Exception:
+            os.close(progress_read)
+            raise
+        finally:
+            os.close(progress_write)
+        return process, progress_read
+
+    def _start_warm_step_process(self, command, wd, progress_fd):
+        if self._warm_worker_server is None or self._script or self._step_type(command) not in self._warm_step_types:
+            return None
+        argv = shlex.split(command)
+        script = shutil.which(argv[0])
+        if script is None or not script.endswith('.py'):
+            return None
+        try:
+            return self._warm_worker_server.start([script] + argv[1:], os.path.abspath(wd or '.'), os.environ,
+                                                  progress_fd=progress_fd)
+        except OSError as e:
+            logging.warning(f'Could not start {argv[0]} in a warm worker, starting a new interpreter: {e}')
+            return None
+
+    def _step_type(self, command):
+        if command in self._fused:
+            # fused steps are limited like the member that needs the most memory
+            return max(self._fused[command], key=self._resource_pool.estimate_memory)
+        step_parts = command.split(' ')
+        call = step_parts[1] if self._script else step_parts[0]
+        return os.path.basename(call)
+
+    def _trace_processor_output(self, output_paths, process, task_id, command, wd, log_prefix, async_, member=None,
+                                progress_fd=None):
         """
         traces processor output, recognises 'output=' lines, writes all lines to trace file in working dir.
         for async calls reads external ID from stdout.
+        the members of an array step share the step's trace file and logs, their lines are prefixed by their index.
+        once a step reports through its progress channel, its progress lines are no longer parsed.
+        the lines of the members of a fused step are prefixed by their step types.
+        output is read by the process supervisor, waits for the process to terminate and returns its exit code and
+        the resources it has used.
         """
-        if self._cache is None or self._logdir != '.':
-            trace = open('{0}/{1}-{2:04d}.out'.format(self._logdir, log_prefix, task_id), 'w')
-        else:
-            trace = open('{0}/{1}-{2:04d}.out'.format(wd, log_prefix, task_id), 'w')
-        line = None
+        trace_file = self._trace_file_of(task_id, wd, log_prefix)
+        self._add_trace_file(command, os.path.abspath(trace_file))
+        progress_key = command if member is None else f'{command}#{member}'
+        line_prefix = '' if member is None else f'[{member}] '
         if command not in self._processor_logs:
-            self._processor_logs[command] = []
-        for l in process.stdout:
-            line = l.decode()
+            self._processor_logs[command] = TaskLogBuffer(self._task_log_lines)
+
+        def _on_line(line):
+            if progress_key in self._step_progress and command not in self._fused:
+                # the progress of steps reporting through their progress channel is not parsed from their lines
+                if line.startswith('output='):
+                    output_paths.append(line[7:].strip())
+                elif not line.startswith(_PROGRESS_LINE_PREFIXES):
+                    self._processor_logs[command].append(line_prefix + line)
+                return line_prefix + line
+            progress = self.get_progress(command)
+            prefix = line_prefix
+            if command in self._fused_members:
+                prefix = f'[{self._fused[command][self._fused_members[command]]}] '
             if line.startswith('output='):
                 output_paths.append(line[7:].strip())
             elif line.startswith('INFO:ScriptProgress'):
-                script_progress = line.split(':')[-1].split('-')
-                self._lower_script_progress[command] = int(script_progress[0])
-                self._upper_script_progress[command] = int(script_progress[1])
-                self._tasks_progress[command] = int(script_progress[0])
+                if progress_key not in self._step_progress:
+                    script_progress = line.split(':')[-1].split('-')
+                    self._lower_script_progress[progress_key] = int(script_progress[0])
+                    self._upper_script_progress[progress_key] = int(script_progress[1])
+                    self._tasks_progress[progress_key] = int(script_progress[0])
+            elif line.startswith('INFO:FusedStep') and command in self._fused:
+                # the next member of a fused step starts, its progress counts for its share of the step
+                self._fused_members[command] = int(line.split(':')[-1])
+                self._tasks_progress[command] = 0
+                for member_progress in [self._step_progress, self._lower_script_progress,
+                                        self._upper_script_progress]:
+                    member_progress.pop(command, None)
             elif line.startswith('INFO:ComponentProgress'):
                 component_progress = line.split(':')[-1]
-                if command in self._upper_script_progress and command in self._lower_script_progress:
-                    progress_diff = float(self._upper_script_progress[command] - self._lower_script_progress[command])
+                if progress_key in self._upper_script_progress and progress_key in self._lower_script_progress \
+                        and progress_key not in self._step_progress:
+                    progress_diff = float(self._upper_script_progress[progress_key] -
+                                          self._lower_script_progress[progress_key])
                     relative_progress = int((float(component_progress) * progress_diff) / 100.0)
-                    self._tasks_progress[command] = self._lower_script_progress[command] + relative_progress
+                    self._tasks_progress[progress_key] = self._lower_script_progress[progress_key] + relative_progress
             else:
-                self._processor_logs[command].append(line)
-            trace.write(line)
-            trace.flush()
-        trace.close()
+                self._processor_logs[command].append(prefix + line)
+            if member is not None:
+                self._tasks_progress[command] = self._get_array_progress(command)
+            if self.get_progress(command) != progress:
+                self._notify_task_listeners(command, 'running')
+            return prefix + line
+
+        def _on_progress(message):
+            progress = self.get_progress(command)
+            step_progress = self._step_progress.setdefault(progress_key, StepProgress())
+            step_progress.update(message)
+            if step_progress.progress is not None:
+                self._tasks_progress[progress_key] = step_progress.progress
+            if member is not None:
+                self._tasks_progress[command] = self._get_array_progress(command)
+            if self.get_progress(command) != progress:
+                self._notify_task_listeners(command, 'running')
+
+        start_time = time.monotonic()
+        supervision = get_process_supervisor().supervise(process, trace_file, _on_line, append=member is not None,
+                                                         progress_fd=progress_fd, on_progress=_on_progress)
+        try:
+            code, usage, line = supervision.result()
+        except Exception as e:
+            # the supervisor has killed the process
+            self._processor_logs[command].append(f'{line_prefix}could not supervise step: {e!r}\n')
+            return 1, ProcessUsage(time.monotonic() - start_time, None, None, None, None, None)
         if async_ and line:
             # assumption that last line contains external ID, with stderr mixed with stdout
             output_paths[:] = []
             output_paths.append(line.strip())
+        return code, usage
+
+    def _add_trace_file(self, command, trace_file):
+        """
+        Remembers the file the output of a step is traced to. The file is also added to the trace index, if any,
+        so that the output can still be found when the monitor is gone.
+        """
+        with self._trace_index_lock:
+            if self._trace_files.get(command) == trace_file:
+                return
+            self._trace_files[command] = trace_file
+            if self._trace_index is None:
+                return
+            try:
+                with open(self._trace_index, 'a') as index:
+                    index.write(json.dumps({'command': command, 'file': trace_file}) + '\n')
+            except OSError as e:
+                logging.warning(f'Could not add trace file of {command} to index: {e}')
+
+    def _trace_file_of(self, task_id, wd, log_prefix):
+        if self._cache is None or self._logdir != '.':
+            return '{0}/{1}-{2:04d}.out'.format(self._logdir, log_prefix, task_id)
+        return '{0}/{1}-{2:04d}.out'.format(wd, log_prefix, task_id)
+
+    def _get_array_progress(self, command):
+        num_members = len(self._arrays[command])
+        return int(sum(self._tasks_progress.get(f'{command}#{member}', 0) for member in range(num_members)) /
+                   num_members)
 
     def get_progress(self, command):
-        if command in self._tasks_progress:
-            return self._tasks_progress[command]
-        return 0
+        progress = self._tasks_progress.get(command, 0)
+        if command in self._fused_members:
+            return int((self._fused_members[command] * 100 + progress) / len(self._fused[command]))
+        return progress
+
+    def get_progress_details(self, command):
+        """
+        Returns the phase, the number of items processed, the throughput and the estimated remaining time in seconds
+        of a step, as far as the step reports them through its progress channel.
+        """
+        if command in self._step_progress:
+            return self._step_progress[command].to_dict()
+        return {}
 
     def get_logs(self, command):
+        """
+        Returns the last log lines of a step. All lines can be read from its trace file.
+        """
         if command in self._processor_logs:
-            return self._processor_logs[command]
+            return self._processor_logs[command].get_lines()
         return []
 
+    def get_log_count(self, command):
+        """
+        Returns the number of log lines a step has written in total.
+        """
+        if command in self._processor_logs:
+            return len(self._processor_logs[command])
+        return 0
+
+    def get_step_usage(self, command):
+        """
+        Returns the wall time, the user and system CPU time in seconds, the peak memory in GB and the bytes read and
+        written of a step, as far as known. CPU times and bytes of array steps are summed up over their members.
+        """
+        usages = list(self._step_usages.get(command, []))
+        if len(usages) == 0:
+            return {}
+
+        def _total(values):
+            values = [value for value in values if value is not None]
+            return sum(values) if len(values) > 0 else None
+
+        max_rss = [usage.max_rss for usage in usages if usage.max_rss is not None]
+        step_usage = {'wallTime': self._step_wall_times.get(command, max(usage.wall_time for usage in usages)),
+                      'userTime': _total(usage.user_time for usage in usages),
+                      'systemTime': _total(usage.system_time for usage in usages),
+                      'maxRss': max(max_rss) if len(max_rss) > 0 else None,
+                      'readBytes': _total(usage.read_bytes for usage in usages),
+                      'writeBytes': _total(usage.write_bytes for usage in usages)}
+        return {key: value for key, value in step_usage.items() if value is not None}
+
+    def _write_usage_report(self):
+        """
+        Writes the resources used by the steps to resource_usage.json and resource_usage.csv in the log directory.
+        """
+        steps = []
+        for command in list(self._step_usages):
+            status = 'succeeded' if command in self._commands else 'failed' if command in self._failed else \
+                'cancelled' if command in self._cancelled else 'running'
+            steps.append(dict(step=command.strip(), type=self._step_type(command), status=status,
+                              **self.get_step_usage(command)))
+        columns = ['step', 'type', 'status', 'wallTime', 'userTime', 'systemTime', 'maxRss', 'readBytes', 'writeBytes']
+        try:
+            with open(os.path.join(self._logdir, 'resource_usage.json'), 'w') as report:
+                json.dump(steps, report, indent=2)
+            with open(os.path.join(self._logdir, 'resource_usage.csv'), 'w', newline='') as report:
+                writer = csv.DictWriter(report, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(steps)
+        except OSError as e:
+            logging.warning(f'Could not write resource usage report: {e}')
+
+    def get_trace_files(self):
+        """
+        Returns a dictionary that maps the commands that have been started to the files their output is traced to.
+        """
+        return dict(self._trace_files)
+
     def run(self):
+        self._execute_deferred_steps()
+        self._submit_released_steps()
+        self._prioritise_backlog()
+        self._notify_listeners({'type': 'job', 'status': 'running'})
         code = self.wait_for_completion()
         if len(self._cancelled) > 0:
-            return -1
+            code = -1
+        # the logs of a finished job are only read occasionally
+        for task_logs in list(self._processor_logs.values()):
+            task_logs.compress()
+        self._write_usage_report()
+        self._output_manifest.rewrite([(command, self._step_args[command][1], self._step_args[command][2])
+                                       for command in list(self._commands) if command in self._step_args])
+        self._notify_listeners({'type': 'job', 'status': 'succeeded' if code == 0 else
+                                'cancelled' if code == -1 else 'failed'})
         return code
 
     def cancel(self):
+        self._cancelling = True
+        self._resource_pool.wake()
         for pid in self._pids:
             try:
                 os.kill(self._pids[pid], signal.SIGTERM)
@@ -113,10 +758,11 @@ class MultiplyMonitor(PMonitor):
                 continue
 
     def _write_status(self, with_backlog=False):
+        parked_steps = self._get_parked_steps()
         self._status.seek(0)
         self._status.write('{0} created, {1} running, {2} backlog, {3} processed, {4} failed, {5} cancelled\n'. \
-                           format(self._created, len(self._running), len(self._backlog), self._processed,
-                                  len(self._failed), len(self._cancelled)))
+                           format(self._created, len(self._running), len(self._backlog) + len(parked_steps),
+                                  self._processed, len(self._failed), len(self._cancelled)))
 
         for l in self._failed:
             self._status.write('f {0}\n'.format(l))
@@ -135,6 +781,9 @@ class MultiplyMonitor(PMonitor):
                                                                 ' '.join(PMonitor.Args.get_parameters(r.args)),
                                                                 ' '.join(PMonitor.Args.get_inputs(r.args)),
                                                                 ' '.join(PMonitor.Args.get_outputs(r.args))))
+            for call, parameters, inputs, outputs in parked_steps:
+                self._status.write('b {0} {1} {2} {3}\n'.format(call, ' '.join(parameters), ' '.join(inputs),
+                                                                ' '.join(outputs)))
         self._status.truncate()
         self._status.flush()
 
@@ -142,18 +791,32 @@ class MultiplyMonitor(PMonitor):
         """
         releases host and type resources, updates report, schedules mature steps, handles failure
         """
+        if code == 0:
+            # recorded before the report, so that a step is only resumed with the outputs it has written
+            if command in self._step_args:
+                _, step_inputs, step_outputs, _ = self._step_args[command]
+                self._output_manifest.record(command, step_inputs, step_outputs)
+            # hand over the steps waiting for this one while it still counts as running
+            self._mark_step_done(command)
+            self._submit_released_steps()
         with self._mutex:
             self._release_constraint(call, host, typeOnly=typeOnly)
             self._running.pop(command)
             if code == 0:
+                self._commands.add(command)
                 self._report.write(command + '\n')
                 self._report_and_bind_outputs(outputs, output_paths)
                 self._report.flush()
                 self._processed += 1
+                self._tasks_progress[command] = 100
+                status = 'succeeded'
             elif command in self._to_be_cancelled:
                 self._cancelled.append(command)
                 sys.__stderr__.write('cancelled {0}\n'.format(command))
+                status = 'cancelled'
             else:
                 self._failed.append(command)
                 sys.__stderr__.write('failed {0}\n'.format(command))
+                status = 'failed'
             self._check_for_mature_tasks()
+        self._notify_task_listeners(command, status)
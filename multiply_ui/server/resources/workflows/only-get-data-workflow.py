@@ -1,5 +1,5 @@
 import datetime
-from .multiply_workflow import MultiplyMonitor
+from .multiply_workflow import CACHEABLE_STEPS, MultiplyMonitor
 
 
 class OnlyGetData(MultiplyMonitor):
@@ -7,7 +7,8 @@ class OnlyGetData(MultiplyMonitor):
     def __init__(self, parameters):
         MultiplyMonitor.__init__(self,
                                  parameters,
-                                 types=[('data_access_get_static.py', 1), ('get_data_for_s2_preprocessing.py', 2)])
+                                 types=[('data_access_get_static.py', 1), ('get_data_for_s2_preprocessing.py', 2)],
+                                 cacheable=CACHEABLE_STEPS)
                           # ['none', parameters['data_root']],
                           # request=parameters['requestName'],
                           # hosts=[('localhost', 10)],
@@ -1,12 +1,14 @@
 import datetime
-from .multiply_workflow import MultiplyMonitor
+from .multiply_workflow import CACHEABLE_STEPS, MultiplyMonitor
 
 class OnlyGetPriors(MultiplyMonitor):
 
     def __init__(self, parameters):
         MultiplyMonitor.__init__(self,
                                  parameters,
-                                 types=[('retrieve_s2_priors.py', 2)])
+                                 types=[('retrieve_s2_priors.py', 2)],
+                                 profiles={'retrieve_s2_priors.py': (1, 2)},
+                                 cacheable=CACHEABLE_STEPS)
         self._data_root = parameters['data_root']
         self._request_file = parameters['requestFile']
         self._start = datetime.datetime.strptime(str(parameters['General']['start_time']), '%Y-%m-%d')
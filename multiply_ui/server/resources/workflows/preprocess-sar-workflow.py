@@ -7,7 +7,8 @@ class PreprocessSar(MultiplyMonitor):
     def __init__(self, parameters):
         MultiplyMonitor.__init__(self,
                                  parameters,
-                                 types=[('get_data_for_s1_preprocessing.py', 2), ('preprocess_s1.py', 2)])
+                                 types=[('get_data_for_s1_preprocessing.py', 2), ('preprocess_s1.py', 2)],
+                                 profiles={'preprocess_s1.py': (4, 12)})
         self._data_root = parameters['data_root']
         self._request_file = parameters['requestFile']
         self._start = datetime.datetime.strptime(str(parameters['General']['start_time']), '%Y-%m-%d')
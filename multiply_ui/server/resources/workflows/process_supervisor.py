@@ -0,0 +1,287 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import selectors
+import signal
+import threading
+import time
+
+# wall time, user and system CPU time in seconds, peak memory in GB and the bytes read from and written to storage,
+# which are None where /proc is not available
+ProcessUsage = collections.namedtuple('ProcessUsage', ['wall_time', 'user_time', 'system_time', 'max_rss',
+                                                       'read_bytes', 'write_bytes'])
+
+
+class _SupervisedProcess:
+
+    def __init__(self, process, trace_path, append, on_line, progress_fd, on_progress):
+        self.process = process
+        self.trace = open(trace_path, 'a' if append else 'w')
+        self.on_line = on_line
+        self.progress_fd = progress_fd
+        self.on_progress = on_progress
+        self.partial_message = b''
+        self.start_time = time.monotonic()
+        self.io_bytes = (None, None)
+        self.future = concurrent.futures.Future()
+        self.partial_line = b''
+        self.pending_lines = []
+        self.last_line = None
+
+
+class ProcessSupervisor:
+    """
+    Supervises the processes of workflow steps on a single thread. The output pipes of all processes are multiplexed
+    with a selector, each complete line is passed to a callback of the process and written to its trace file.
+    Trace files are written in batches at most every *flush_interval* seconds. Once a process has closed its output,
+    it is reaped with ``os.wait4``, or the ``wait4`` method of the process if it has one, and the future returned for it
+    is resolved. If supervising a process fails unexpectedly, the process is killed and its future fails, while the
+    other processes are supervised on.
+
+    :param flush_interval: The maximum time in seconds lines are buffered before they are written to trace files.
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._registrations = []
+        self._selector = None
+        self._thread = None
+        self._wake_read, self._wake_write = None, None
+        self._closed = []
+
+    def supervise(self, process, trace_path: str, on_line, append: bool = False, progress_fd: int = None,
+                  on_progress=None) -> concurrent.futures.Future:
+        """
+        Starts supervising a process whose stdout is a pipe.
+
+        :param process: A ``subprocess.Popen``.
+        :param trace_path: The file to write the output of the process to.
+        :param on_line: Called with each decoded line of output. Returns the text to write to the trace file,
+            or None to write the line unchanged.
+        :param append: Whether to append to the trace file.
+        :param progress_fd: The read end of a pipe the process writes JSON progress messages to, one per line.
+            The supervisor takes ownership of it.
+        :param on_progress: Called with each progress message as dictionary.
+        :return: A future resolved to the exit code of the process, its ``ProcessUsage`` and its last line of output.
+        """
+        supervised = _SupervisedProcess(process, trace_path, append, on_line, progress_fd, on_progress)
+        with self._lock:
+            self._ensure_started()
+            self._registrations.append(supervised)
+        os.write(self._wake_write, b'x')
+        return supervised.future
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_read, self._wake_write = os.pipe()
+        self._selector.register(self._wake_read, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name='mui-process-supervisor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        supervised_processes = set()
+        last_flush = time.monotonic()
+        while True:
+            try:
+                last_flush = self._supervise(supervised_processes, last_flush)
+            except Exception:
+                # the thread must not end, as all steps of all jobs wait for it
+                logging.exception('Unexpected error while supervising processes')
+                time.sleep(self._flush_interval)
+
+    def _supervise(self, supervised_processes, last_flush: float) -> float:
+        timeout = 0.1 if len(self._closed) > 0 else self._flush_interval
+        for key, _ in self._selector.select(timeout):
+            if key.data is None:
+                os.read(self._wake_read, 4096)
+                with self._lock:
+                    registrations, self._registrations = self._registrations, []
+                for supervised in registrations:
+                    supervised_processes.add(supervised)
+                    self._guarded(self._register, supervised, supervised_processes)
+            elif key.fd == key.data.progress_fd:
+                self._guarded(self._read_progress, key.data, supervised_processes)
+            else:
+                self._guarded(self._read, key.data, supervised_processes)
+        now = time.monotonic()
+        if now - last_flush >= self._flush_interval:
+            for supervised in list(supervised_processes):
+                self._guarded(self._flush_and_sample, supervised, supervised_processes)
+            last_flush = now
+        for supervised in list(self._closed):
+            if self._guarded(self._reap, supervised, supervised_processes) is not False:
+                if supervised in self._closed:
+                    self._closed.remove(supervised)
+                supervised_processes.discard(supervised)
+        return last_flush
+
+    def _guarded(self, operation, supervised: _SupervisedProcess, supervised_processes):
+        """
+        Performs an operation on a supervised process. If it fails, the process is given up.
+        """
+        try:
+            return operation(supervised)
+        except Exception as e:
+            logging.warning(f'Could not supervise process {supervised.process.pid}: {e!r}')
+            self._give_up(supervised, e)
+            supervised_processes.discard(supervised)
+            return None
+
+    def _register(self, supervised: _SupervisedProcess):
+        self._selector.register(supervised.process.stdout.fileno(), selectors.EVENT_READ, supervised)
+        if supervised.progress_fd is not None:
+            os.set_blocking(supervised.progress_fd, False)
+            self._selector.register(supervised.progress_fd, selectors.EVENT_READ, supervised)
+
+    def _flush_and_sample(self, supervised: _SupervisedProcess):
+        self._flush(supervised)
+        if supervised.process.returncode is None:
+            self._sample_io(supervised)
+
+    def _give_up(self, supervised: _SupervisedProcess, error: Exception):
+        for cleanup in [lambda: self._unregister(supervised.process.stdout.fileno(), supervised),
+                        lambda: self._unregister(supervised.progress_fd, supervised),
+                        lambda: supervised.progress_fd is not None and os.close(supervised.progress_fd),
+                        supervised.trace.close,
+                        lambda: supervised.process.returncode is None and os.kill(supervised.process.pid,
+                                                                                    signal.SIGKILL)]:
+            try:
+                cleanup()
+            except Exception:
+                pass
+        supervised.progress_fd = None
+        if supervised in self._closed:
+            self._closed.remove(supervised)
+        if not supervised.future.done():
+            supervised.future.set_exception(error)
+
+    def _unregister(self, fd, supervised: _SupervisedProcess):
+        if fd is not None and self._selector.get_map().get(fd) is not None and \
+                self._selector.get_map()[fd].data is supervised:
+            self._selector.unregister(fd)
+
+    def _read(self, supervised: _SupervisedProcess):
+        fd = supervised.process.stdout.fileno()
+        try:
+            data = os.read(fd, 65536)
+        except OSError as e:
+            logging.warning(f'Could not read output of process {supervised.process.pid}: {e}')
+            data = b''
+        if len(data) == 0:
+            self._selector.unregister(fd)
+            self._sample_io(supervised)
+            if len(supervised.partial_line) > 0:
+                self._handle_line(supervised, supervised.partial_line)
+                supervised.partial_line = b''
+            self._flush(supervised)
+            supervised.trace.close()
+            self._closed.append(supervised)
+            return
+        lines = (supervised.partial_line + data).split(b'\n')
+        supervised.partial_line = lines.pop()
+        for line in lines:
+            self._handle_line(supervised, line + b'\n')
+
+    def _read_progress(self, supervised: _SupervisedProcess) -> bool:
+        try:
+            data = os.read(supervised.progress_fd, 65536)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            logging.warning(f'Could not read progress of process {supervised.process.pid}: {e}')
+            data = b''
+        if len(data) == 0:
+            self._close_progress(supervised)
+            return False
+        messages = (supervised.partial_message + data).split(b'\n')
+        supervised.partial_message = messages.pop()
+        for message in messages:
+            if len(message.strip()) == 0:
+                continue
+            try:
+                supervised.on_progress(json.loads(message.decode(errors='replace')))
+            except Exception as e:
+                logging.warning(f'Could not handle progress of process {supervised.process.pid}: {e}')
+        return True
+
+    def _close_progress(self, supervised: _SupervisedProcess):
+        if supervised.progress_fd is None:
+            return
+        self._selector.unregister(supervised.progress_fd)
+        os.close(supervised.progress_fd)
+        supervised.progress_fd = None
+
+    def _handle_line(self, supervised: _SupervisedProcess, line: bytes):
+        text = line.decode(errors='replace')
+        supervised.last_line = text
+        try:
+            traced_text = supervised.on_line(text)
+        except Exception as e:
+            logging.warning(f'Could not handle output of process {supervised.process.pid}: {e}')
+            traced_text = None
+        supervised.pending_lines.append(text if traced_text is None else traced_text)
+
+    @staticmethod
+    def _sample_io(supervised: _SupervisedProcess):
+        # /proc/<pid>/io is gone once the process is reaped, so the last sample before is used
+        try:
+            with open(f'/proc/{supervised.process.pid}/io') as io_file:
+                counters = dict(line.split(':', 1) for line in io_file.read().splitlines() if ':' in line)
+            supervised.io_bytes = (int(counters['read_bytes']), int(counters['write_bytes']))
+        except (OSError, KeyError, ValueError):
+            pass
+
+    @staticmethod
+    def _flush(supervised: _SupervisedProcess):
+        if len(supervised.pending_lines) == 0 or supervised.trace.closed:
+            return
+        supervised.trace.write(''.join(supervised.pending_lines))
+        supervised.trace.flush()
+        supervised.pending_lines = []
+
+    def _reap(self, supervised: _SupervisedProcess) -> bool:
+        process = supervised.process
+        try:
+            if hasattr(process, 'wait4'):
+                # processes that are not children of this process report their exit status themselves
+                pid, status, rusage = process.wait4(os.WNOHANG)
+            else:
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        except ChildProcessError:
+            # reaped elsewhere
+            self._close_progress(supervised)
+            usage = ProcessUsage(time.monotonic() - supervised.start_time, None, None, None, *supervised.io_bytes)
+            supervised.future.set_result((process.returncode if process.returncode is not None else -1, usage,
+                                          supervised.last_line))
+            return True
+        if pid == 0:
+            return False
+        # the process is gone, so whatever progress it has written is already in the pipe
+        while supervised.progress_fd is not None and self._read_progress(supervised):
+            pass
+        self._close_progress(supervised)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        process.stdout.close()
+        # ru_maxrss is given in kilobytes
+        usage = ProcessUsage(time.monotonic() - supervised.start_time, rusage.ru_utime, rusage.ru_stime,
+                             rusage.ru_maxrss / (1024 * 1024), *supervised.io_bytes)
+        supervised.future.set_result((process.returncode, usage, supervised.last_line))
+        return True
+
+
+_PROCESS_SUPERVISOR = ProcessSupervisor()
+
+
+def get_process_supervisor() -> ProcessSupervisor:
+    """
+    Returns the process supervisor shared by all monitors of this process.
+    """
+    return _PROCESS_SUPERVISOR
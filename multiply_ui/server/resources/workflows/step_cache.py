@@ -0,0 +1,181 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+"""
+
+
+def _link_file(source: str, target: str):
+    _remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        # other file system or no hard links supported
+        shutil.copy2(source, target)
+
+
+def _copy_link(source: str, target: str):
+    _remove(target)
+    os.symlink(os.readlink(source), target)
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _link_tree(source: str, target: str) -> int:
+    """
+    Hard links the file or the files in the directory *source* to *target*. Symbolic links are recreated as symbolic
+    links with the same targets, as steps tell them from the files they point to. Returns the number of bytes linked.
+    """
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    if os.path.islink(source):
+        _copy_link(source, target)
+        return 0
+    if os.path.isfile(source):
+        _link_file(source, target)
+        return os.path.getsize(source)
+    size = 0
+    for directory, sub_directories, files in os.walk(source):
+        target_directory = os.path.join(target, os.path.relpath(directory, source))
+        os.makedirs(target_directory, exist_ok=True)
+        for name in sub_directories + files:
+            path = os.path.join(directory, name)
+            if os.path.islink(path):
+                _copy_link(path, os.path.join(target_directory, name))
+            elif os.path.isfile(path):
+                _link_file(path, os.path.join(target_directory, name))
+                size += os.path.getsize(path)
+    return size
+
+
+def _has_dangling_links(path: str) -> bool:
+    for directory, sub_directories, files in os.walk(path):
+        for name in sub_directories + files:
+            link = os.path.join(directory, name)
+            if os.path.islink(link) and not os.path.exists(link):
+                return True
+    return False
+
+
+class StepCache:
+    """
+    A store of the outputs of workflow steps that is shared by all jobs. Entries are addressed by keys that identify
+    what a step computes, so that a step with the key of an entry can be satisfied from the entry instead of being run.
+    Outputs are hard linked into the store and back, or copied where hard links are not possible, symbolic links are
+    kept as such. Once the files of all entries exceed *max_size* bytes, the least recently used entries are removed.
+
+    :param root: The directory of the store.
+    :param max_size: The maximum size of the store in bytes.
+    :param clock: A function returning the current time in seconds since the epoch.
+    """
+
+    def __init__(self, root: str, max_size: int, clock=time.time):
+        self._root = root
+        self._max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'entries'), exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self._root, 'entries', key)
+
+    def restore(self, key: str, outputs) -> bool:
+        """
+        Links the outputs of the entry *key* to the paths *outputs*, in the order they have been stored.
+
+        :return: Whether there is such an entry.
+        """
+        with self._lock:
+            with self._connection:
+                cursor = self._connection.execute('UPDATE entries SET used = ? WHERE key = ?', (self._clock(), key))
+            if cursor.rowcount == 0 or not os.path.isdir(self._entry_dir(key)):
+                return False
+            if _has_dangling_links(self._entry_dir(key)):
+                # the files linked to have been removed from the data store
+                self._remove_entry(key)
+                return False
+            for index, output in enumerate(outputs):
+                cached_output = os.path.join(self._entry_dir(key), str(index))
+                if os.path.lexists(cached_output):
+                    _link_tree(cached_output, output)
+            return True
+
+    def store(self, key: str, outputs):
+        """
+        Stores the paths *outputs* of a step as entry *key*. Outputs that do not exist are left out.
+        """
+        with self._lock:
+            entry_dir = self._entry_dir(key)
+            if os.path.isdir(entry_dir):
+                return
+            temp_dir = f'{entry_dir}.{os.getpid()}.tmp'
+            size = 0
+            try:
+                os.makedirs(temp_dir)
+                for index, output in enumerate(outputs):
+                    if os.path.exists(output):
+                        size += _link_tree(output, os.path.join(temp_dir, str(index)))
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                raise
+            with self._connection:
+                self._connection.execute('INSERT OR REPLACE INTO entries (key, size, used) VALUES (?, ?, ?)',
+                                         (key, size, self._clock()))
+            self._evict()
+
+    def _evict(self):
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total_size <= self._max_size:
+            return
+        for key, size in self._connection.execute('SELECT key, size FROM entries ORDER BY used').fetchall():
+            if total_size <= self._max_size:
+                break
+            self._remove_entry(key)
+            total_size -= size
+
+    def _remove_entry(self, key: str):
+        with self._connection:
+            self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def get_size(self) -> int:
+        """
+        Returns the size of the files of all entries in bytes.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_STEP_CACHES = {}
+_STEP_CACHES_LOCK = threading.Lock()
+
+
+def get_step_cache(root: str, max_size: int) -> StepCache:
+    """
+    Returns the step cache in *root* shared by all monitors of this process.
+    """
+    with _STEP_CACHES_LOCK:
+        if root not in _STEP_CACHES:
+            _STEP_CACHES[root] = StepCache(root, max_size)
+        return _STEP_CACHES[root]
@@ -0,0 +1,144 @@
+"""
+Fork server for workflow steps. It imports the modules given on the command line once and then forks a child for
+each step script it is asked to run, so that steps start without importing them again.
+
+Usage: python step_forkserver.py <socket path> [<module> ...]
+
+Each connection carries one step: a JSON line with the script's argv, working directory and environment, together
+with the write ends of the step's output pipe and, optionally, of its progress pipe. The server answers with a JSON
+line holding the pid of the child and, once the child has terminated, a JSON line with its wait status and rusage.
+The server exits when its stdin is closed. It only depends on the standard library, as it is run by the Python of
+the step scripts.
+"""
+import array
+import importlib
+import json
+import logging
+import os
+import runpy
+import select
+import signal
+import socket
+import sys
+import traceback
+
+_MAX_FDS = 2
+
+
+def _receive_request(connection):
+    data = b''
+    fds = array.array('i')
+    while not data.endswith(b'\n'):
+        message, ancillary_data, _, _ = connection.recvmsg(65536, socket.CMSG_SPACE(_MAX_FDS * fds.itemsize))
+        if len(message) == 0:
+            break
+        data += message
+        for level, cmsg_type, fd_data in ancillary_data:
+            if level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+                fds.frombytes(fd_data[:len(fd_data) - (len(fd_data) % fds.itemsize)])
+    return json.loads(data.decode()), list(fds)
+
+
+def _run_step(request, fds):
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null_fd, 0)
+    os.close(null_fd)
+    os.dup2(fds[0], 1)
+    os.dup2(fds[0], 2)
+    os.close(fds[0])
+    env = dict(request['env'])
+    if len(fds) > 1:
+        env['MULTIPLY_PROGRESS_FD'] = str(fds[1])
+    os.environ.clear()
+    os.environ.update(env)
+    os.chdir(request['cwd'])
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    argv = request['argv']
+    sys.argv = list(argv)
+    sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+    code = 0
+    try:
+        runpy.run_path(argv[0], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    logging.shutdown()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def _send(connection, message):
+    try:
+        connection.sendall((json.dumps(message) + '\n').encode())
+    except OSError:
+        # the monitor has gone away, the step is not observed anymore
+        pass
+
+
+def _reap(children):
+    while len(children) > 0:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        connection = children.pop(pid, None)
+        if connection is not None:
+            _send(connection, {'status': status,
+                               'rusage': [rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss]})
+            connection.close()
+
+
+def main(socket_path, modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f'could not preload {module}: {e}', file=sys.stderr)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+    print('ready', flush=True)
+    children = {}
+    while True:
+        readable, _, _ = select.select([server, sys.stdin], [], [], 0.1)
+        if sys.stdin in readable and len(os.read(sys.stdin.fileno(), 1)) == 0:
+            break
+        if server in readable:
+            connection, _ = server.accept()
+            try:
+                request, fds = _receive_request(connection)
+            except (OSError, ValueError) as e:
+                print(f'could not receive step: {e}', file=sys.stderr)
+                connection.close()
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                for other_connection in list(children.values()) + [connection]:
+                    other_connection.close()
+                _run_step(request, fds)
+            for fd in fds:
+                os.close(fd)
+            children[pid] = connection
+            _send(connection, {'pid': pid})
+        _reap(children)
+    server.close()
+    os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import threading
+
+
+def get_output_signature(path: str):
+    """
+    Returns the number of files, their size in bytes and their latest modification time in nanoseconds for the file
+    or the files in the directory *path*, following symbolic links, or None if *path* does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [1, stat.st_size, stat.st_mtime_ns]
+    count, size, mtime = 0, 0, 0
+    for directory, _, files in os.walk(path, followlinks=True):
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(directory, file))
+            except OSError:
+                # dangling link
+                continue
+            count += 1
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime_ns)
+    return [count, size, mtime]
+
+
+class StepOutputManifest:
+    """
+    A file recording the inputs and the signatures of the outputs of the steps of a job that have succeeded,
+    one JSON object per line, so that a resumed job can tell which outputs are still those the steps have written.
+
+    :param path: The path of the manifest file.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def record(self, command: str, inputs, outputs):
+        """
+        Records the current signatures of the outputs of a step that has succeeded.
+        """
+        entry = json.dumps(self._entry_of(command, inputs, outputs))
+        with self._lock:
+            try:
+                with open(self._path, 'a') as f:
+                    f.write(entry + '\n')
+            except OSError as e:
+                logging.warning(f'Could not record outputs of {command}: {e}')
+
+    def rewrite(self, steps):
+        """
+        Replaces the manifest by the current signatures of the outputs of *steps*, which are tuples of command,
+        inputs and outputs. Outputs changed by later steps of the job are thus not taken for stale.
+        """
+        entries = [json.dumps(self._entry_of(command, inputs, outputs)) for command, inputs, outputs in steps]
+        with self._lock:
+            try:
+                with open(self._path + '.tmp', 'w') as f:
+                    f.writelines(entry + '\n' for entry in entries)
+                os.replace(self._path + '.tmp', self._path)
+            except OSError as e:
+                logging.warning(f'Could not write output manifest: {e}')
+
+    @staticmethod
+    def _entry_of(command: str, inputs, outputs):
+        return {'command': command, 'inputs': list(inputs),
+                'outputs': {output: get_output_signature(output) for output in outputs}}
+
+    def read(self):
+        """
+        Returns a dictionary that maps the recorded commands to their latest entries.
+        """
+        entries = {}
+        if not os.path.exists(self._path):
+            return entries
+        with self._lock, open(self._path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line of a crashed server
+                    continue
+                entries[entry['command']] = entry
+        return entries
+
+
+def read_report(report_path: str):
+    """
+    Returns the commands listed in the report of the steps a monitor has completed, in the order of the report.
+    """
+    if not os.path.exists(report_path):
+        return []
+    with open(report_path) as f:
+        return [line.rstrip('\n') for line in f if len(line.strip()) > 0]
+
+
+def get_resumable_steps(report_path: str, manifest: StepOutputManifest):
+    """
+    Determines the steps of a previous run of a job that need not be run again when the job is resumed. These are
+    the steps listed in the report whose outputs are recorded in the manifest and have not changed since, provided
+    that no step writing one of their inputs needs to be run again.
+
+    :return: The commands of the steps, in the order of the report.
+    """
+    completed = read_report(report_path)
+    entries = manifest.read()
+    resumable = set(command for command in completed if command in entries and
+                    all(get_output_signature(output) == signature
+                        for output, signature in entries[command]['outputs'].items()))
+    readers = {}
+    for command, entry in entries.items():
+        for input in entry['inputs']:
+            readers.setdefault(input, []).append(command)
+    stale = [command for command in entries if command not in resumable]
+    while len(stale) > 0:
+        command = stale.pop()
+        for output in entries[command]['outputs']:
+            for reader in readers.get(output, []):
+                if reader in resumable:
+                    resumable.remove(reader)
+                    stale.append(reader)
+    return list(dict.fromkeys(command for command in completed if command in resumable))
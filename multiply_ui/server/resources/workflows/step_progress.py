@@ -0,0 +1,77 @@
+import time
+
+
+class StepProgress:
+    """
+    The progress a step reports through its progress channel, from which the rate at which it processes items
+    and the remaining time are estimated.
+
+    :param clock: A function returning the current time in seconds.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.progress = None
+        self.phase = None
+        self.items_done = None
+        self.items_total = None
+        self.bytes_done = None
+        self._first_report = None
+        self._last_report = None
+
+    def update(self, message: dict):
+        """
+        Updates the progress from a message of the progress channel. Messages may contain ``progress`` (0 to 100),
+        ``phase``, ``items_done``, ``items_total`` and ``bytes_done``, all of them optional.
+        """
+        now = self._clock()
+        if 'progress' in message:
+            self.progress = max(0, min(int(message['progress']), 100))
+        if 'phase' in message:
+            self.phase = str(message['phase'])
+        if 'items_done' in message:
+            self.items_done = int(message['items_done'])
+        if 'items_total' in message:
+            self.items_total = int(message['items_total'])
+        if 'bytes_done' in message:
+            self.bytes_done = int(message['bytes_done'])
+        if self._first_report is None:
+            self._first_report = (now, self.progress or 0, self.items_done or 0)
+        self._last_report = now
+
+    def get_items_per_second(self):
+        if self.items_done is None or self._first_report is None:
+            return None
+        elapsed = self._last_report - self._first_report[0]
+        if elapsed <= 0:
+            return None
+        return (self.items_done - self._first_report[2]) / elapsed
+
+    def get_eta(self):
+        """
+        Returns the estimated number of seconds until the step is done, or None if it cannot be estimated yet.
+        """
+        if self._first_report is None:
+            return None
+        elapsed = self._last_report - self._first_report[0]
+        if elapsed <= 0:
+            return None
+        if self.items_total is not None and self.items_done is not None and self.items_done > self._first_report[2]:
+            rate = (self.items_done - self._first_report[2]) / elapsed
+            return max(self.items_total - self.items_done, 0) / rate
+        if self.progress is not None and self.progress > self._first_report[1]:
+            rate = (self.progress - self._first_report[1]) / elapsed
+            return (100 - self.progress) / rate
+        return None
+
+    def to_dict(self) -> dict:
+        """
+        Returns the known properties in the form used in task states.
+        """
+        details = {'phase': self.phase, 'itemsDone': self.items_done, 'itemsTotal': self.items_total,
+                   'itemsPerSecond': self.get_items_per_second(), 'eta': self.get_eta()}
+        if details['itemsPerSecond'] is not None:
+            details['itemsPerSecond'] = float(details['itemsPerSecond'])
+        if details['eta'] is not None:
+            details['eta'] = float(details['eta'])
+        return {key: value for key, value in details.items() if value is not None}
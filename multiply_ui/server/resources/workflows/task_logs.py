@@ -0,0 +1,54 @@
+import collections
+import threading
+import zlib
+
+
+class TaskLogBuffer:
+    """
+    Keeps the last *max_lines* log lines of a task in memory. Older lines are dropped, they remain available in the
+    task's trace file. Once the task's job has finished, the buffer may be compressed to reduce its memory further.
+
+    :param max_lines: The maximum number of lines kept.
+    """
+
+    def __init__(self, max_lines: int = 1000):
+        self._lock = threading.Lock()
+        self._lines = collections.deque(maxlen=max(max_lines, 0))
+        self._count = 0
+        self._compressed = None
+
+    def append(self, line: str):
+        with self._lock:
+            if self._compressed is not None:
+                self._decompress()
+            self._lines.append(line)
+            self._count += 1
+
+    def get_lines(self):
+        """
+        Returns the lines kept in memory, oldest first.
+        """
+        with self._lock:
+            if self._compressed is not None:
+                return zlib.decompress(self._compressed).decode().split('\0')
+            return list(self._lines)
+
+    def compress(self):
+        """
+        Replaces the lines kept in memory by a compressed copy.
+        """
+        with self._lock:
+            if self._compressed is not None or len(self._lines) == 0:
+                return
+            self._compressed = zlib.compress('\0'.join(self._lines).encode())
+            self._lines.clear()
+
+    def _decompress(self):
+        self._lines.extend(zlib.decompress(self._compressed).decode().split('\0'))
+        self._compressed = None
+
+    def __len__(self):
+        """
+        Returns the number of lines appended in total, including those no longer kept.
+        """
+        return self._count
@@ -0,0 +1,161 @@
+import array
+import atexit
+import collections
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+
+_FORKSERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'step_forkserver.py')
+
+_Rusage = collections.namedtuple('_Rusage', ['ru_utime', 'ru_stime', 'ru_maxrss'])
+
+
+class WarmProcess:
+    """
+    A step script run by the fork server. It provides what the process supervisor uses of a ``subprocess.Popen``.
+    As the process is a child of the fork server, its exit status is received from the server by ``wait4``.
+    """
+
+    def __init__(self, pid: int, stdout, connection: socket.socket):
+        self.pid = pid
+        self.stdout = stdout
+        self.returncode = None
+        self._connection = connection
+        self._data = b''
+
+    def wait4(self, options: int = 0):
+        """
+        Like ``os.wait4`` for this process. Returns a pid of 0 if *options* contain ``os.WNOHANG`` and the process
+        has not terminated yet.
+        """
+        self._connection.setblocking(not options & os.WNOHANG)
+        while not self._data.endswith(b'\n'):
+            try:
+                data = self._connection.recv(4096)
+            except BlockingIOError:
+                return 0, 0, None
+            except OSError:
+                data = b''
+            if len(data) == 0:
+                self._connection.close()
+                raise ChildProcessError(f'fork server has not reported the exit status of process {self.pid}')
+            self._data += data
+        result = json.loads(self._data.decode())
+        self._connection.close()
+        return self.pid, result['status'], _Rusage(*result['rusage'])
+
+
+class WarmWorkerServer:
+    """
+    Runs step scripts in children forked from a Python process that has imported *preload* already, which saves
+    the start-up time of a fresh interpreter for each step.
+
+    :param python: The Python interpreter of the step scripts.
+    :param preload: The names of the modules to import before forking.
+    """
+
+    def __init__(self, python: str, preload):
+        self._python = python
+        self._preload = list(preload)
+        self._lock = threading.Lock()
+        self._server = None
+        self._socket_dir = None
+
+    def _ensure_started(self):
+        if self._server is not None and self._server.poll() is None:
+            return
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+        self._socket_dir = tempfile.mkdtemp(prefix='mui-forkserver-')
+        self._server = subprocess.Popen([self._python, _FORKSERVER_SCRIPT, self._socket_path()] + self._preload,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if self._server.stdout.readline().strip() != b'ready':
+            raise OSError(f'fork server did not start, exit code {self._server.wait()}')
+
+    def close(self):
+        """
+        Stops the fork server and removes the directory of its socket. Steps still running are not observed anymore.
+        The server is started again by the next call of :meth:`start`.
+        """
+        with self._lock:
+            if self._server is not None:
+                # the server exits when its stdin is closed
+                self._server.stdin.close()
+                try:
+                    self._server.wait(5)
+                except subprocess.TimeoutExpired:
+                    self._server.kill()
+                    self._server.wait()
+                self._server.stdout.close()
+                self._server = None
+            if self._socket_dir is not None:
+                shutil.rmtree(self._socket_dir, ignore_errors=True)
+                self._socket_dir = None
+
+    def _socket_path(self):
+        return os.path.join(self._socket_dir, 'socket')
+
+    def start(self, argv, cwd: str, env: dict, progress_fd: int = None) -> WarmProcess:
+        """
+        Starts a step script. The output of the script is read from the ``stdout`` of the returned process.
+
+        :param argv: The path of the script followed by its arguments.
+        :param cwd: The working directory of the script.
+        :param env: The environment of the script.
+        :param progress_fd: The write end of the step's progress pipe, if any. The caller keeps ownership.
+        """
+        with self._lock:
+            self._ensure_started()
+            socket_path = self._socket_path()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stdout_read, stdout_write = os.pipe()
+        try:
+            connection.connect(socket_path)
+            fds = [stdout_write] if progress_fd is None else [stdout_write, progress_fd]
+            request = json.dumps({'argv': list(argv), 'cwd': cwd, 'env': dict(env)}) + '\n'
+            connection.sendmsg([request.encode()], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+            data = b''
+            while not data.endswith(b'\n'):
+                received = connection.recv(1)
+                if len(received) == 0:
+                    raise OSError('fork server has not started the step')
+                data += received
+        except Exception:
+            connection.close()
+            os.close(stdout_read)
+            raise
+        finally:
+            os.close(stdout_write)
+        return WarmProcess(json.loads(data.decode())['pid'], os.fdopen(stdout_read, 'rb'), connection)
+
+
+_WARM_WORKER_SERVERS = {}
+_WARM_WORKER_SERVERS_LOCK = threading.Lock()
+
+
+def get_warm_worker_server(python: str, preload) -> WarmWorkerServer:
+    """
+    Returns the fork server shared by all monitors of this process that run steps with *python* and *preload*.
+    """
+    key = (python, tuple(preload))
+    with _WARM_WORKER_SERVERS_LOCK:
+        if key not in _WARM_WORKER_SERVERS:
+            _WARM_WORKER_SERVERS[key] = WarmWorkerServer(python, preload)
+        return _WARM_WORKER_SERVERS[key]
+
+
+def close_warm_worker_servers():
+    """
+    Stops the fork servers of this process. Called when the process exits.
+    """
+    with _WARM_WORKER_SERVERS_LOCK:
+        servers = list(_WARM_WORKER_SERVERS.values())
+    for server in servers:
+        server.close()
+
+
+atexit.register(close_warm_worker_servers)
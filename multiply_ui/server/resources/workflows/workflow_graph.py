@@ -0,0 +1,145 @@
+class StepGraph:
+    """
+    The dependency graph of the steps of a workflow. A step depends on the steps that produce one of its inputs,
+    regardless of the order in which the steps have been added.
+
+    For each step the number of steps it depends on that are not done yet is counted, so that marking a step
+    as done only needs to look at the steps that directly depend on it.
+    """
+
+    def __init__(self):
+        self._step_types = {}
+        self._consumers = {}
+        self._producers = {}
+        self._readers = {}
+        self._pending = {}
+        self._done = set()
+
+    def add_step(self, key, step_type: str, inputs, outputs) -> int:
+        """
+        Adds a step.
+
+        :param key: A hashable identifying the step, usually its command.
+        :param step_type: The type of the step, i.e., the name of its script.
+        :param inputs: The paths the step reads.
+        :param outputs: The paths the step writes.
+        :return: The number of steps the step depends on that are not done yet.
+        """
+        self._step_types[key] = step_type
+        self._consumers.setdefault(key, set())
+        self._pending.setdefault(key, 0)
+        for input in inputs:
+            self._readers.setdefault(input, []).append(key)
+            for producer in self._producers.get(input, []):
+                self._add_dependency(producer, key)
+        for output in outputs:
+            self._producers.setdefault(output, []).append(key)
+            for reader in self._readers.get(output, []):
+                self._add_dependency(key, reader)
+        return self._pending[key]
+
+    def _add_dependency(self, producer, consumer):
+        if producer == consumer or consumer in self._consumers[producer]:
+            return
+        self._consumers[producer].add(consumer)
+        if producer not in self._done:
+            self._pending[consumer] += 1
+
+    def mark_done(self, key):
+        """
+        Marks a step as done.
+
+        :return: The steps that depended on the step and do not depend on any other step that is not done.
+        """
+        if key in self._done or key not in self._step_types:
+            return []
+        self._done.add(key)
+        ready = []
+        for consumer in self._consumers[key]:
+            self._pending[consumer] -= 1
+            if self._pending[consumer] == 0:
+                ready.append(consumer)
+        return ready
+
+    def get_pending_count(self, key) -> int:
+        return self._pending.get(key, 0)
+
+    def get_consumers(self, key):
+        return self._consumers.get(key, set())
+
+    def get_producers(self, path):
+        """
+        Returns the steps that write *path*.
+        """
+        return list(self._producers.get(path, []))
+
+    def get_critical_path_ranks(self, durations=None, default_duration: float = 60.0):
+        """
+        Computes the rank of each step, which is the estimated duration of the longest chain of steps starting
+        with the step. Steps with higher ranks should be run first, as more work waits for them.
+
+        :param durations: Maps step types to their estimated durations in seconds.
+        :param default_duration: The duration in seconds of step types without an estimate.
+        :return: A dictionary mapping step keys to ranks.
+        """
+        durations = durations or {}
+        ranks = {}
+        for root in self._step_types:
+            if root in ranks:
+                continue
+            # iterative depth-first search, cycles are broken by ignoring steps already on the stack
+            on_stack = {root}
+            stack = [(root, iter(self._consumers[root]))]
+            while len(stack) > 0:
+                key, consumers = stack[-1]
+                consumer = next(consumers, None)
+                if consumer is None:
+                    stack.pop()
+                    on_stack.discard(key)
+                    downstream = max((ranks.get(c, 0.0) for c in self._consumers[key]), default=0.0)
+                    duration = durations.get(self._step_types[key])
+                    ranks[key] = (duration if duration is not None else default_duration) + downstream
+                elif consumer not in ranks and consumer not in on_stack:
+                    on_stack.add(consumer)
+                    stack.append((consumer, iter(self._consumers[consumer])))
+        return ranks
+
+    def get_linear_chains(self, fusable=None):
+        """
+        Finds chains of steps that may be run as one step. A step is appended to a chain if every other step that
+        waits for the chain also waits for the step, and if the step depends on no steps but those of the chain and
+        steps that do not depend on any step themselves. So running a chain as a whole delays none of the steps
+        waiting for it, and its first step only by steps that can start right away.
+
+        :param fusable: A function telling whether a step may be part of a chain. By default, all steps may.
+        :return: Lists of at least two step keys, each in the order the steps have to run.
+        """
+        producers = {key: set() for key in self._step_types}
+        for key, consumers in self._consumers.items():
+            for consumer in consumers:
+                producers[consumer].add(key)
+        chained = set()
+        chains = []
+        for head in self._step_types:
+            if head in chained or (fusable is not None and not fusable(head)):
+                continue
+            chain = [head]
+            while True:
+                waiting = set().union(*(self._consumers[key] for key in chain)).difference(chain)
+                # the size check keeps steps with many consumers, like static data, cheap
+                candidates = [candidate for candidate in waiting
+                              if len(self._consumers[candidate]) >= len(waiting) - 1 and candidate not in chained
+                              and (fusable is None or fusable(candidate))
+                              and waiting.difference([candidate]).issubset(self._consumers[candidate])
+                              and all(producer in chain or len(producers[producer]) == 0
+                                      for producer in producers[candidate])]
+                if len(candidates) != 1:
+                    break
+                chain.append(candidates[0])
+            if len(chain) > 1:
+                chained.update(chain)
+                chains.append(chain)
+        return chains
+
+    def __len__(self):
+        return len(self._step_types)
@@ -0,0 +1,275 @@
+import bisect
+import collections
+import itertools
+import json
+import logging
+import os
+import threading
+
+# cores and memory in GB that a step of a type needs at most, and optionally its estimated duration in seconds
+StepProfile = collections.namedtuple('StepProfile', ['cores', 'memory', 'duration'])
+StepProfile.__new__.__defaults__ = (None,)
+
+
+def get_machine_resources():
+    """
+    Returns the number of cores of this machine and the memory in GB that is currently available,
+    or None for the latter if it cannot be determined.
+    """
+    cores = os.cpu_count() or 1
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return cores, int(line.split()[1]) / (1024 * 1024)
+    except OSError:
+        pass
+    try:
+        return cores, os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES') / (1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        return cores, None
+
+
+def derive_type_limits(types, profiles, cores, memory):
+    """
+    Derives the limits of step types from the resources of the machine. Types with a profile may run as many steps
+    at the same time as the cores and memory allow, at least one. Types without a profile keep their declared limit,
+    but not more than there are cores.
+
+    :param types: Pairs of step types and their declared limits.
+    :param profiles: Maps step types to pairs of the cores and memory in GB a step of the type needs.
+    :param cores: The number of cores of the machine.
+    :param memory: The available memory of the machine in GB, or None if not known.
+    :return: A dictionary mapping step types to limits.
+    """
+    type_limits = {}
+    for step_type, declared_limit in types:
+        if step_type in profiles:
+            profile = StepProfile(*profiles[step_type])
+            limit = cores // max(profile.cores, 1)
+            if memory is not None and profile.memory > 0:
+                limit = min(limit, int(memory // profile.memory))
+            type_limits[step_type] = max(limit, 1)
+        else:
+            type_limits[step_type] = max(min(declared_limit, cores), 1)
+    return type_limits
+
+
+class StepMemoryHistory:
+    """
+    Remembers the peak memory of the last runs of each step type in a JSON file, so that the memory a step will
+    need can be estimated from past runs instead of relying on its declared profile alone.
+
+    :param path: Path to the JSON file, or None to keep the history in memory only.
+    :param max_runs: The number of runs remembered per step type.
+    """
+
+    def __init__(self, path=None, max_runs: int = 10):
+        self._path = path
+        self._max_runs = max_runs
+        self._lock = threading.Lock()
+        self._peaks = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as history_file:
+                    self._peaks = json.load(history_file)
+            except (OSError, ValueError) as e:
+                logging.warning(f'Could not read step memory history {path}: {e}')
+
+    @property
+    def path(self):
+        return self._path
+
+    def get_peak(self, step_type: str):
+        """
+        Returns the largest peak memory in GB of the remembered runs of *step_type*, or None if there are none.
+        """
+        with self._lock:
+            peaks = self._peaks.get(step_type)
+            return max(peaks) if peaks else None
+
+    def record_peak(self, step_type: str, peak: float):
+        with self._lock:
+            peaks = self._peaks.setdefault(step_type, [])
+            peaks.append(peak)
+            del peaks[:-self._max_runs]
+            if self._path is None:
+                return
+            try:
+                temp_path = f'{self._path}.tmp'
+                with open(temp_path, 'w') as history_file:
+                    json.dump(self._peaks, history_file)
+                os.replace(temp_path, self._path)
+            except OSError as e:
+                logging.warning(f'Could not write step memory history {self._path}: {e}')
+
+
+class ResourcePool:
+    """
+    Slots for running workflow steps that are shared by all monitors of a server process, so that concurrently
+    running jobs together do not start more steps of a type than its limit allows, nor more steps in total than
+    *max_concurrent_steps*. Steps waiting for a slot are served by priority and then in the order they have asked
+    for one, as far as the limits permit.
+
+    If a memory budget is set, a step is only started if the estimated peak memory of the running steps and of
+    the step itself fits into it. Estimates are the peaks of past runs if known, the memory of the step type's
+    profile otherwise. A step whose estimate exceeds the whole budget is started when no other step is running.
+
+    :param max_concurrent_steps: The maximum number of steps running at the same time.
+    :param type_limits: Maps step types to the maximum number of steps of that type running at the same time.
+    :param memory_budget: The memory in GB that running steps may use together, or None for no limit.
+    :param memory_history: The history of peak memory of past runs.
+    """
+
+    def __init__(self, max_concurrent_steps: int = 10, type_limits=None, memory_budget=None, memory_history=None):
+        self._condition = threading.Condition()
+        self._max_concurrent_steps = max_concurrent_steps
+        self._type_limits = dict(type_limits) if type_limits is not None else {}
+        self._memory_budget = memory_budget
+        self._memory_history = memory_history if memory_history is not None else StepMemoryHistory()
+        self._memory_profiles = {}
+        self._memory_in_use = 0.0
+        self._reserved_memory = {}
+        self._running = 0
+        self._running_by_type = {}
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def configure(self, max_concurrent_steps=None, type_limits=None, default_type_limits=None, memory_budget=None,
+                  default_memory_budget=None, memory_profiles=None, memory_history_path=None):
+        """
+        Updates the limits of the pool.
+
+        :param max_concurrent_steps: If given, the new maximum number of steps running at the same time.
+        :param type_limits: Limits of step types that replace the current ones.
+        :param default_type_limits: Pairs of step types and limits that are only applied to types without a limit.
+        :param memory_budget: If given, the new memory budget in GB.
+        :param default_memory_budget: The memory budget in GB to apply if there is none yet.
+        :param memory_profiles: Maps step types to their declared memory in GB, applied to types without one.
+        :param memory_history_path: If given and no history file is used yet, the file to keep the history in.
+        """
+        with self._condition:
+            if max_concurrent_steps is not None:
+                self._max_concurrent_steps = max_concurrent_steps
+            if type_limits is not None:
+                self._type_limits.update(type_limits)
+            if default_type_limits is not None:
+                for step_type, limit in default_type_limits:
+                    self._type_limits.setdefault(step_type, limit)
+            if memory_budget is not None:
+                self._memory_budget = memory_budget
+            elif self._memory_budget is None:
+                self._memory_budget = default_memory_budget
+            if memory_profiles is not None:
+                for step_type, memory in memory_profiles.items():
+                    self._memory_profiles.setdefault(step_type, memory)
+            if memory_history_path is not None and self._memory_history.path is None:
+                self._memory_history = StepMemoryHistory(memory_history_path)
+            self._condition.notify_all()
+
+    def estimate_memory(self, step_type: str) -> float:
+        """
+        Returns the estimated peak memory in GB of a step of *step_type*.
+        """
+        peak = self._memory_history.get_peak(step_type)
+        if peak is not None:
+            return peak
+        return self._memory_profiles.get(step_type, 0.0)
+
+    def record_peak_memory(self, step_type: str, peak: float):
+        """
+        Records the peak memory in GB of a finished step of *step_type*, to be used for later estimates.
+        Unknown peaks are ignored.
+        """
+        if peak is None:
+            return
+        self._memory_history.record_peak(step_type, peak)
+
+    def get_max_concurrent_steps(self) -> int:
+        with self._condition:
+            return self._max_concurrent_steps
+
+    def get_type_limit(self, step_type: str) -> int:
+        with self._condition:
+            return self._type_limits.get(step_type, self._max_concurrent_steps)
+
+    def acquire(self, step_type: str, cancelled=lambda: False, priority: float = 0) -> bool:
+        """
+        Blocks until a slot for a step of *step_type* is available and takes it.
+
+        :param step_type: The type of the step, i.e., the name of its script.
+        :param cancelled: A function telling whether the step has been cancelled while waiting.
+        :param priority: Waiting steps with higher priorities are served first.
+        :return: True if the slot has been taken, False if the step has been cancelled.
+        """
+        waiter = (-priority, next(self._sequence), step_type)
+        with self._condition:
+            bisect.insort(self._waiting, waiter)
+            try:
+                while not self._is_next(waiter):
+                    if cancelled():
+                        return False
+                    self._condition.wait()
+                if cancelled():
+                    return False
+                memory = self.estimate_memory(step_type)
+                self._running += 1
+                self._running_by_type[step_type] = self._running_by_type.get(step_type, 0) + 1
+                self._memory_in_use += memory
+                self._reserved_memory.setdefault(step_type, []).append(memory)
+                return True
+            finally:
+                self._waiting.remove(waiter)
+                self._condition.notify_all()
+
+    def release(self, step_type: str):
+        with self._condition:
+            self._running -= 1
+            self._running_by_type[step_type] -= 1
+            self._memory_in_use -= self._reserved_memory[step_type].pop(0)
+            self._condition.notify_all()
+
+    def wake(self):
+        """
+        Wakes all waiting steps so that they check whether they have been cancelled.
+        """
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_usage(self):
+        """
+        Returns the number of running steps in total and per type, and the number of waiting steps.
+        """
+        with self._condition:
+            return {'running': self._running, 'runningByType': dict(self._running_by_type),
+                    'waiting': len(self._waiting), 'memoryInUse': self._memory_in_use,
+                    'memoryBudget': self._memory_budget}
+
+    def _is_available(self, step_type: str) -> bool:
+        if self._running >= self._max_concurrent_steps or \
+                self._running_by_type.get(step_type, 0) >= self._type_limits.get(step_type,
+                                                                                 self._max_concurrent_steps):
+            return False
+        if self._memory_budget is None or self._running == 0:
+            return True
+        return self._memory_in_use + self.estimate_memory(step_type) <= self._memory_budget
+
+    def _is_next(self, waiter) -> bool:
+        if not self._is_available(waiter[2]):
+            return False
+        for other in self._waiting:
+            if other is waiter:
+                return True
+            if self._is_available(other[2]):
+                return False
+        return True
+
+
+_RESOURCE_POOL = ResourcePool()
+
+
+def get_resource_pool() -> ResourcePool:
+    """
+    Returns the resource pool shared by all monitors of this process.
+    """
+    return _RESOURCE_POOL
@@ -1,3 +1,4 @@
+from . import controller
 from .app import new_application
 from .config import ADDRESS, LOGGER, PORT
 from .context import ServiceContext
@@ -21,12 +22,17 @@ class Service:
         application = new_application()
         application._ctx = ServiceContext()
         application.listen(port, address)
+        self._ctx = application._ctx
+        self._ctx.job_events.set_io_loop(tornado.ioloop.IOLoop.current())
         self._shutdown_requested = False
         self._address = address
         self._port = port
 
     def start(self):
         tornado.ioloop.IOLoop.current().add_callback_from_signal(self.register_termination_handlers)
+        # compute processing parameters ahead of the first request
+        tornado.ioloop.IOLoop.current().run_in_executor(self._ctx.get_executor('parameters'),
+                                                        controller.get_parameters_response, self._ctx)
         tornado.ioloop.PeriodicCallback(self._try_shutdown, 100).start()
         LOGGER.info(f"Server listening on port {self._port} at address {self._address}...")
         tornado.ioloop.IOLoop.current().start()
@@ -48,4 +54,5 @@ class Service:
 
     def _try_shutdown(self):
         if self._shutdown_requested:
+            self._ctx.shut_down()
             self.shut_down()
@@ -0,0 +1,75 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class JobVersions:
+    """
+    Assigns monotonically increasing version numbers to the states of jobs and their tasks, so that clients may ask
+    only for the tasks that have changed since a version they already know.
+
+    Versions are drawn from a single counter that is initialised with the current time in milliseconds.
+    Versions handed out by a restarted server are therefore greater than those of a previous one,
+    and clients holding an outdated version receive all tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = int(time.time() * 1000)
+        self._jobs = {}
+
+    def update(self, job_dict: Dict) -> int:
+        """
+        Compares *job_dict* with the previously seen state of the job and sets its ``version`` property,
+        which only changes if the job's status or progress or the status, progress or number of logs of any
+        of its tasks has changed. Tasks are told apart by their ids, or by their names if they have none.
+
+        :param job_dict: A job as returned by the controller.
+        :return: The job's version.
+        """
+        job_state = (job_dict['status'], job_dict['progress'])
+        task_states = {_task_key(task): (task['status'], task['progress'], task.get('logCount', len(task['logs'])))
+                       for task in job_dict['tasks']}
+        with self._lock:
+            previous = self._jobs.get(job_dict['id'])
+            if previous is None:
+                self._counter += 1
+                version = self._counter
+                task_versions = {key: version for key in task_states}
+            else:
+                version, previous_job_state, previous_task_states, task_versions = previous
+                task_versions = dict(task_versions)
+                new_version = self._counter + 1
+                changed = job_state != previous_job_state
+                for key, task_state in task_states.items():
+                    if previous_task_states.get(key) != task_state:
+                        task_versions[key] = new_version
+                        changed = True
+                if changed:
+                    self._counter = new_version
+                    version = new_version
+            self._jobs[job_dict['id']] = (version, job_state, task_states, task_versions)
+        job_dict['version'] = version
+        return version
+
+    def delta(self, job_dict: Dict, since: int) -> Optional[Dict]:
+        """
+        Reduces a job that has been passed to :meth:update to the tasks that have changed after version *since*.
+
+        :return: The reduced job, or None if the job has not changed at all.
+        """
+        if job_dict['version'] == since:
+            return None
+        if since > job_dict['version']:
+            # unknown version, client needs to get all tasks
+            return job_dict
+        with self._lock:
+            task_versions = self._jobs[job_dict['id']][3]
+        job_dict['tasks'] = [task for task in job_dict['tasks']
+                             if task_versions.get(_task_key(task), since + 1) > since]
+        job_dict['delta'] = True
+        return job_dict
+
+
+def _task_key(task: Dict) -> str:
+    return task.get('id', task['name'])
@@ -1,8 +1,11 @@
+import asyncio
+import json
 import random
 import string
 import time
+import urllib.parse
 
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from .model import Job, JOBS
 from ..req.model import InputRequestMixin
@@ -11,8 +14,11 @@ from ...util.callapi import call_api
 URL_BASE = "http://localhost:9090/"
 CANCEL_URL = URL_BASE + "multiply/api/jobs/cancel/{}"
 GET_JOB_URL = URL_BASE + "multiply/api/jobs/get/{}"
+GET_JOBS_URL = URL_BASE + "multiply/api/jobs"
+GET_TASK_LOGS_URL = URL_BASE + "multiply/api/jobs/{}/tasks/{}/logs"
 SUBMIT_PROCESSING_REQUEST_URL = URL_BASE + "multiply/api/jobs/execute"
 VISUALIZE_URL = URL_BASE + "multiply/api/jobs/visualize/{}"
+JOB_EVENTS_URL = URL_BASE.replace('http', 'ws', 1) + "multiply/api/jobs/events"
 
 
 def _write_to_command_line(message: str, stack_trace: List[str]=[]):
@@ -91,12 +97,106 @@ def _cancel_mock(job_id: str, message_func):
 
 
 def get_job(job: Job, message_func ) -> Optional[Job]:
+    """
+    Gets the current state of *job*. If the state of *job* carries a version, only the changes since that version
+    are requested and merged into it. Returns None if the job has not changed.
+    """
     def _apply_func(response) -> Job:
+        if response.get('delta'):
+            return Job(job.merge(response))
         return Job(response)
-    return call_api(GET_JOB_URL.format(job.id), apply_func=_apply_func, message_func=message_func)
+    params = {'since': job.version} if job.version is not None else None
+    return call_api(GET_JOB_URL.format(job.id), apply_func=_apply_func, params=params, message_func=message_func)
+
+
+def get_jobs(job_ids: List[str], with_tasks: bool = False, message_func=_write_to_command_line) \
+        -> Optional[List[Dict]]:
+    """
+    Gets the states of several jobs with a single request. Unless *with_tasks* is set, the states only consist of
+    id, name, status and progress of the jobs.
+    """
+    def _apply_func(response) -> List[Dict]:
+        return response['jobs']
+    return call_api(GET_JOBS_URL, apply_func=_apply_func, data={'ids': job_ids, 'tasks': with_tasks},
+                    message_func=message_func)
+
+
+def get_task_logs(job_id: str, task_id: str, offset: int = 0, limit: Optional[int] = None,
+                  message_func=_write_to_command_line) -> Optional[Dict]:
+    """
+    Gets a page of the log of a task. The result holds the log ``lines`` and the ``nextOffset`` at which
+    to continue reading.
+    """
+    params = {'offset': offset}
+    if limit is not None:
+        params['limit'] = limit
+    return call_api(GET_TASK_LOGS_URL.format(job_id, urllib.parse.quote(task_id, safe='')), params=params,
+                    message_func=message_func)
 
 
 def visualize_output(job_id: str, message_func=_write_to_command_line):
     def _apply_func(response):
         print(response['ip'])
     call_api(VISUALIZE_URL.format(job_id), apply_func=_apply_func, message_func=message_func)
+
+
+class JobEvents:
+    """
+    A subscription to the events the server pushes when jobs or their tasks change their state.
+    Job monitors use it to wait for changes instead of polling in fixed intervals.
+    Each instance runs its own event loop and must only be used by the thread that created it.
+    """
+
+    def __init__(self, job_ids: Iterable[str]):
+        # imported here as tornado is only needed when events are used
+        import tornado.websocket
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        url = f'{JOB_EVENTS_URL}?ids={",".join(urllib.parse.quote(job_id, safe="") for job_id in job_ids)}'
+        try:
+            self._connection = self._loop.run_until_complete(tornado.websocket.websocket_connect(url))
+        except Exception:
+            self._loop.close()
+            raise
+        self._pending = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    def wait(self, timeout: float) -> Optional[Dict]:
+        """
+        Waits at most *timeout* seconds for the next event. Returns None if there has been no event in time or
+        if the connection has been closed.
+        """
+        if not self.connected:
+            return None
+        if self._pending is None:
+            self._pending = self._connection.read_message()
+        # asyncio.wait does not cancel the pending read on timeout, it is continued by the next call
+        done, _ = self._loop.run_until_complete(asyncio.wait([self._pending], timeout=timeout))
+        if len(done) == 0:
+            return None
+        message = self._pending.result()
+        self._pending = None
+        if message is None:
+            self._connection = None
+            return None
+        return json.loads(message)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._loop.close()
+
+
+def open_job_events(job_ids: Iterable[str]) -> Optional[JobEvents]:
+    """
+    Subscribes to the events of the given jobs. Returns None if the server cannot push events,
+    callers should then fall back to polling.
+    """
+    try:
+        return JobEvents(job_ids)
+    except Exception:
+        return None
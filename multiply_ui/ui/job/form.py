@@ -3,9 +3,9 @@ import threading
 import time
 
 from IPython.display import display
-from typing import Optional
+from typing import Dict, Optional
 
-from .api import cancel, get_job
+from .api import cancel, get_job, get_jobs, get_task_logs, open_job_events, JobEvents
 from .model import Job, JOBS
 from ..debug import get_debug_view
 from ..info import InfoComponent
@@ -46,13 +46,29 @@ def obs_job_form(job: Job, mock=False):
 
     info_displayed = []
 
-    def _toggle_info_display(task_details, details_button, task_id, task_logs):
+    task_logs = {}
+
+    def _get_logs_func(task_id, logs):
+        def _get_logs():
+            if mock:
+                return logs
+            # only fetch the lines that have been added since the last request
+            offset, lines = task_logs.get(task_id, (0, []))
+            page = get_task_logs(job.id, task_id, offset=offset, message_func=info.message_func)
+            if page is not None:
+                lines = lines + page['lines']
+                task_logs[task_id] = (page['nextOffset'], lines)
+            return lines
+
+        return _get_logs
+
+    def _toggle_info_display(task_details, details_button, task_id, get_logs):
         task_details.clear_output()
         if details_button.icon == "chevron-circle-down":
             task_details.layout = {'border': '1px solid black'}
             info_displayed.append(task_id)
             with task_details:
-                for log in task_logs:
+                for log in get_logs():
                     print(log)
             details_button.icon = "chevron-circle-up"
         else:
@@ -60,12 +76,12 @@ def obs_job_form(job: Job, mock=False):
             info_displayed.remove(task_id)
             details_button.icon = "chevron-circle-down"
 
-    def _get_details_button(_func, task_details, task_id, task_logs):
+    def _get_details_button(_func, task_details, task_id, get_logs):
         details_button = widgets.Button(icon="chevron-circle-down", tooltip="Show processing details",
                                         layout=widgets.Layout(width='80%'))
 
         def _apply_func(b):
-            _func(task_details, details_button, task_id, task_logs)
+            _func(task_details, details_button, task_id, get_logs)
 
         details_button.on_click(_apply_func)
         if task_id not in info_displayed:
@@ -74,7 +90,7 @@ def obs_job_form(job: Job, mock=False):
         else:
             details_button.icon = "chevron-circle-up"
             task_details.layout = {'border': '1px solid black'}
-            for line in task_logs:
+            for line in get_logs():
                 task_details.append_stdout(f'{line}\n')
 
         return details_button
@@ -82,15 +98,15 @@ def obs_job_form(job: Job, mock=False):
     def _get_tasks_gridbox(grid_job):
         gridbox_children = [task_gridbox_children]
         task_details_list = []
-        for task_name in grid_job.tasks.names:
-            progress = grid_job.tasks.get(task_name).progress
-            status = grid_job.tasks.get(task_name).status
+        for task_id in grid_job.tasks.ids:
+            progress = grid_job.tasks.get(task_id).progress
+            status = grid_job.tasks.get(task_id).status
             progress = widgets.IntProgress(value=progress, min=0, max=100)
             status_label = widgets.Label(status)
-            task_name_label = widgets.Label(task_name)
+            task_name_label = widgets.Label(grid_job.tasks.get(task_id).name)
             task_details = widgets.Output()
-            logs = grid_job.tasks.get(task_name).logs
-            details_button = _get_details_button(_toggle_info_display, task_details, task_name, logs)
+            get_logs = _get_logs_func(task_id, grid_job.tasks.get(task_id).logs)
+            details_button = _get_details_button(_toggle_info_display, task_details, task_id, get_logs)
             task_details_list.append(task_details)
             row_children = [task_name_label, progress, status_label, details_button]
             row_box = widgets.GridBox(children=row_children,
@@ -105,8 +121,9 @@ def obs_job_form(job: Job, mock=False):
     job_monitor = widgets.VBox([job_grid_box, tasks_gridbox, info.as_widget(100)])
 
     def monitor(progress_bar, status_bar, cancel_button):
+        job_events = open_job_events([job.id]) if not mock else None
         while job.status not in ['succeeded', 'cancelled', 'failed']:
-            time.sleep(10)
+            _wait_for_change(job_events)
             job_state = get_job_func(job, info.message_func)
             if job_state is not None:
                 _update_job(job, job_state)
@@ -116,6 +133,8 @@ def obs_job_form(job: Job, mock=False):
             if job.status != 'new' and job.status != 'running':
                 cancel_button.disabled = True
             job_monitor.children = ([job_grid_box, grid_box, info.as_widget(100)])
+        if job_events is not None:
+            job_events.close()
 
 
     monitor_components = (job_progress_bar, job_status_label, job_cancel_button)
@@ -166,24 +185,41 @@ def obs_jobs_form(mock=False):
     jobs_full_component = widgets.VBox([jobs_monitor_component, info.as_widget(100)])
 
     def jobs_monitor_func(components, empty):
+        job_events = open_job_events(components.keys()) if not mock else None
         at_least_one_job_unfinished = True
         while at_least_one_job_unfinished:
             at_least_one_job_unfinished = False
-            for progress_bar, status_label, cancel_button, job_func, component_job in components.values():
-                job_state = job_func(component_job, info.message_func)
-                if job_state is not None:
-                    _update_job(component_job, job_state)
+            job_states = _get_job_states(components, info.message_func, mock)
+            for job_id, (progress_bar, status_label, cancel_button, job_func, component_job) in components.items():
+                if job_id in job_states:
+                    # compact states lack the tasks, so they are merged into the known state
+                    component_job.update(component_job.merge(job_states[job_id]))
                 progress_bar.value = component_job.progress
                 status_label.value = component_job.status
                 if component_job.status != 'new' and component_job.status != 'running':
                     cancel_button.disabled = True
                 if component_job.status not in ['succeeded', 'cancelled', 'failed']:
                     at_least_one_job_unfinished = True
-            time.sleep(10)
+            if at_least_one_job_unfinished:
+                _wait_for_change(job_events)
+        if job_events is not None:
+            job_events.close()
 
     _monitor(jobs_monitor_func, jobs_full_component, (job_components, None))
 
 
+def _get_job_states(components, message_func, mock=False) -> Dict[str, Dict]:
+    if not mock:
+        job_states = get_jobs(list(components.keys()), message_func=message_func)
+        return {job_state['id']: job_state for job_state in job_states} if job_states is not None else {}
+    job_states = {}
+    for job_id, (_, _, _, job_func, component_job) in components.items():
+        job_state = job_func(component_job, message_func)
+        if job_state is not None:
+            job_states[job_id] = job_state.as_dict()
+    return job_states
+
+
 def _get_job_func(job: Job, mock=False):
     if not mock:
         return get_job
@@ -202,10 +238,10 @@ def _get_job_func(job: Job, mock=False):
         job_progress = 0
         previous_task_succeeded = True
         task_list = []
-        for job_task_name in job.tasks.names:
-            task_progress = job.tasks.get(job_task_name).progress
-            task_status = job.tasks.get(job_task_name).status
-            task_logs = job.tasks.get(job_task_name).logs
+        for job_task_id in job.tasks.ids:
+            task_progress = job.tasks.get(job_task_id).progress
+            task_status = job.tasks.get(job_task_id).status
+            task_logs = job.tasks.get(job_task_id).logs
             if previous_task_succeeded and task_progress < 100:
                 task_progress += 5
                 task_progress = min(task_progress, 100)
@@ -217,7 +253,8 @@ def _get_job_func(job: Job, mock=False):
                 previous_task_succeeded = False
             task_list.append(
                 {
-                    "name": job_task_name,
+                    "id": job_task_id,
+                    "name": job.tasks.get(job_task_id).name,
                     "progress": task_progress,
                     "status": task_status,
                     "logs": task_logs
@@ -225,7 +262,7 @@ def _get_job_func(job: Job, mock=False):
             )
         if previous_task_succeeded:
             job_status = "succeeded"
-        job_progress = int(job_progress / len(job.tasks.names))
+        job_progress = int(job_progress / len(job.tasks.ids))
         job_data_dict = {
             "id": job_state.id,
             "name": job_state.name,
@@ -238,6 +275,22 @@ def _get_job_func(job: Job, mock=False):
     return get_job_mock
 
 
+def _wait_for_change(job_events: Optional[JobEvents], timeout: float = 10, min_interval: float = 1):
+    """
+    Waits until the server reports a change of the observed jobs, but at most *timeout* seconds.
+    Without a connection for events, simply waits *timeout* seconds so that callers poll.
+    Changes tend to come in bursts, so after the first event the following ones are collected
+    for *min_interval* seconds.
+    """
+    if job_events is None or not job_events.connected:
+        time.sleep(timeout)
+        return
+    if job_events.wait(timeout) is not None:
+        deadline = time.time() + min_interval
+        while job_events.connected and time.time() < deadline:
+            job_events.wait(deadline - time.time())
+
+
 def _update_job(job: Job, job_state: Job):
     job.update(job_state.as_dict())
 
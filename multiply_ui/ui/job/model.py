@@ -1,13 +1,30 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from ...util.html import html_table, html_element
 from ...util.schema import PropertyDef, TypeDef
 
+USAGE_TYPE = TypeDef(object, optional=True, properties=[
+    PropertyDef('wallTime', TypeDef(float, optional=True)),
+    PropertyDef('userTime', TypeDef(float, optional=True)),
+    PropertyDef('systemTime', TypeDef(float, optional=True)),
+    PropertyDef('maxRss', TypeDef(float, optional=True)),
+    PropertyDef('readBytes', TypeDef(int, optional=True)),
+    PropertyDef('writeBytes', TypeDef(int, optional=True)),
+])
+
 TASK_TYPE = TypeDef(object, properties=[
+    PropertyDef('id', TypeDef(str, optional=True)),
     PropertyDef('name', TypeDef(str)),
     PropertyDef('progress', TypeDef(int)),
     PropertyDef('status', TypeDef(str)),
     PropertyDef('logs', TypeDef(list, item_type=TypeDef(str))),
+    PropertyDef('logCount', TypeDef(int, optional=True)),
+    PropertyDef('phase', TypeDef(str, optional=True)),
+    PropertyDef('itemsDone', TypeDef(int, optional=True)),
+    PropertyDef('itemsTotal', TypeDef(int, optional=True)),
+    PropertyDef('itemsPerSecond', TypeDef(float, optional=True)),
+    PropertyDef('eta', TypeDef(float, optional=True)),
+    PropertyDef('usage', USAGE_TYPE),
 ])
 
 JOB_TYPE = TypeDef(object, properties=[
@@ -16,6 +33,8 @@ JOB_TYPE = TypeDef(object, properties=[
     PropertyDef("progress", TypeDef(int)),
     PropertyDef("status", TypeDef(str, choices=['new', 'running', 'succeeded', 'cancelling', 'cancelled', 'failed'])),
     PropertyDef("tasks", TypeDef(list, optional=True, item_type=TASK_TYPE)),
+    PropertyDef("version", TypeDef(int, optional=True)),
+    PropertyDef("delta", TypeDef(bool, optional=True)),
 ])
 
 JOBS = {}
@@ -25,6 +44,11 @@ class Task:
     def __init__(self, data: Dict[str, Any]):
         self._data = data
 
+    @property
+    def id(self) -> str:
+        # tasks of servers that do not send ids are identified by their names
+        return self._data.get('id', self._data['name'])
+
     @property
     def name(self) -> str:
         return self._data['name']
@@ -41,6 +65,18 @@ class Task:
     def logs(self) -> List[str]:
         return self._data['logs']
 
+    @property
+    def phase(self) -> Optional[str]:
+        return self._data.get('phase')
+
+    @property
+    def eta(self) -> Optional[float]:
+        return self._data.get('eta')
+
+    @property
+    def usage(self) -> Dict[str, Any]:
+        return self._data.get('usage', {})
+
     def _repr_html_(self):
         return self.html_table([self])
 
@@ -59,9 +95,13 @@ class Tasks:
         self._tasks = tasks
 
     @property
-    def names(self) -> List[str]:
+    def ids(self) -> List[str]:
         return list(self._tasks.keys())
 
+    @property
+    def names(self) -> List[str]:
+        return [task.name for task in self._tasks.values()]
+
     def get(self, it_id: str) -> Task:
         return self._tasks[it_id]
 
@@ -98,6 +138,10 @@ class Job:
     def status(self) -> str:
         return self._data['status']
 
+    @property
+    def version(self) -> Optional[int]:
+        return self._data.get('version')
+
     @property
     def has_tasks(self) -> bool:
         return 'tasks' in self._data
@@ -106,7 +150,8 @@ class Job:
     def tasks(self) -> Tasks:
         if not self.has_tasks:
             return Tasks({})
-        return Tasks({task['name']: Task(task) for task in self._data['tasks']})
+        tasks = [Task(task) for task in self._data['tasks']]
+        return Tasks({task.id: task for task in tasks})
 
     def as_dict(self) -> Dict:
         # noinspection PyUnresolvedReferences
@@ -116,6 +161,19 @@ class Job:
         from ..job.api import cancel
         cancel(self.id, mock)
 
+    def merge(self, delta: dict) -> Dict:
+        """
+        Returns the state of this job updated by *delta*, a job state that only contains the tasks that have changed.
+        """
+        merged = self.as_dict()
+        merged.update({key: value for key, value in delta.items() if key not in ['tasks', 'delta']})
+        if 'tasks' in delta:
+            tasks = {Task(task).id: task for task in merged.get('tasks', [])}
+            for task in delta['tasks']:
+                tasks[Task(task).id] = task
+            merged['tasks'] = list(tasks.values())
+        return merged
+
     def update(self, new_state: dict):
         self._validate(new_state)
         if self.id == new_state['id'] and self.name == new_state['name']:
@@ -16,13 +16,16 @@ def call_api(url: str, apply_func=None, data=None, params=None, message_func=_wr
     :param url: The API URL.
     :param apply_func: function called after API response has been received.
     :param data: JSON POST object, usually a dictionary if any.
+    :param params: query parameters of a GET request, if any.
     :param message_func: A message function that will display a message from the back end
-    :return: response JSON object, usually a dictionary.
+    :return: response JSON object, usually a dictionary, or None if the response is "304 Not Modified".
     """
     if data is None:
         response = requests.get(url, params=params)
     else:
         response = requests.post(url, json=data)
+    if response.status_code == 304:
+        return None
     try:
         json_obj = json.loads(response.content)
         if response.status_code < 300:
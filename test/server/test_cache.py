@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from multiply_ui.server.cache import QueryCache
+
+
+class _Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def test_cached_value_is_returned(self):
+        cache = QueryCache()
+        self.assertEqual('a', cache.get('key', lambda: 'a'))
+        self.assertEqual('a', cache.get('key', lambda: 'b'))
+        self.assertEqual(1, len(cache))
+
+    def test_expiry(self):
+        clock = _Clock()
+        cache = QueryCache(ttl=10, clock=clock)
+        cache.get('key', lambda: 'a')
+        clock.now = 9
+        self.assertEqual('a', cache.get('key', lambda: 'b'))
+        clock.now = 10
+        self.assertEqual('b', cache.get('key', lambda: 'b'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(max_size=2)
+        cache.get('key_1', lambda: 1)
+        cache.get('key_2', lambda: 2)
+        cache.get('key_1', lambda: -1)
+        cache.get('key_3', lambda: 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get('key_1', lambda: -1))
+        self.assertEqual(-2, cache.get('key_2', lambda: -2))
+
+    def test_failures_are_not_cached(self):
+        cache = QueryCache()
+
+        def _fail():
+            raise ValueError('query failed')
+
+        with self.assertRaises(ValueError):
+            cache.get('key', _fail)
+        self.assertEqual('a', cache.get('key', lambda: 'a'))
+
+    def test_concurrent_requests_are_computed_once(self):
+        cache = QueryCache()
+        calls = []
+        results = []
+
+        def _query():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'a'
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', _query))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['a'] * 5, results)
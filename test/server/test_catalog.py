@@ -0,0 +1,52 @@
+import unittest
+
+from multiply_ui.server.catalog import InputCatalog
+
+_ROI = 'POLYGON((0 0, 10 0, 10 10, 0 10, 0 0))'
+_WEST = 'POLYGON((0 0, 5 0, 5 10, 0 10, 0 0))'
+_EAST = 'POLYGON((5 0, 10 0, 10 10, 5 10, 5 0))'
+
+
+class _Clock:
+
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class InputCatalogTest(unittest.TestCase):
+
+    def test_uncovered_query_returns_none(self):
+        catalog = InputCatalog()
+        self.assertIsNone(catalog.query('S2_L1C', _ROI, 0, 100))
+        catalog.add_search('S2_L1C', _WEST, 0, 100, [])
+        self.assertIsNone(catalog.query('S2_L1C', _ROI, 0, 100))
+        self.assertIsNone(catalog.query('S2_L1C', _WEST, 0, 200))
+        self.assertIsNone(catalog.query('MODIS', _WEST, 0, 100))
+
+    def test_query_covered_by_searches(self):
+        catalog = InputCatalog()
+        catalog.add_search('S2_L1C', _WEST, 0, 100, [('P1', 'POLYGON((1 1, 2 1, 2 2, 1 2, 1 1))', 10, 11),
+                                                     ('P2', 'POLYGON((1 1, 2 1, 2 2, 1 2, 1 1))', 60, 61)])
+        catalog.add_search('S2_L1C', _EAST, 0, 100, [('P3', 'POLYGON((8 8, 9 8, 9 9, 8 9, 8 8))', 20, 21),
+                                                     ('P4', None, 30, 31)])
+        self.assertEqual(['P1', 'P3', 'P4', 'P2'], catalog.query('S2_L1C', _ROI, 0, 100))
+        self.assertEqual(['P1', 'P3', 'P4'], catalog.query('S2_L1C', _ROI, 5, 50))
+        self.assertEqual(['P4', 'P2'], catalog.query('S2_L1C', _WEST, 25, 70))
+
+    def test_stale_searches_are_ignored(self):
+        clock = _Clock()
+        catalog = InputCatalog(freshness={'S2_L1C': 10}, default_freshness=100, clock=clock)
+        catalog.add_search('S2_L1C', _ROI, 0, 100, [('P1', None, 10, 11)])
+        catalog.add_search('MODIS', _ROI, 0, 100, [('M1', None, 10, 11)])
+        clock.now += 50
+        self.assertIsNone(catalog.query('S2_L1C', _ROI, 0, 100))
+        self.assertEqual(['M1'], catalog.query('MODIS', _ROI, 0, 100))
+
+    def test_clear(self):
+        catalog = InputCatalog()
+        catalog.add_search('S2_L1C', _ROI, 0, 100, [('P1', None, 10, 11)])
+        catalog.clear()
+        self.assertIsNone(catalog.query('S2_L1C', _ROI, 0, 100))
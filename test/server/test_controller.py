@@ -4,7 +4,9 @@ import multiply_ui.server.controller as controller
 import multiply_ui.server.context as context
 import os
 import shutil
+import tempfile
 import time
+import types
 import unittest
 
 from multiply_ui.server import context, controller
@@ -13,7 +15,7 @@ from multiply_ui.server import context, controller
 class ControllerTest(unittest.TestCase):
 
     def test_get_parameters(self):
-        parameters = controller.get_parameters(context.ServiceContext())
+        parameters = controller.get_parameters(context.ServiceContext(job_store=':memory:', input_catalog=':memory:'))
         self.assertEqual(2, len(parameters["inputTypes"]))
         self.assertEqual(parameters["inputTypes"][0]["id"], "Sentinel-1")
         self.assertEqual(parameters["inputTypes"][0]["name"], "Sentinel-1 Single Look Complex (SLC)")
@@ -25,10 +27,83 @@ class ControllerTest(unittest.TestCase):
         with open(os.path.join(os.path.dirname(__file__), '..', 'test_data', 'example_request_parameters.json')) as fp:
             json_text = fp.read()
             parameters = json.loads(json_text)
-            request = controller.get_inputs(context.ServiceContext(), parameters)
+            service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+            request = controller.get_inputs(service_context, parameters)
             self.assertEqual(78, len(request["inputIdentifiers"]["S2_L1C"]))
             self.assertEqual(78, len(request["inputIdentifiers"]["S2_L1C"]))
 
+    def test_parameters_etag_changes_after_invalidation(self):
+        service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+        etag = controller.get_parameters_response(service_context)['etag']
+        service_context.get_available_post_processors = lambda: [{'name': 'NewPostProcessor'}]
+        # the parameters are computed once
+        self.assertEqual(etag, controller.get_parameters_response(service_context)['etag'])
+        service_context.clear('parameters')
+        self.assertNotEqual(etag, controller.get_parameters_response(service_context)['etag'])
+
+    def test_failed_resume_keeps_finished_job(self):
+        service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+        service_context.job_store.add_job({'id': 'job', 'name': 'job', 'status': 'succeeded', 'progress': 100})
+        finished_job = object()
+        service_context.register_job('job', finished_job)
+        previous_job = service_context.reserve_job_id_to_resume('job', 'job')
+        self.assertIs(finished_job, previous_job)
+        self.assertIsNone(service_context.get_job('job'))
+        service_context.release_job_id('job', previous_job)
+        self.assertIs(finished_job, service_context.get_job('job'))
+
+    def test_get_jobs(self):
+        service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+        for id in ['job_1', 'job_2']:
+            service_context.job_store.add_job({'id': id, 'name': 'job', 'status': 'succeeded', 'progress': 100,
+                                               'tasks': [{'id': 't', 'name': 'task', 'status': 'succeeded',
+                                                          'progress': 100}]})
+        self.assertEqual({'jobs': [{'id': 'job_2', 'name': 'job', 'status': 'succeeded', 'progress': 100},
+                                   {'id': 'job_1', 'name': 'job', 'status': 'succeeded', 'progress': 100}],
+                          'unknown': ['job_3']},
+                         controller.get_jobs(service_context, ['job_2', 'job_3', 'job_1']))
+        jobs = controller.get_jobs(service_context, ['job_1', 'job_3'], with_tasks=True)
+        self.assertEqual(['job_3'], jobs['unknown'])
+        self.assertEqual(1, len(jobs['jobs']))
+        self.assertEqual([{'id': 't', 'name': 'task', 'status': 'succeeded', 'progress': 100, 'logs': []}],
+                         jobs['jobs'][0]['tasks'])
+
+    def test_get_task_logs_of_stored_job(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+            service_context.job_store.add_job({'id': 'job', 'name': 'job', 'status': 'succeeded', 'progress': 100},
+                                              workdir=temp_dir)
+            command = 'preprocess_s2.py req.json sdrs'
+            trace_file = os.path.join(temp_dir, 'log', 'step-0001.out')
+            os.makedirs(os.path.dirname(trace_file))
+            with open(trace_file, 'w') as f:
+                f.write('one\ntwo\nthree')
+            with open(os.path.join(temp_dir, 'log', 'trace_files.jsonl'), 'w') as f:
+                f.write(json.dumps({'command': command, 'file': trace_file}) + '\n')
+            task_id = controller._task_id_of(command)
+            self.assertEqual({'offset': 0, 'nextOffset': 8, 'lines': ['one', 'two']},
+                             controller.get_task_logs(service_context, 'job', task_id, 0, 2))
+            # the last line of a finished task is complete
+            self.assertEqual({'offset': 8, 'nextOffset': 13, 'lines': ['three']},
+                             controller.get_task_logs(service_context, 'job', task_id, 8, 2))
+            self.assertEqual({'offset': 0, 'nextOffset': 0, 'lines': []},
+                             controller.get_task_logs(service_context, 'job', 'unknown', 0, 2))
+            with self.assertRaises(KeyError):
+                controller.get_task_logs(service_context, 'unknown', task_id, 0, 2)
+
+    def test_get_task_logs_of_running_task(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
+            command = 'preprocess_s2.py req.json sdrs'
+            trace_file = os.path.join(temp_dir, 'step-0001.out')
+            with open(trace_file, 'w') as f:
+                f.write('one\ntwo\nthr')
+            pm = types.SimpleNamespace(get_trace_files=lambda: {command: trace_file}, _running={command: None})
+            service_context.register_job('job', types.SimpleNamespace(pm=pm))
+            # the line still being written is read once it is complete
+            self.assertEqual({'offset': 4, 'nextOffset': 8, 'lines': ['two']},
+                             controller.get_task_logs(service_context, 'job', controller._task_id_of(command), 4, 10))
+
     def test_submit_request(self):
         # copying files as they are changed during processing
         if not os.path.exists('./test_data/test_scripts_2'):
@@ -39,7 +114,7 @@ class ControllerTest(unittest.TestCase):
         with open("./test_data/example_request_parameters_2.json") as f:
             json_text = f.read()
             parameters = json.loads(json_text)
-            service_context = context.ServiceContext()
+            service_context = context.ServiceContext(job_store=':memory:', input_catalog=':memory:')
             working_dir = './test_data/multiply'
             if not os.path.exists(working_dir):
                 os.mkdir(working_dir)
@@ -57,6 +132,24 @@ class ControllerTest(unittest.TestCase):
                 shutil.rmtree(working_dir)
                 shutil.rmtree('./test_data/test_scripts_2')
 
+    def test_translate_array_step(self):
+        self.assertEqual('Inferring variables from S2 inference for tile 0, 1',
+                         controller._translate_step('infer_s2_kaska.py req.json 2018-05-01 2018-06-01 0 1 sdrs priors out'))
+        self.assertEqual('Inferring variables from S2 inference for 16 tiles',
+                         controller._translate_step('infer_s2_kaska.py req.json 2018-05-01 2018-06-01 array:16 sdrs '
+                                                    'priors out'))
+        self.assertEqual('Inferring variables from S1 inference for 4 tiles and time step from 2018-05-01 to '
+                         '2018-05-06',
+                         controller._translate_step('infer_s1_kaska.py req.json 2018-05-01 2018-05-06 array:4 stack '
+                                                    'priors out'))
+
+    def test_translate_fused_step(self):
+        self.assertEqual('Retrieving S2 data for time step from 2018-05-01 to 2018-05-05, then Preprocessing S2 Data '
+                         'for time step from 2018-05-01 to 2018-05-05',
+                         controller._translate_step('run_fused.py log/fused/0.json '
+                                                    'fused:get_data_for_s2_preprocessing.py+preprocess_s2.py '
+                                                    'req.json 2018-05-01 2018-05-05 emus dem sdrs'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from multiply_ui.server.events import JobEventHub
+
+
+class _ImmediateLoop:
+
+    @staticmethod
+    def add_callback(callback, *args):
+        callback(*args)
+
+
+class JobEventHubTest(unittest.TestCase):
+
+    def test_publish_to_subscribers(self):
+        hub = JobEventHub()
+        hub.set_io_loop(_ImmediateLoop())
+        all_events = []
+        job_1_events = []
+        hub.subscribe(all_events.append)
+        hub.subscribe(job_1_events.append, ['job_1'])
+
+        hub.publish('job_1', {'type': 'job', 'status': 'running'})
+        hub.publish('job_2', {'type': 'job', 'status': 'running'})
+
+        self.assertEqual(['job_1', 'job_2'], [event['jobId'] for event in all_events])
+        self.assertEqual([{'type': 'job', 'status': 'running', 'jobId': 'job_1'}], job_1_events)
+
+        hub.unsubscribe(job_1_events.append)
+        hub.publish('job_1', {'type': 'job', 'status': 'succeeded'})
+        self.assertEqual(1, len(job_1_events))
+        self.assertEqual(3, len(all_events))
+
+    def test_events_are_dropped_without_io_loop(self):
+        hub = JobEventHub()
+        events = []
+        hub.subscribe(events.append)
+        hub.publish('job_1', {'type': 'job', 'status': 'running'})
+        self.assertEqual([], events)
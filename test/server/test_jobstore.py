@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from multiply_ui.server.jobstore import JobStore
+
+
+def _job_dict(job_id: str, name: str = 'My Job') -> dict:
+    return {'id': job_id, 'name': name, 'status': 'new', 'progress': 0,
+            'tasks': [{'id': 'a1', 'name': 'Retrieving data', 'status': 'new', 'progress': 0, 'logs': []},
+                      {'id': 'b2', 'name': 'Inferring variables', 'status': 'new', 'progress': 0, 'logs': []}]}
+
+
+class JobStoreTest(unittest.TestCase):
+
+    def test_add_and_get_job(self):
+        store = JobStore()
+        store.add_job(_job_dict('My_Job'), workdir='/data/My_Job')
+        self.assertTrue(store.has_job('My_Job'))
+        self.assertFalse(store.has_job('My_Job_0'))
+        job = store.get_job('My_Job')
+        self.assertEqual('My Job', job['name'])
+        self.assertEqual('new', job['status'])
+        self.assertEqual('/data/My_Job', store.list_jobs()[0]['workdir'])
+        self.assertEqual('/data/My_Job', store.get_workdir('My_Job'))
+        self.assertIsNone(store.get_workdir('My_Job_0'))
+        self.assertEqual(['Retrieving data', 'Inferring variables'], [task['name'] for task in job['tasks']])
+        self.assertEqual(['a1', 'b2'], [task['id'] for task in job['tasks']])
+        self.assertIsNone(store.get_job('My_Job_0'))
+
+    def test_update_task(self):
+        store = JobStore()
+        store.add_job(_job_dict('My_Job'))
+        store.update_task('My_Job', 'a1', 'Retrieving data', 'running', 50)
+        store.update_task('My_Job', 'c3', 'Storing results', 'running', 10)
+        job = store.get_job('My_Job')
+        self.assertEqual(20, job['progress'])
+        self.assertEqual(['running', 'new', 'running'], [task['status'] for task in job['tasks']])
+        timings = store.get_task_timings('My_Job')
+        self.assertIsNotNone(timings[0]['started'])
+        self.assertIsNone(timings[0]['finished'])
+        store.update_task('My_Job', 'a1', 'Retrieving data', 'succeeded', 100)
+        timings = store.get_task_timings('My_Job')
+        self.assertIsNotNone(timings[0]['finished'])
+
+    def test_tasks_with_same_name(self):
+        store = JobStore()
+        store.add_job(_job_dict('My_Job'))
+        store.update_task('My_Job', 'c3', 'Conduct post-processing', 'succeeded', 100)
+        store.update_task('My_Job', 'd4', 'Conduct post-processing', 'running', 20)
+        job = store.get_job('My_Job')
+        self.assertEqual(['new', 'new', 'succeeded', 'running'], [task['status'] for task in job['tasks']])
+
+    def test_migrate_tasks_without_ids(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'jobs.sqlite')
+            connection = sqlite3.connect(path)
+            connection.executescript("""
+                CREATE TABLE jobs (id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT NOT NULL,
+                                   progress INTEGER NOT NULL DEFAULT 0, workdir TEXT, request TEXT,
+                                   submitted REAL NOT NULL, started REAL, finished REAL);
+                CREATE TABLE tasks (job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE, name TEXT NOT NULL,
+                                    position INTEGER NOT NULL, status TEXT NOT NULL,
+                                    progress INTEGER NOT NULL DEFAULT 0, started REAL, finished REAL,
+                                    PRIMARY KEY (job_id, name));
+                INSERT INTO jobs (id, name, status, submitted) VALUES ('My_Job', 'My Job', 'succeeded', 0);
+                INSERT INTO tasks (job_id, name, position, status, progress)
+                VALUES ('My_Job', 'Retrieving data', 0, 'succeeded', 100);
+            """)
+            connection.close()
+            store = JobStore(path)
+            job = store.get_job('My_Job')
+            self.assertEqual([('Retrieving data', 'Retrieving data')],
+                             [(task['id'], task['name']) for task in job['tasks']])
+            store.close()
+
+    def test_list_jobs(self):
+        store = JobStore()
+        store.add_job(_job_dict('My_Job'))
+        store.add_job(_job_dict('My_Job_0'))
+        store.add_job(_job_dict('Other_Job', name='Other Job'))
+        store.update_job_status('My_Job_0', 'succeeded')
+        self.assertEqual(3, len(store.list_jobs()))
+        self.assertEqual(['My_Job_0'], [job['id'] for job in store.list_jobs(status='succeeded')])
+        self.assertEqual(['Other_Job'], [job['id'] for job in store.list_jobs(name='Other Job')])
+        self.assertEqual(1, len(store.list_jobs(limit=1)))
+
+    def test_mark_interrupted_after_restart(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'jobs.sqlite')
+            store = JobStore(path)
+            store.add_job(_job_dict('My_Job'))
+            store.add_job(_job_dict('My_Job_0'))
+            store.update_job_status('My_Job', 'running')
+            store.update_task('My_Job', 'a1', 'Retrieving data', 'running', 50)
+            store.update_job_status('My_Job_0', 'succeeded')
+            store.close()
+
+            store = JobStore(path)
+            self.assertEqual(['My_Job'], store.mark_interrupted())
+            job = store.get_job('My_Job')
+            self.assertEqual('failed', job['status'])
+            self.assertEqual(['failed', 'new'], [task['status'] for task in job['tasks']])
+            self.assertEqual('succeeded', store.get_job('My_Job_0')['status'])
+            store.close()
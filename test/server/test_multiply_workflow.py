@@ -0,0 +1,243 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from multiply_ui.server.resources.workflows.multiply_workflow import MultiplyMonitor
+
+STEP_TYPES = [('produce.py', 2), ('consume.py', 2)]
+
+
+class _Monitor(MultiplyMonitor):
+    """
+    A monitor whose steps write their outputs and exit with the code given by *exit_code* instead of running scripts.
+    The commands of the processes started are listed in *started*, the exit codes of the steps in *codes*.
+    """
+
+    def __init__(self, temp_dir, exit_code=lambda command: 0, types=STEP_TYPES, cacheable=None, **parameters):
+        os.makedirs(os.path.join(temp_dir, 'log'), exist_ok=True)
+        MultiplyMonitor.__init__(self, dict(requestName=os.path.join(temp_dir, 'request'),
+                                            log_dir=os.path.join(temp_dir, 'log'), data_root=temp_dir, **parameters),
+                                 types, cacheable=cacheable)
+        self.exit_code = exit_code
+        self.started = []
+        self.codes = {}
+        # steps do not start before the gate is open
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _start_step_process(self, command, host, wd):
+        self.gate.wait()
+        self.started.append(command)
+        code = self.exit_code(command)
+        if code == 0 and command in self._step_args:
+            for output in self._step_args[command][2]:
+                _write(os.path.join(output, 'out'), command)
+        return subprocess.Popen([sys.executable, '-c', f'import sys; sys.exit({code})'], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT), None
+
+    def _run_step_processes(self, task_id, host, command, output_paths, log_prefix, async_):
+        code = MultiplyMonitor._run_step_processes(self, task_id, host, command, output_paths, log_prefix, async_)
+        self.codes[command] = code
+        return code
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _add_producer_and_consumer(monitor, temp_dir):
+    monitor.execute('produce.py', [], [f'{temp_dir}/a'], parameters=['1'])
+    monitor.execute('consume.py', [f'{temp_dir}/a'], [f'{temp_dir}/b'], parameters=['1'])
+    return (monitor._command_of('produce.py', [], [f'{temp_dir}/a'], ['1']),
+            monitor._command_of('consume.py', [f'{temp_dir}/a'], [f'{temp_dir}/b'], ['1']))
+
+
+def _write_scripts(temp_dir, content='pass'):
+    script_dir = os.path.join(temp_dir, 'scripts')
+    for step_type, _ in STEP_TYPES:
+        _write(os.path.join(script_dir, step_type), content)
+        os.chmod(os.path.join(script_dir, step_type), 0o755)
+    return script_dir
+
+
+class MultiplyMonitorTest(unittest.TestCase):
+
+    def test_resumed_producer_releases_its_consumer(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir, exit_code=lambda command: 1 if command.startswith('consume.py') else 0)
+            produce, consume = _add_producer_and_consumer(monitor, temp_dir)
+            self.assertEqual(1, monitor.run())
+            self.assertEqual([produce, consume], monitor.started)
+
+            monitor = _Monitor(temp_dir, resume=True)
+            _add_producer_and_consumer(monitor, temp_dir)
+            self.assertEqual(0, monitor.run())
+            self.assertEqual([consume], monitor.started)
+            self.assertEqual(100, monitor.get_progress(produce))
+
+            # the consumer of changed outputs is run again as well
+            _write(f'{temp_dir}/a/out', 'changed')
+            monitor = _Monitor(temp_dir, resume=True)
+            _add_producer_and_consumer(monitor, temp_dir)
+            self.assertEqual(0, monitor.run())
+            self.assertEqual([produce, consume], monitor.started)
+            with open(os.path.join(temp_dir, 'request.report')) as report:
+                self.assertEqual({produce, consume}, set(line.rstrip('\n') for line in report))
+
+    def test_consumer_is_parked_until_producer_is_done(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir)
+            monitor.gate.clear()
+            produce, consume = _add_producer_and_consumer(monitor, temp_dir)
+            # only the producer has been handed to the monitor's backlog
+            self.assertEqual([consume], list(monitor._parked))
+            self.assertIn(('consume.py', ['1'], [f'{temp_dir}/a'], [f'{temp_dir}/b']), monitor.get_backlog())
+            monitor.gate.set()
+            self.assertEqual(0, monitor.run())
+            self.assertEqual([produce, consume], monitor.started)
+            self.assertEqual({}, monitor._parked)
+            self.assertEqual([], monitor.get_backlog())
+
+    def test_array_step_runs_its_members(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir)
+            monitor.execute_array('produce.py', [], [f'{temp_dir}/a'], ['1'], [['0'], ['1'], ['2']])
+            self.assertEqual(0, monitor.run())
+            self.assertCountEqual([monitor._command_of('produce.py', [], [f'{temp_dir}/a'], ['1', member])
+                                   for member in ['0', '1', '2']], monitor.started)
+            self.assertEqual(100, monitor.get_progress(
+                monitor._command_of('produce.py', [], [f'{temp_dir}/a'], ['1', 'array:3'])))
+
+    def test_array_step_stops_at_first_failed_member(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            members = [f'produce.py 1 {member}  {temp_dir}/a' for member in range(4)]
+            # members run one after the other
+            monitor = _Monitor(temp_dir, exit_code=lambda command: {members[1]: 3, members[2]: 4}.get(command, 0),
+                               types=[('produce.py', 1)])
+            monitor.execute_array('produce.py', [], [f'{temp_dir}/a'], ['1'], [['0'], ['1'], ['2'], ['3']])
+            self.assertEqual(1, monitor.run())
+            self.assertEqual(members[:2], monitor.started)
+            # the code of the first failed member
+            self.assertEqual({monitor._command_of('produce.py', [], [f'{temp_dir}/a'], ['1', 'array:4']): 3},
+                             monitor.codes)
+
+    def test_chain_of_deferred_steps_is_fused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir, fuse_steps=True)
+            monitor.execute('produce.py', [temp_dir], [f'{temp_dir}/a'], parameters=['1'])
+            monitor.execute('consume.py', [f'{temp_dir}/a'], [f'{temp_dir}/b', f'{temp_dir}/c'], parameters=['1'])
+            self.assertEqual([], monitor.started)
+            self.assertEqual(0, monitor.run())
+            chain_file = os.path.join(os.path.abspath(os.path.join(temp_dir, 'log')), 'fused', '0.json')
+            # the fused step reads the inputs of the chain and writes the outputs of all of its members
+            self.assertEqual([monitor._command_of('run_fused.py', [temp_dir],
+                                                  [f'{temp_dir}/a', f'{temp_dir}/b', f'{temp_dir}/c'],
+                                                  [chain_file, 'fused:produce.py+consume.py', '1'])],
+                             monitor.started)
+            with open(chain_file) as f:
+                self.assertEqual([['produce.py', '1', temp_dir, f'{temp_dir}/a'],
+                                  ['consume.py', '1', f'{temp_dir}/a', f'{temp_dir}/b', f'{temp_dir}/c']],
+                                 [step['argv'] for step in json.load(f)['steps']])
+
+    def test_cacheable_steps_are_not_fused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir, fuse_steps=True, cacheable={'produce.py': []},
+                               step_cache={'dir': os.path.join(temp_dir, 'cache'), 'max_size': 1024 ** 2})
+            produce, consume = _add_producer_and_consumer(monitor, temp_dir)
+            self.assertEqual(0, monitor.run())
+            self.assertEqual([produce, consume], monitor.started)
+
+    def test_array_steps_are_not_fused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir, fuse_steps=True)
+            monitor.execute_array('produce.py', [], [f'{temp_dir}/a'], ['1'], [['0']])
+            monitor.execute('consume.py', [f'{temp_dir}/a'], [f'{temp_dir}/b'], parameters=['1'])
+            self.assertEqual(0, monitor.run())
+            self.assertEqual([monitor._command_of('produce.py', [], [f'{temp_dir}/a'], ['1', '0']),
+                              monitor._command_of('consume.py', [f'{temp_dir}/a'], [f'{temp_dir}/b'], ['1'])],
+                             monitor.started)
+
+    def test_cached_steps_are_restored(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            step_cache = {'dir': os.path.join(temp_dir, 'cache'), 'max_size': 1024 ** 2}
+            cacheable = {'produce.py': [], 'consume.py': []}
+            script_dir = _write_scripts(temp_dir)
+            with mock.patch.dict(os.environ, {'PATH': script_dir + os.pathsep + os.environ['PATH']}):
+                monitor = _Monitor(os.path.join(temp_dir, 'job1'), cacheable=cacheable, step_cache=step_cache)
+                produce, consume = _add_producer_and_consumer(monitor, os.path.join(temp_dir, 'job1'))
+                self.assertEqual(0, monitor.run())
+                self.assertEqual([produce, consume], monitor.started)
+                cache_key = monitor._cache_key_of(consume)
+
+                # keys do not depend on the directory of the job
+                monitor = _Monitor(os.path.join(temp_dir, 'job2'), cacheable=cacheable, step_cache=step_cache)
+                produce, consume = _add_producer_and_consumer(monitor, os.path.join(temp_dir, 'job2'))
+                self.assertEqual(0, monitor.run())
+                self.assertEqual([], monitor.started)
+                self.assertEqual(cache_key, monitor._cache_key_of(consume))
+                with open(os.path.join(temp_dir, 'job2', 'b', 'out')) as f:
+                    self.assertEqual(consume.replace('job2', 'job1'), f.read())
+
+                # the key of a step depends on the keys of the steps producing its inputs
+                _write_scripts(temp_dir, 'print("changed")')
+                monitor = _Monitor(os.path.join(temp_dir, 'job3'), cacheable=cacheable, step_cache=step_cache)
+                produce, consume = _add_producer_and_consumer(monitor, os.path.join(temp_dir, 'job3'))
+                self.assertEqual(0, monitor.run())
+                self.assertEqual([produce, consume], monitor.started)
+                self.assertNotEqual(cache_key, monitor._cache_key_of(consume))
+
+    def test_steps_reading_outputs_of_uncached_steps_are_not_cached(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            step_cache = {'dir': os.path.join(temp_dir, 'cache'), 'max_size': 1024 ** 2}
+            script_dir = _write_scripts(temp_dir)
+            with mock.patch.dict(os.environ, {'PATH': script_dir + os.pathsep + os.environ['PATH']}):
+                for job in ['job1', 'job2']:
+                    monitor = _Monitor(os.path.join(temp_dir, job), cacheable={'consume.py': []},
+                                       step_cache=step_cache)
+                    produce, consume = _add_producer_and_consumer(monitor, os.path.join(temp_dir, job))
+                    self.assertEqual(0, monitor.run())
+                    self.assertEqual([produce, consume], monitor.started)
+                    self.assertIsNone(monitor._cache_key_of(consume))
+
+    def test_repeated_step_is_left_out(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir)
+            produce, consume = _add_producer_and_consumer(monitor, temp_dir)
+            monitor.execute('produce.py', [], [f'{temp_dir}/a'], parameters=['1'])
+            self.assertEqual(0, monitor.run())
+            # the consumer has waited for the step added first
+            self.assertEqual([produce, consume], monitor.started)
+
+    def test_repeated_step_reading_other_inputs_is_added(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir)
+            produce, consume = _add_producer_and_consumer(monitor, temp_dir)
+            monitor.execute('produce.py', [], [f'{temp_dir}/c'], parameters=['2'])
+            monitor.execute('produce.py', [f'{temp_dir}/c'], [f'{temp_dir}/a'], parameters=['1'])
+            self.assertEqual(0, monitor.run())
+            self.assertCountEqual([produce, consume, monitor._command_of('produce.py', [], [f'{temp_dir}/c'], ['2']),
+                                   monitor._command_of('produce.py', [f'{temp_dir}/c'], [f'{temp_dir}/a'], ['1'])],
+                                  monitor.started)
+
+    def test_repeated_step_is_left_out_of_fused_steps(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = _Monitor(temp_dir, fuse_steps=True)
+            _add_producer_and_consumer(monitor, temp_dir)
+            monitor.execute('produce.py', [], [f'{temp_dir}/a'], parameters=['1'])
+            self.assertEqual(0, monitor.run())
+            self.assertEqual(1, len(monitor.started))
+            self.assertTrue(monitor.started[0].startswith('run_fused.py '))
+            with open(os.path.join(temp_dir, 'log', 'fused', '0.json')) as chain_file:
+                self.assertEqual(['produce.py', 'consume.py'],
+                                 [step['argv'][0] for step in json.load(chain_file)['steps']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from multiply_ui.server.resources.workflows.process_supervisor import ProcessSupervisor
+
+
+def _start(script):
+    return subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+class ProcessSupervisorTest(unittest.TestCase):
+
+    def test_lines_and_exit_codes(self):
+        supervisor = ProcessSupervisor(flush_interval=0.1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            lines = {0: [], 1: []}
+            futures = []
+            for i in range(2):
+                process = _start(f'import sys\nfor j in range(3): print(f"{i}-{{j}}")\nsys.exit({i})')
+                futures.append(supervisor.supervise(process, os.path.join(temp_dir, f'{i}.out'),
+                                                    lambda line, i=i: lines[i].append(line)))
+            results = [future.result(10) for future in futures]
+            self.assertEqual([0, 1], [result[0] for result in results])
+            self.assertEqual('1-2\n', results[1][2])
+            self.assertEqual(['0-0\n', '0-1\n', '0-2\n'], lines[0])
+            with open(os.path.join(temp_dir, '1.out')) as trace:
+                self.assertEqual('1-0\n1-1\n1-2\n', trace.read())
+
+    def test_traced_text_and_incomplete_last_line(self):
+        supervisor = ProcessSupervisor(flush_interval=0.1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            trace_path = os.path.join(temp_dir, 'step.out')
+            with open(trace_path, 'w') as trace:
+                trace.write('before\n')
+            process = _start('import sys\nprint("a")\nsys.stdout.write("b")')
+            code, usage, last_line = supervisor.supervise(process, trace_path, lambda line: f'[3] {line}',
+                                                          append=True).result(10)
+            self.assertEqual(0, code)
+            self.assertEqual(0, process.returncode)
+            self.assertGreater(usage.max_rss, 0)
+            self.assertGreater(usage.wall_time, 0)
+            self.assertGreaterEqual(usage.user_time + usage.system_time, 0)
+            if os.path.exists('/proc/self/io'):
+                self.assertIsNotNone(usage.write_bytes)
+            self.assertEqual('b', last_line)
+            with open(trace_path) as trace:
+                self.assertEqual('before\n[3] a\n[3] b', trace.read())
+
+    def test_progress_channel(self):
+        supervisor = ProcessSupervisor(flush_interval=0.1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            progress_read, progress_write = os.pipe()
+            script = f'import os\nf = os.fdopen({progress_write}, "w")\n' \
+                     'f.write(\'{"progress": 10, "phase": "a"}\\n\')\nf.flush()\nprint("x")\n' \
+                     'f.write(\'{"progress": 50}\\nnot json\\n{"items_done": 3}\')\nf.close()'
+            process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, pass_fds=(progress_write,))
+            os.close(progress_write)
+            messages = []
+            code, _, _ = supervisor.supervise(process, os.path.join(temp_dir, 'step.out'), lambda line: None,
+                                              progress_fd=progress_read, on_progress=messages.append).result(10)
+            self.assertEqual(0, code)
+            self.assertEqual([{'progress': 10, 'phase': 'a'}, {'progress': 50}], messages)
+
+    def test_failure_of_one_process_does_not_stop_supervision(self):
+        supervisor = ProcessSupervisor(flush_interval=0.1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            failing_process = _start('import time\ntime.sleep(30)')
+            register = supervisor._register
+
+            def _register(supervised):
+                if supervised.process is failing_process:
+                    raise KeyError('fd already registered')
+                register(supervised)
+
+            supervisor._register = _register
+            failing_future = supervisor.supervise(failing_process, os.path.join(temp_dir, '0.out'), lambda line: None)
+            with self.assertRaises(KeyError):
+                failing_future.result(10)
+            self.assertEqual(-9, failing_process.wait(10))
+            process = _start('print("a")')
+            self.assertEqual(0, supervisor.supervise(process, os.path.join(temp_dir, '1.out'),
+                                                     lambda line: None).result(10)[0])
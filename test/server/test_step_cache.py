@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from multiply_ui.server.resources.workflows.step_cache import StepCache
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class StepCacheTest(unittest.TestCase):
+
+    def test_restore_stored_outputs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = StepCache(os.path.join(temp_dir, 'cache'), max_size=1000)
+            job_1 = os.path.join(temp_dir, 'job_1')
+            _write(f'{job_1}/s2/2018-05-01/a.tif', 'abc')
+            _write(f'{job_1}/s2/2018-05-01/sub/b.tif', 'de')
+            os.symlink(f'{job_1}/s2/2018-05-01/a.tif', f'{job_1}/s2/2018-05-01/c.tif')
+            self.assertFalse(cache.restore('key', [f'{job_1}/s2/2018-05-01']))
+            cache.store('key', [f'{job_1}/s2/2018-05-01', f'{job_1}/missing'])
+            self.assertEqual(5, cache.get_size())
+            job_2 = os.path.join(temp_dir, 'job_2')
+            self.assertTrue(cache.restore('key', [f'{job_2}/s2/2018-05-01', f'{job_2}/missing']))
+            with open(f'{job_2}/s2/2018-05-01/sub/b.tif') as f:
+                self.assertEqual('de', f.read())
+            with open(f'{job_2}/s2/2018-05-01/c.tif') as f:
+                self.assertEqual('abc', f.read())
+            self.assertFalse(os.path.exists(f'{job_2}/missing'))
+            cache.close()
+
+    def test_symbolic_links_are_restored_as_links(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = StepCache(os.path.join(temp_dir, 'cache'), max_size=1000)
+            _write(f'{temp_dir}/store/granule/MTD_MSIL1C.xml', 'mtd')
+            _write(f'{temp_dir}/store/granule/B01.jp2', 'b01')
+            s2_dir = f'{temp_dir}/job_1/s2'
+            os.makedirs(s2_dir)
+            os.symlink(f'{temp_dir}/store/granule/MTD_MSIL1C.xml', f'{s2_dir}/MTD_MSIL1C.xml')
+            os.symlink(f'{temp_dir}/store/granule', f'{s2_dir}/granule')
+            cache.store('key', [s2_dir])
+            self.assertEqual(0, cache.get_size())
+            restored_dir = f'{temp_dir}/job_2/s2'
+            self.assertTrue(cache.restore('key', [restored_dir]))
+            self.assertTrue(os.path.islink(f'{restored_dir}/MTD_MSIL1C.xml'))
+            self.assertEqual(f'{temp_dir}/store/granule/MTD_MSIL1C.xml', os.readlink(f'{restored_dir}/MTD_MSIL1C.xml'))
+            self.assertTrue(os.path.islink(f'{restored_dir}/granule'))
+            self.assertEqual(1, os.stat(f'{temp_dir}/store/granule/B01.jp2').st_nlink)
+            # entries linking to files that are gone are not restored
+            os.remove(f'{temp_dir}/store/granule/MTD_MSIL1C.xml')
+            self.assertFalse(cache.restore('key', [f'{temp_dir}/job_3/s2']))
+            cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        now = [0]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = StepCache(os.path.join(temp_dir, 'cache'), max_size=10, clock=lambda: now[0])
+            for key in ['a', 'b', 'c']:
+                now[0] += 1
+                _write(f'{temp_dir}/{key}.out', '1234')
+                cache.store(key, [f'{temp_dir}/{key}.out'])
+                if key == 'b':
+                    now[0] += 1
+                    self.assertTrue(cache.restore('a', [f'{temp_dir}/restored.out']))
+            self.assertEqual(8, cache.get_size())
+            self.assertTrue(cache.restore('a', [f'{temp_dir}/restored.out']))
+            self.assertFalse(cache.restore('b', [f'{temp_dir}/restored.out']))
+            self.assertTrue(cache.restore('c', [f'{temp_dir}/restored.out']))
+            cache.close()
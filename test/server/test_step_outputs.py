@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from multiply_ui.server.resources.workflows.step_outputs import get_resumable_steps, StepOutputManifest
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class StepOutputsTest(unittest.TestCase):
+
+    def test_resumable_steps(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = StepOutputManifest(os.path.join(temp_dir, 'step_outputs.jsonl'))
+            steps = [('get_data 1', [], [f'{temp_dir}/s2/1']),
+                     ('preprocess 1', [f'{temp_dir}/s2/1'], [f'{temp_dir}/sdrs/1']),
+                     ('get_data 2', [], [f'{temp_dir}/s2/2']),
+                     ('preprocess 2', [f'{temp_dir}/s2/2'], [f'{temp_dir}/sdrs/2']),
+                     ('infer', [f'{temp_dir}/sdrs/1', f'{temp_dir}/sdrs/2'], [f'{temp_dir}/state'])]
+            for command, inputs, outputs in steps:
+                for output in outputs:
+                    _write(f'{output}/out.tif', command)
+                manifest.record(command, inputs, outputs)
+            report_path = os.path.join(temp_dir, 'request.report')
+            # the last step has not been reported
+            _write(report_path, ''.join(f'{command}\n' for command, _, _ in steps[:-1]))
+            self.assertEqual(['get_data 1', 'preprocess 1', 'get_data 2', 'preprocess 2'],
+                             get_resumable_steps(report_path, manifest))
+            _write(f'{temp_dir}/s2/2/out.tif', 'changed')
+            self.assertEqual(['get_data 1', 'preprocess 1'], get_resumable_steps(report_path, manifest))
+            manifest.rewrite(steps)
+            self.assertEqual(['get_data 1', 'preprocess 1', 'get_data 2', 'preprocess 2'],
+                             get_resumable_steps(report_path, manifest))
+            os.remove(f'{temp_dir}/sdrs/1/out.tif')
+            self.assertEqual(['get_data 1', 'get_data 2', 'preprocess 2'], get_resumable_steps(report_path, manifest))
+
+    def test_no_previous_run(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = StepOutputManifest(os.path.join(temp_dir, 'step_outputs.jsonl'))
+            self.assertEqual([], get_resumable_steps(os.path.join(temp_dir, 'request.report'), manifest))
@@ -0,0 +1,26 @@
+import unittest
+
+from multiply_ui.server.resources.workflows.step_progress import StepProgress
+
+
+class StepProgressTest(unittest.TestCase):
+
+    def test_eta_from_items(self):
+        now = [100.0]
+        step_progress = StepProgress(clock=lambda: now[0])
+        step_progress.update({'phase': 'inference', 'items_done': 0, 'items_total': 10})
+        self.assertEqual({'phase': 'inference', 'itemsDone': 0, 'itemsTotal': 10}, step_progress.to_dict())
+        now[0] = 120.0
+        step_progress.update({'items_done': 4, 'progress': 40})
+        self.assertEqual(0.2, step_progress.get_items_per_second())
+        self.assertEqual(30.0, step_progress.get_eta())
+
+    def test_eta_from_progress(self):
+        now = [0.0]
+        step_progress = StepProgress(clock=lambda: now[0])
+        step_progress.update({'progress': 20})
+        self.assertIsNone(step_progress.get_eta())
+        now[0] = 10.0
+        step_progress.update({'progress': 60})
+        self.assertEqual(10.0, step_progress.get_eta())
+        self.assertNotIn('itemsPerSecond', step_progress.to_dict())
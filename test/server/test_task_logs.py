@@ -0,0 +1,25 @@
+import unittest
+
+from multiply_ui.server.resources.workflows.task_logs import TaskLogBuffer
+
+
+class TaskLogBufferTest(unittest.TestCase):
+
+    def test_only_last_lines_are_kept(self):
+        buffer = TaskLogBuffer(max_lines=3)
+        for i in range(5):
+            buffer.append(f'line {i}\n')
+        self.assertEqual(['line 2\n', 'line 3\n', 'line 4\n'], buffer.get_lines())
+        self.assertEqual(5, len(buffer))
+
+    def test_compress(self):
+        buffer = TaskLogBuffer(max_lines=3)
+        buffer.compress()
+        self.assertEqual([], buffer.get_lines())
+        for i in range(4):
+            buffer.append(f'line {i}\n')
+        buffer.compress()
+        self.assertEqual(['line 1\n', 'line 2\n', 'line 3\n'], buffer.get_lines())
+        buffer.append('line 4\n')
+        self.assertEqual(['line 2\n', 'line 3\n', 'line 4\n'], buffer.get_lines())
+        self.assertEqual(5, len(buffer))
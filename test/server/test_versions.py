@@ -0,0 +1,57 @@
+import unittest
+
+from multiply_ui.server.versions import JobVersions
+
+
+def _job_dict(first_task_progress: int = 0, second_task_logs=()) -> dict:
+    return {'id': 'My_Job', 'name': 'My Job', 'status': 'running', 'progress': first_task_progress // 2,
+            'tasks': [{'name': 'Retrieving data', 'status': 'running', 'progress': first_task_progress, 'logs': []},
+                      {'name': 'Inferring variables', 'status': 'new', 'progress': 0,
+                       'logs': list(second_task_logs)}]}
+
+
+class JobVersionsTest(unittest.TestCase):
+
+    def test_version_only_changes_with_state(self):
+        versions = JobVersions()
+        version = versions.update(_job_dict())
+        self.assertEqual(version, versions.update(_job_dict()))
+        self.assertLess(version, versions.update(_job_dict(first_task_progress=10)))
+
+    def test_delta(self):
+        versions = JobVersions()
+        version = versions.update(_job_dict())
+
+        job_dict = _job_dict()
+        versions.update(job_dict)
+        self.assertIsNone(versions.delta(job_dict, version))
+
+        job_dict = _job_dict(second_task_logs=['a log line'])
+        versions.update(job_dict)
+        delta = versions.delta(job_dict, version)
+        self.assertTrue(delta['delta'])
+        self.assertEqual(['Inferring variables'], [task['name'] for task in delta['tasks']])
+
+        job_dict = _job_dict(first_task_progress=50, second_task_logs=['a log line'])
+        versions.update(job_dict)
+        delta = versions.delta(job_dict, version)
+        self.assertEqual(['Retrieving data', 'Inferring variables'], [task['name'] for task in delta['tasks']])
+
+    def test_delta_of_tasks_with_same_name(self):
+        versions = JobVersions()
+        job_dict = _job_dict()
+        job_dict['tasks'] = [{'id': task_id, 'name': 'Conduct post-processing', 'status': 'new', 'progress': 0,
+                              'logs': []} for task_id in ['a1', 'b2']]
+        version = versions.update(job_dict)
+        job_dict['tasks'][1]['progress'] = 50
+        versions.update(job_dict)
+        delta = versions.delta(job_dict, version)
+        self.assertEqual(['b2'], [task['id'] for task in delta['tasks']])
+
+    def test_delta_for_unknown_version(self):
+        versions = JobVersions()
+        job_dict = _job_dict()
+        version = versions.update(job_dict)
+        delta = versions.delta(job_dict, version + 1)
+        self.assertNotIn('delta', delta)
+        self.assertEqual(2, len(delta['tasks']))
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from multiply_ui.server.resources.workflows.process_supervisor import ProcessSupervisor
+from multiply_ui.server.resources.workflows.warm_workers import WarmWorkerServer
+
+_SCRIPT = '''
+import json
+import os
+import sys
+with os.fdopen(int(os.environ['MULTIPLY_PROGRESS_FD']), 'w') as progress:
+    progress.write(json.dumps({'progress': 100}) + '\\n')
+print(os.getcwd())
+print(' '.join(sys.argv[1:]), 'json' in sys.modules)
+sys.exit(3)
+'''
+
+
+class WarmWorkerServerTest(unittest.TestCase):
+
+    def test_step_is_forked(self):
+        server = WarmWorkerServer(sys.executable, ['json'])
+        self.addCleanup(server.close)
+        supervisor = ProcessSupervisor(flush_interval=0.1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_dir = os.path.realpath(temp_dir)
+            script = os.path.join(temp_dir, 'step.py')
+            with open(script, 'w') as script_file:
+                script_file.write(_SCRIPT)
+            for _ in range(2):
+                progress_read, progress_write = os.pipe()
+                process = server.start([script, 'a', 'b'], temp_dir, os.environ, progress_fd=progress_write)
+                os.close(progress_write)
+                lines = []
+                messages = []
+                code, usage, _ = supervisor.supervise(process, os.path.join(temp_dir, 'step.out'), lines.append,
+                                                      progress_fd=progress_read,
+                                                      on_progress=messages.append).result(10)
+                self.assertEqual(3, code)
+                self.assertEqual([f'{temp_dir}\n', 'a b True\n'], lines)
+                self.assertEqual([{'progress': 100}], messages)
+                self.assertGreater(usage.max_rss, 0)
+
+    def test_close(self):
+        server = WarmWorkerServer(sys.executable, [])
+        self.addCleanup(server.close)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            script = os.path.join(temp_dir, 'step.py')
+            with open(script, 'w') as script_file:
+                script_file.write('print("done")\n')
+            server.start([script], temp_dir, os.environ).wait4()
+            fork_server = server._server
+            socket_dir = server._socket_dir
+            server.close()
+            self.assertIsNotNone(fork_server.poll())
+            self.assertFalse(os.path.exists(socket_dir))
+            # the server is started again by the next step
+            process = server.start([script], temp_dir, os.environ)
+            self.assertEqual(b'done\n', process.stdout.read())
+            self.assertEqual(0, process.wait4()[1])
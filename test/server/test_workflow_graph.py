@@ -0,0 +1,88 @@
+import unittest
+
+from multiply_ui.server.resources.workflows.workflow_graph import StepGraph
+
+
+class StepGraphTest(unittest.TestCase):
+
+    def test_consumers_independent_of_order(self):
+        graph = StepGraph()
+        graph.add_step('infer 1', 'infer.py', ['sdrs/1', 'state/0'], ['state/1'])
+        graph.add_step('preprocess 1', 'preprocess.py', ['s2/1'], ['sdrs/1'])
+        graph.add_step('get_data 1', 'get_data.py', [], ['s2/1'])
+        self.assertEqual({'preprocess 1'}, graph.get_consumers('get_data 1'))
+        self.assertEqual({'infer 1'}, graph.get_consumers('preprocess 1'))
+        self.assertEqual(set(), graph.get_consumers('infer 1'))
+        self.assertEqual(3, len(graph))
+
+    def test_critical_path_ranks(self):
+        graph = StepGraph()
+        state = 'state/0'
+        for i in range(1, 4):
+            graph.add_step(f'get_data {i}', 'get_data.py', [], [f's2/{i}'])
+            graph.add_step(f'preprocess {i}', 'preprocess.py', [f's2/{i}'], [f'sdrs/{i}'])
+            graph.add_step(f'infer {i}', 'infer.py', [f'sdrs/{i}', state], [f'state/{i}'])
+            state = f'state/{i}'
+        graph.add_step('post_process', 'post_process.py', ['s2/3'], ['indicators'])
+        ranks = graph.get_critical_path_ranks({'get_data.py': 10, 'preprocess.py': 100, 'infer.py': 1000})
+        self.assertEqual(1000, ranks['infer 3'])
+        self.assertEqual(3000, ranks['infer 1'])
+        self.assertEqual(3110, ranks['get_data 1'])
+        self.assertEqual(1110, ranks['get_data 3'])
+        self.assertEqual(60, ranks['post_process'])
+        self.assertGreater(ranks['get_data 2'], ranks['post_process'])
+
+    def test_cycles_do_not_hang(self):
+        graph = StepGraph()
+        graph.add_step('a', 'a.py', ['y'], ['x'])
+        graph.add_step('b', 'b.py', ['x'], ['y'])
+        ranks = graph.get_critical_path_ranks(default_duration=1)
+        self.assertEqual({'a', 'b'}, set(ranks.keys()))
+
+    def test_pending_counts(self):
+        graph = StepGraph()
+        self.assertEqual(0, graph.add_step('get_data', 'get_data.py', [], ['s2']))
+        self.assertEqual(0, graph.add_step('get_static', 'get_static.py', [], ['dem', 'emus']))
+        self.assertEqual(2, graph.add_step('preprocess', 'preprocess.py', ['s2', 'dem', 'emus'], ['sdrs']))
+        self.assertEqual(1, graph.add_step('infer', 'infer.py', ['sdrs'], ['state']))
+        self.assertEqual([], graph.mark_done('get_data'))
+        self.assertEqual(['preprocess'], graph.mark_done('get_static'))
+        self.assertEqual([], graph.mark_done('get_static'))
+        # steps added after their producers are done do not wait for them
+        self.assertEqual(0, graph.add_step('store', 'store.py', ['s2'], []))
+        self.assertEqual(['infer'], graph.mark_done('preprocess'))
+
+    def test_large_graph(self):
+        graph = StepGraph()
+        for i in range(20000):
+            graph.add_step(f'get_data {i}', 'get_data.py', [], [f's2/{i}'])
+            graph.add_step(f'infer {i}', 'infer.py', [f's2/{i}', 'state/0'], [f'out/{i}'])
+        ready = []
+        for i in range(20000):
+            ready.extend(graph.mark_done(f'get_data {i}'))
+        self.assertEqual(20000, len(ready))
+        self.assertEqual(40000, len(graph.get_critical_path_ranks()))
+
+    def test_linear_chains(self):
+        graph = StepGraph()
+        graph.add_step('get_static', 'get_static.py', [], ['dem'])
+        state = 'none'
+        for i in range(1, 3):
+            graph.add_step(f'get_data {i}', 'get_data.py', [], [f's2/{i}', f'provided/{i}'])
+            graph.add_step(f'preprocess {i}', 'preprocess.py', [f's2/{i}', 'dem', f'provided/{i}'], [f'sdrs/{i}'])
+            graph.add_step(f'put {i}', 'put.py', [f'sdrs/{i}', f'provided/{i}'], [])
+            graph.add_step(f'priors {i}', 'priors.py', [], [f'priors/{i}'])
+            graph.add_step(f'infer {i}', 'infer.py', [f'sdrs/{i}', f'priors/{i}', state], [f'state/{i}'])
+            state = f'state/{i}'
+        graph.add_step('combine', 'combine.py', ['state/1', 'state/2'], ['biophys'])
+        self.assertEqual([['get_data 1', 'preprocess 1'], ['get_data 2', 'preprocess 2']],
+                         graph.get_linear_chains())
+        self.assertEqual([], graph.get_linear_chains(lambda key: not key.startswith('preprocess')))
+
+    def test_linear_chains_of_sources(self):
+        graph = StepGraph()
+        graph.add_step('get_data', 'get_data.py', [], ['s2'])
+        graph.add_step('priors', 'priors.py', [], ['priors'])
+        graph.add_step('infer', 'infer.py', ['s2', 'priors'], ['state'])
+        graph.add_step('combine', 'combine.py', ['state'], ['biophys'])
+        self.assertEqual([['get_data', 'infer', 'combine']], graph.get_linear_chains())
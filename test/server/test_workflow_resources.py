@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from multiply_ui.server.resources.workflows.workflow_resources import derive_type_limits, ResourcePool, \
+    StepMemoryHistory
+
+
+class DeriveTypeLimitsTest(unittest.TestCase):
+
+    def test_limits_follow_cores_and_memory(self):
+        types = [('infer.py', 6), ('preprocess.py', 2), ('get_data.py', 2)]
+        profiles = {'infer.py': (1, 4), 'preprocess.py': (4, 2)}
+        self.assertEqual({'infer.py': 4, 'preprocess.py': 1, 'get_data.py': 2},
+                         derive_type_limits(types, profiles, 4, 16))
+        self.assertEqual({'infer.py': 24, 'preprocess.py': 24, 'get_data.py': 2},
+                         derive_type_limits(types, profiles, 96, 96))
+        self.assertEqual({'infer.py': 1, 'preprocess.py': 1, 'get_data.py': 1},
+                         derive_type_limits(types, profiles, 1, 2))
+
+    def test_unknown_memory(self):
+        self.assertEqual({'infer.py': 8}, derive_type_limits([('infer.py', 6)], {'infer.py': (1, 4)}, 8, None))
+
+
+class ResourcePoolTest(unittest.TestCase):
+
+    def test_type_limits(self):
+        pool = ResourcePool(max_concurrent_steps=4, type_limits={'infer.py': 1})
+        self.assertTrue(pool.acquire('infer.py'))
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire('infer.py')))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual([], acquired)
+        self.assertTrue(pool.acquire('preprocess.py'))
+        pool.release('infer.py')
+        thread.join(1)
+        self.assertEqual([True], acquired)
+        usage = pool.get_usage()
+        self.assertEqual(2, usage['running'])
+        self.assertEqual({'infer.py': 1, 'preprocess.py': 1}, usage['runningByType'])
+        self.assertEqual(0, usage['waiting'])
+
+    def test_total_limit(self):
+        pool = ResourcePool(max_concurrent_steps=2)
+        pool.acquire('a.py')
+        pool.acquire('b.py')
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire('c.py')))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual([], acquired)
+        pool.release('a.py')
+        thread.join(1)
+        self.assertEqual([True], acquired)
+
+    def test_priority(self):
+        pool = ResourcePool(max_concurrent_steps=1)
+        pool.acquire('a.py')
+        order = []
+
+        def _run(step_type, priority):
+            pool.acquire(step_type, priority=priority)
+            order.append(step_type)
+            pool.release(step_type)
+
+        threads = [threading.Thread(target=_run, args=('low.py', 1)), threading.Thread(target=_run, args=('high.py', 5))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        pool.release('a.py')
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual(['high.py', 'low.py'], order)
+
+    def test_default_type_limits_do_not_override(self):
+        pool = ResourcePool(max_concurrent_steps=4, type_limits={'infer.py': 1})
+        pool.configure(default_type_limits=[('infer.py', 6), ('stack.py', 1)])
+        pool.acquire('stack.py')
+        pool.acquire('infer.py')
+        self.assertFalse(pool._is_available('infer.py'))
+        self.assertFalse(pool._is_available('stack.py'))
+
+    def test_cancelled_waiter(self):
+        pool = ResourcePool(max_concurrent_steps=1)
+        pool.acquire('a.py')
+        cancelled = []
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire('b.py', lambda: len(cancelled) > 0)))
+        thread.start()
+        time.sleep(0.05)
+        cancelled.append(True)
+        pool.wake()
+        thread.join(1)
+        self.assertEqual([False], acquired)
+        self.assertEqual(0, pool.get_usage()['waiting'])
+
+    def test_memory_budget(self):
+        pool = ResourcePool(max_concurrent_steps=8, memory_budget=10)
+        pool.configure(memory_profiles={'infer.py': 4, 'preprocess.py': 12})
+        self.assertTrue(pool.acquire('infer.py'))
+        self.assertTrue(pool.acquire('infer.py'))
+        self.assertFalse(pool._is_available('infer.py'))
+        self.assertTrue(pool._is_available('get_data.py'))
+        pool.release('infer.py')
+        pool.release('infer.py')
+        self.assertEqual(0, pool.get_usage()['memoryInUse'])
+        # a step exceeding the whole budget runs alone
+        self.assertTrue(pool.acquire('preprocess.py'))
+        self.assertFalse(pool._is_available('get_data.py') and pool._is_available('infer.py'))
+
+    def test_learned_memory(self):
+        pool = ResourcePool(max_concurrent_steps=8, memory_budget=10)
+        pool.configure(memory_profiles={'infer.py': 4})
+        pool.record_peak_memory('infer.py', 2)
+        # peaks of processes reaped elsewhere are unknown
+        pool.record_peak_memory('infer.py', None)
+        self.assertEqual(2, pool.estimate_memory('infer.py'))
+        for _ in range(5):
+            pool.acquire('infer.py')
+        self.assertFalse(pool._is_available('infer.py'))
+
+
+class StepMemoryHistoryTest(unittest.TestCase):
+
+    def test_peaks_are_persisted(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'step_memory.json')
+            history = StepMemoryHistory(path, max_runs=2)
+            self.assertIsNone(history.get_peak('infer.py'))
+            history.record_peak('infer.py', 3)
+            history.record_peak('infer.py', 2)
+            history.record_peak('infer.py', 1)
+            self.assertEqual(2, history.get_peak('infer.py'))
+            self.assertEqual(2, StepMemoryHistory(path).get_peak('infer.py'))
@@ -53,4 +53,32 @@ class JobModelTest(unittest.TestCase):
                 task = job.tasks.get(task_name)
                 self.assertEqual(expected_states[index], task.status)
 
+    def test_merge(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', '..', 'test_data', 'example_job.json')) as fp:
+            json_text = fp.read()
+            parameters = json.loads(json_text)
+            job = Job(parameters)
+
+            merged = job.merge(dict(id=job.id, name=job.name, progress=20, status='running', version=12, delta=True,
+                                    tasks=[dict(name='Collecting Data from 2017-06-11 to 2017-06-20', progress=100,
+                                                status='succeeded', logs=[])]))
+
+            self.assertEqual(20, merged['progress'])
+            self.assertEqual(12, merged['version'])
+            self.assertNotIn('delta', merged)
+            self.assertEqual(9, len(merged['tasks']))
+            self.assertEqual('succeeded', merged['tasks'][2]['status'])
+            self.assertEqual(100, merged['tasks'][2]['progress'])
+            self.assertEqual('running', job.status)
+
+    def test_merge_tasks_with_same_name(self):
+        job = Job(dict(id='My_Job', name='My Job', progress=0, status='running',
+                       tasks=[dict(id='a1', name='Conduct post-processing', progress=0, status='new', logs=[]),
+                              dict(id='b2', name='Conduct post-processing', progress=0, status='new', logs=[])]))
+
+        merged = job.merge(dict(id=job.id, name=job.name, progress=50, status='running', version=12, delta=True,
+                                tasks=[dict(id='b2', name='Conduct post-processing', progress=100,
+                                            status='succeeded', logs=[])]))
 
+        self.assertEqual(['new', 'succeeded'], [task['status'] for task in merged['tasks']])
+        self.assertEqual(['a1', 'b2'], Job(merged).tasks.ids)